@@ -10,5 +10,145 @@ AST_READ = 8
 AST_RETURN = 9
 
 
+class Node(object):
+    """
+    Base class of the AST nodes.
+
+    Every kind of node is a small class with __slots__, so a node only
+    stores its fields and no per-instance dict.  Expression nodes have
+    a `type` field that is None after parsing and is filled in place by
+    typecheck().  Likewise, the nodes naming a variable (Id, Assign and
+    Read) have a `slot` field filled in by build_symtab().  Statement
+    nodes have a `line` field: the line of the source where they start
+    (None for the statements made up by the compiler).
+    """
+
+    __slots__ = ()
+    nodetype = None
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+            "%s=%r" % (f, getattr(self, f)) for f in self.__slots__))
+
+
+class Program(Node):
+    __slots__ = ("decls", "stmts")
+
+    def __init__(self, decls, stmts):
+        self.decls = decls
+        self.stmts = stmts
+
+
+class Decl(Node):
+    __slots__ = ("id", "type")
+    nodetype = AST_DECL
+
+    def __init__(self, id, type):
+        self.id = id
+        self.type = type
+
+
+class Assign(Node):
+    __slots__ = ("lhs", "rhs", "slot", "line")
+    nodetype = AST_ASSIGN
+
+    def __init__(self, lhs, rhs, slot=None, line=None):
+        self.lhs = lhs
+        self.rhs = rhs
+        self.slot = slot
+        self.line = line
+
+
+class Print(Node):
+    __slots__ = ("expr", "line")
+    nodetype = AST_PRINT
+
+    def __init__(self, expr, line=None):
+        self.expr = expr
+        self.line = line
+
+
+class Return(Node):
+    __slots__ = ("expr", "line")
+    nodetype = AST_RETURN
+
+    def __init__(self, expr, line=None):
+        self.expr = expr
+        self.line = line
+
+
+class Read(Node):
+    __slots__ = ("id", "slot", "line")
+    nodetype = AST_READ
+
+    def __init__(self, id, slot=None, line=None):
+        self.id = id
+        self.slot = slot
+        self.line = line
+
+
+class While(Node):
+    __slots__ = ("expr", "body", "line")
+    nodetype = AST_WHILE
+
+    def __init__(self, expr, body, line=None):
+        self.expr = expr
+        self.body = body
+        self.line = line
+
+
+class Int(Node):
+    __slots__ = ("value", "type")
+    nodetype = AST_INT
+
+    def __init__(self, value, type=None):
+        self.value = value
+        self.type = type
+
+
+class Float(Node):
+    __slots__ = ("value", "type")
+    nodetype = AST_FLOAT
+
+    def __init__(self, value, type=None):
+        self.value = value
+        self.type = type
+
+
+class Id(Node):
+    __slots__ = ("name", "type", "slot")
+    nodetype = AST_ID
+
+    def __init__(self, name, type=None, slot=None):
+        self.name = name
+        self.type = type
+        self.slot = slot
+
+
+class BinOp(Node):
+    __slots__ = ("op", "lhs", "rhs", "type")
+    nodetype = AST_BINOP
+
+    def __init__(self, op, lhs, rhs, type=None):
+        self.op = op
+        self.lhs = lhs
+        self.rhs = rhs
+        self.type = type
+
+
+NODE_CLASSES = {
+    AST_DECL: Decl,
+    AST_ASSIGN: Assign,
+    AST_PRINT: Print,
+    AST_INT: Int,
+    AST_FLOAT: Float,
+    AST_ID: Id,
+    AST_BINOP: BinOp,
+    AST_WHILE: While,
+    AST_READ: Read,
+    AST_RETURN: Return,
+}
+
+
 def astnode(nodetype, **args):
-    return dict(nodetype=nodetype, **args)
+    return NODE_CLASSES[nodetype](**args)
@@ -0,0 +1,459 @@
+import bisect
+import struct
+
+from tac_gen import BINOPS
+from optimize import wrap_int
+from regalloc import linear_scan
+from ssa import build_cfg, used_operands, defined_name
+from output import write_lines
+
+
+# x86-64 assembly (GNU as, AT&T syntax, System V ABI) from TAC.
+#
+# Every variable and temporary lives in a register when one is free:
+# ints in general-purpose registers, floats in SSE registers, handed
+# out by the linear scan of regalloc.py over the live ranges of the
+# names.  The others are spilled to a stack slot.  %eax, %ecx and %edx
+# (needed by idiv) and %xmm0 are kept as scratch registers.
+#
+# print and read call printf and scanf.  The callee-saved registers are
+# given out first, so ints survive the calls without any work; the
+# other registers that hold a live value are stored in a slot of their
+# own before a call and loaded back after it.  Floats are printed like
+# C does, as a double with "%f".
+#
+# A comparison whose only use is the exit test of a loop is fused with
+# it into a compare-and-branch: `t = i < n; ifz t goto L` becomes
+# `cmpl n, i; jge L`.
+
+CALLEE_SAVED = ("rbx", "r12", "r13", "r14", "r15", "rbp")
+CALLER_SAVED = ("rsi", "rdi", "r8", "r9", "r10", "r11")
+INT_REGISTERS = CALLEE_SAVED + CALLER_SAVED
+FLOAT_REGISTERS = tuple("xmm%d" % k for k in range(1, 16))
+
+# The 32-bit names of the int registers.
+DWORD = {
+    "rbx": "ebx", "rbp": "ebp", "rsi": "esi", "rdi": "edi",
+    "r8": "r8d", "r9": "r9d", "r10": "r10d", "r11": "r11d",
+    "r12": "r12d", "r13": "r13d", "r14": "r14d", "r15": "r15d",
+}
+
+INT_OPS = {"+": "addl", "-": "subl", "*": "imull"}
+FLOAT_OPS = {"+": "addss", "-": "subss", "*": "mulss", "/": "divss"}
+
+# The jump taken by `ifz (a op b)`, for ints and floats.  A comparison
+# with a NaN is false, and ucomiss sets CF and ZF for it, so jbe also
+# jumps then.
+INT_EXIT_JUMPS = {"<": "jge", ">": "jle"}
+INT_SETS = {"<": "setl", ">": "setg"}
+
+FORMATS = (
+    (".Lprint_int", "%d\\n"),
+    (".Lprint_float", "%f\\n"),
+    (".Lread_int", "%d"),
+    (".Lread_float", "%f"),
+)
+
+
+def read_operands(q):
+    """
+    Return the operands that q reads.  Unlike for the optimizations, a
+    read also reads its variable: scanf leaves it as it was when there
+    is no number to read.
+    """
+    if q.op == "read":
+        return (q.dst,)
+    return used_operands(q)
+
+
+def live_ranges(prog):
+    """
+    Input : a TAC program
+    Output: a dict mapping every name (variable or temporary) to its
+            live range, a [start, end] pair of positions
+
+    Quad i reads its operands at position 2i and writes its result at
+    2i + 1, so that a name whose last read is quad i can give its
+    register to the name that quad i sets.  The range of a name goes
+    from its first to its last position where it is live, found by
+    solving liveness on the control-flow graph: a name live around a
+    loop is live through all of it, and so is a variable read by a
+    loop before the loop sets it.  The range of a name read before it
+    is set starts at 0.
+    """
+    quads = prog.quads
+    blocks = build_cfg(quads)
+    bits = {}
+    names = []
+    use_bits = []
+    def_bits = []
+    for block in blocks:
+        used = defined = 0
+        for i in range(block.start, block.end):
+            q = quads[i]
+            for x in read_operands(q):
+                if isinstance(x, str):
+                    if x not in bits:
+                        bits[x] = 1 << len(names)
+                        names.append(x)
+                    if not defined & bits[x]:
+                        used |= bits[x]
+            name = defined_name(q)
+            if name is not None:
+                if name not in bits:
+                    bits[name] = 1 << len(names)
+                    names.append(name)
+                defined |= bits[name]
+        use_bits.append(used)
+        def_bits.append(defined)
+
+    live_in = list(use_bits)
+    live_out = [0] * len(blocks)
+    work = list(blocks)
+    pending = set(range(len(blocks)))
+    while work:
+        block = work.pop()
+        pending.discard(block.index)
+        out = 0
+        for succ in block.succs:
+            out |= live_in[succ.index]
+        live_out[block.index] = out
+        live = use_bits[block.index] | (out & ~def_bits[block.index])
+        if live != live_in[block.index]:
+            live_in[block.index] = live
+            for pred in block.preds:
+                if pred.index not in pending:
+                    pending.add(pred.index)
+                    work.append(pred)
+
+    ranges = {}
+
+    def extend(name, position):
+        r = ranges.get(name)
+        if r is None:
+            ranges[name] = [position, position]
+        elif position < r[0]:
+            r[0] = position
+        elif position > r[1]:
+            r[1] = position
+
+    for i, q in enumerate(quads):
+        for x in read_operands(q):
+            if isinstance(x, str):
+                extend(x, 2 * i)
+        name = defined_name(q)
+        if name is not None:
+            extend(name, 2 * i + 1)
+    for block in blocks:
+        start = 2 * block.start
+        end = max(start, 2 * block.end - 1)
+        for live, position in ((live_in[block.index], start), (live_out[block.index], end)):
+            while live:
+                bit = live & -live
+                extend(names[bit.bit_length() - 1], position)
+                live ^= bit
+    return ranges
+
+
+def float_bits(x):
+    """Return the bits of the C float x, as an unsigned int."""
+    return struct.unpack("<I", struct.pack("<f", x))[0]
+
+
+def write_asm(prog, out=None):
+    """
+    Write the x86-64 assembly of an optimized TAC program prog to the
+    output sink out (see output.write_lines).  Its `main` follows the
+    System V ABI and calls printf and scanf from the C library, so the
+    code is assembled and linked with the C compiler driver:
+
+        cc -x assembler prog.s -o prog
+    """
+    quads = prog.quads
+    types = prog.types
+    ranges = live_ranges(prog)
+    assignment = linear_scan(prog, ranges, {"int": INT_REGISTERS, "float": FLOAT_REGISTERS})
+
+    # Count the reads of every name, to find the comparisons used only
+    # by the jump after them.
+    reads = {}
+    for q in quads:
+        for x in read_operands(q):
+            if isinstance(x, str):
+                reads[x] = reads.get(x, 0) + 1
+
+    # The stack frame, above the pushed callee-saved registers: an
+    # 8-byte slot for scanf, then a 4-byte slot for every caller-saved
+    # register in use and for every spilled name.
+    used_registers = set(reg for reg in assignment.values() if reg is not None)
+    pushed = [reg for reg in CALLEE_SAVED if reg in used_registers]
+    slots = {}
+    offset = 8
+    for reg in CALLER_SAVED + FLOAT_REGISTERS:
+        if reg in used_registers:
+            slots[reg] = offset
+            offset += 4
+    for name in sorted(ranges):
+        if assignment.get(name) is None:
+            slots[name] = offset
+            offset += 4
+    # rsp is 16-byte aligned at every call.
+    frame = offset + -(8 + 8 * len(pushed) + offset) % 16
+
+    # The caller-saved registers to keep across every call: those of
+    # the names read before it and after it.
+    calls = [i for i, q in enumerate(quads) if q.op in ("print", "read")]
+    saves = dict((i, []) for i in calls)
+    for name, (start, end) in ranges.items():
+        reg = assignment.get(name)
+        if reg is None or reg in CALLEE_SAVED:
+            continue
+        # Calls at quads i with start <= 2i and 2i + 1 < end.
+        k = bisect.bisect_left(calls, (start + 1) // 2)
+        while k < len(calls) and 2 * calls[k] + 1 < end:
+            saves[calls[k]].append(reg)
+            k += 1
+
+    constants = {}
+
+    def location(x):
+        """Return the operand of a name or a constant."""
+        if isinstance(x, float):
+            bits = float_bits(x)
+            if bits not in constants:
+                constants[bits] = ".LC%d" % len(constants)
+            return "%s(%%rip)" % constants[bits]
+        if not isinstance(x, str):
+            return "$%d" % wrap_int(x)
+        reg = assignment.get(x)
+        if reg is None:
+            return "%d(%%rsp)" % slots[x]
+        if reg in DWORD:
+            return "%" + DWORD[reg]
+        return "%" + reg
+
+    def type_of(x):
+        if isinstance(x, str):
+            return types[x]
+        return "float" if isinstance(x, float) else "int"
+
+    def is_register(loc):
+        return loc.startswith("%")
+
+    def is_memory(loc):
+        return loc.endswith(")")
+
+    def move(dst, src, ty, lines):
+        """Append the moves of src to dst, two operands of type ty."""
+        if dst == src:
+            return
+        if ty == "int":
+            if is_memory(dst) and is_memory(src):
+                lines.append("movl %s, %%eax" % src)
+                src = "%eax"
+            lines.append("movl %s, %s" % (src, dst))
+        elif is_register(dst) and is_register(src):
+            lines.append("movaps %s, %s" % (src, dst))
+        elif is_memory(dst) and is_memory(src):
+            lines.append("movss %s, %%xmm0" % src)
+            lines.append("movss %%xmm0, %s" % dst)
+        else:
+            lines.append("movss %s, %s" % (src, dst))
+
+    def arithmetic(q, lines):
+        d, a, b = location(q.dst), location(q.arg1), location(q.arg2)
+        if types[q.dst] == "int":
+            if q.op == "/":
+                lines.append("movl %s, %%eax" % a)
+                lines.append("cltd")
+                if b.startswith("$"):
+                    lines.append("movl %s, %%ecx" % b)
+                    b = "%ecx"
+                lines.append("idivl %s" % b)
+                lines.append("movl %%eax, %s" % d)
+                return
+            mnemonic, scratch = INT_OPS[q.op], "%eax"
+        else:
+            mnemonic, scratch = FLOAT_OPS[q.op], "%xmm0"
+        ty = types[q.dst]
+        if is_register(d) and d != b:
+            move(d, a, ty, lines)
+            lines.append("%s %s, %s" % (mnemonic, b, d))
+        elif is_register(d) and q.op in ("+", "*"):
+            lines.append("%s %s, %s" % (mnemonic, a, d))
+        else:
+            if ty == "int":
+                lines.append("movl %s, %s" % (a, scratch))
+            else:
+                lines.append("movss %s, %s" % (a, scratch))
+            lines.append("%s %s, %s" % (mnemonic, b, scratch))
+            move(d, scratch, ty, lines)
+
+    def compare(q, lines):
+        """
+        Append the comparison of q's operands, and return how to read
+        the flags: q.op for ints, or "float" for floats, for which the
+        "above" condition holds when q is true.
+        """
+        a, b = location(q.arg1), location(q.arg2)
+        if type_of(q.arg1) == "int":
+            if a.startswith("$") or (is_memory(a) and is_memory(b)):
+                lines.append("movl %s, %%eax" % a)
+                a = "%eax"
+            lines.append("cmpl %s, %s" % (b, a))
+            return q.op
+        # a < b is b > a: ucomiss y, x sets "above" when x > y.
+        x, y = (b, a) if q.op == "<" else (a, b)
+        if not is_register(x):
+            lines.append("movss %s, %%xmm0" % x)
+            x = "%xmm0"
+        lines.append("ucomiss %s, %s" % (y, x))
+        return "float"
+
+    def call(i, function, lines):
+        for reg in saves[i]:
+            if reg in DWORD:
+                lines.append("movl %%%s, %d(%%rsp)" % (DWORD[reg], slots[reg]))
+            else:
+                lines.append("movss %%%s, %d(%%rsp)" % (reg, slots[reg]))
+        lines.extend(function)
+        for reg in saves[i]:
+            if reg in DWORD:
+                lines.append("movl %d(%%rsp), %%%s" % (slots[reg], DWORD[reg]))
+            else:
+                lines.append("movss %d(%%rsp), %%%s" % (slots[reg], reg))
+
+    def gen_body():
+        lines = []
+        skip = False
+        for i, q in enumerate(quads):
+            if skip:
+                skip = False
+                continue
+            op = q.op
+            if op in ("<", ">"):
+                following = quads[i + 1] if i + 1 < len(quads) else None
+                if following is not None and following.op == "ifz" \
+                        and following.arg1 == q.dst and reads.get(q.dst) == 1:
+                    kind = compare(q, lines)
+                    jump = "jbe" if kind == "float" else INT_EXIT_JUMPS[kind]
+                    lines.append("%s .L%s" % (jump, following.arg2))
+                    skip = True
+                    continue
+                kind = compare(q, lines)
+                lines.append("%s %%al" % ("seta" if kind == "float" else INT_SETS[kind]))
+                d = location(q.dst)
+                if types[q.dst] == "float":
+                    # Comparing floats gives 0.0 or 1.0.
+                    lines.append("movzbl %al, %eax")
+                    if is_register(d):
+                        lines.append("cvtsi2ss %%eax, %s" % d)
+                    else:
+                        lines.append("cvtsi2ss %eax, %xmm0")
+                        lines.append("movss %%xmm0, %s" % d)
+                elif is_register(d):
+                    lines.append("movzbl %%al, %s" % d)
+                else:
+                    lines.append("movzbl %al, %eax")
+                    lines.append("movl %%eax, %s" % d)
+            elif op in BINOPS:
+                arithmetic(q, lines)
+            elif op == "=":
+                a = location(q.arg1)
+                d = location(q.dst)
+                if isinstance(q.arg1, float) and is_memory(d):
+                    lines.append("movl $%d, %s" % (float_bits(q.arg1), d))
+                else:
+                    move(d, a, types[q.dst], lines)
+            elif op == "label":
+                lines.append(".L%s:" % q.dst)
+            elif op == "goto":
+                lines.append("jmp .L%s" % q.arg1)
+            elif op == "ifz":
+                a = location(q.arg1)
+                if a.startswith("$"):
+                    if q.arg1 == 0:
+                        lines.append("jmp .L%s" % q.arg2)
+                    continue
+                if is_register(a):
+                    lines.append("testl %s, %s" % (a, a))
+                else:
+                    lines.append("cmpl $0, %s" % a)
+                lines.append("je .L%s" % q.arg2)
+            elif op == "djnz":
+                lines.append("decl %s" % location(q.dst))
+                lines.append("jne .L%s" % q.arg1)
+            elif op == "print":
+                a = location(q.arg1)
+                if type_of(q.arg1) == "int":
+                    function = ["movl %s, %%esi" % a,
+                                "leaq .Lprint_int(%rip), %rdi",
+                                "xorl %eax, %eax"]
+                else:
+                    function = ["cvtss2sd %s, %%xmm0" % a,
+                                "leaq .Lprint_float(%rip), %rdi",
+                                "movl $1, %eax"]
+                call(i, function + ["call printf@PLT"], lines)
+            elif op == "read":
+                d = location(q.dst)
+                ty = types[q.dst]
+                fmt = ".Lread_int" if ty == "int" else ".Lread_float"
+                if is_register(d):
+                    # scanf leaves the variable as it was if it can't
+                    # read a number.
+                    move("0(%rsp)", d, ty, lines)
+                    function = ["leaq 0(%rsp), %rsi"]
+                else:
+                    function = ["leaq %s, %%rsi" % d]
+                function += ["leaq %s(%%rip), %%rdi" % fmt,
+                             "xorl %eax, %eax",
+                             "call scanf@PLT"]
+                call(i, function, lines)
+                if is_register(d):
+                    move(d, "0(%rsp)", ty, lines)
+            elif op == "return":
+                a = location(q.arg1)
+                if type_of(q.arg1) == "int":
+                    lines.append("movl %s, %%eax" % a)
+                else:
+                    lines.append("cvttss2si %s, %%eax" % a)
+                lines.append("jmp .Lreturn")
+        return lines
+
+    def gen_lines():
+        body = gen_body()
+        yield "\t.text"
+        yield "\t.globl main"
+        yield "\t.type main, @function"
+        yield "main:"
+        for reg in pushed:
+            yield "\tpushq %%%s" % reg
+        yield "\tsubq $%d, %%rsp" % frame
+        # Names read before they are set start at 0, like in the VM.
+        for name in sorted(name for name in ranges if ranges[name][0] == 0):
+            d = location(name)
+            if is_register(d) and types[name] == "float":
+                yield "\txorps %s, %s" % (d, d)
+            else:
+                yield "\tmovl $0, %s" % d
+        for line in body:
+            yield line if line.endswith(":") else "\t" + line
+        yield "\txorl %eax, %eax"
+        yield ".Lreturn:"
+        yield "\taddq $%d, %%rsp" % frame
+        for reg in reversed(pushed):
+            yield "\tpopq %%%s" % reg
+        yield "\tret"
+        yield "\t.size main, .-main"
+        yield "\t.section .rodata"
+        for label, fmt in FORMATS:
+            yield "%s:" % label
+            yield '\t.string "%s"' % fmt
+        if constants:
+            yield "\t.align 4"
+            for bits, label in sorted(constants.items(), key=lambda item: item[1]):
+                yield "%s:" % label
+                yield "\t.long %d" % bits
+        yield '\t.section .note.GNU-stack,"",@progbits'
+
+    write_lines(gen_lines(), out)
@@ -0,0 +1,168 @@
+import concurrent.futures
+import os
+import tempfile
+import time
+from cache import CompileCache
+from compiler import compile_source
+from error import CompileError
+
+
+SOURCE_SUFFIX = ".mini"
+OUTPUT_SUFFIXES = {"c": ".c", "tac": ".tac", "asm": ".s", "py": ".py"}
+
+
+class FileResult(object):
+    """
+    The outcome of compiling one file: `error` is None on success, or
+    the messages of the errors that stopped the compilation, one per
+    line.  `hits` and
+    `misses` are the lookups made in the compilation cache.
+    """
+
+    __slots__ = ("path", "output", "error", "seconds", "hits", "misses")
+
+    def __init__(self, path, output, error=None, seconds=0.0, hits=0, misses=0):
+        self.path = path
+        self.output = output
+        self.error = error
+        self.seconds = seconds
+        self.hits = hits
+        self.misses = misses
+
+
+def find_sources(paths, mode, output_dir=None):
+    """
+    Input : a list of files and directories, the output mode, and the
+            directory of the outputs (None to put every output next to
+            its source)
+    Output: a list of (source, output) path pairs
+
+    Directories are searched recursively for *.mini files, and their
+    layout is kept under output_dir.
+    """
+    suffix = OUTPUT_SUFFIXES[mode]
+    jobs = []
+
+    def add(path, relpath):
+        base = os.path.splitext(relpath)[0] + suffix
+        if output_dir is None:
+            out = os.path.join(os.path.dirname(path), os.path.basename(base))
+        else:
+            out = os.path.join(output_dir, base)
+        jobs.append((path, out))
+
+    for path in paths:
+        if not os.path.isdir(path):
+            add(path, os.path.basename(path))
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(SOURCE_SUFFIX):
+                    full = os.path.join(root, name)
+                    add(full, os.path.relpath(full, path))
+    return jobs
+
+
+def write_file(path, text):
+    """Write text to path atomically, creating its directory if needed."""
+    directory = os.path.dirname(path) or "."
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+# The compilation caches of this process, by directory and size: a
+# worker compiling many files keeps the size of the cache it scanned.
+_caches = {}
+
+
+def open_cache(cache_dir, cache_bytes=None):
+    """Return the CompileCache of this process for cache_dir."""
+    cache = _caches.get((cache_dir, cache_bytes))
+    if cache is None:
+        if cache_bytes is None:
+            cache = CompileCache(cache_dir)
+        else:
+            cache = CompileCache(cache_dir, cache_bytes)
+        _caches[cache_dir, cache_bytes] = cache
+    return cache
+
+
+def compile_file(path, output, mode, opt_level, cache_dir=None, cache_bytes=None):
+    """
+    Compile the file at path and write the result to output.  Never
+    raises: the errors in the program and any other exception are
+    returned in the FileResult.
+    """
+    start = time.perf_counter()
+    cache = None
+    result = FileResult(path, output)
+    try:
+        with open(path) as f:
+            src = f.read()
+        if cache_dir:
+            cache = open_cache(cache_dir, cache_bytes)
+            hits, misses = cache.hits, cache.misses
+        text, stats = compile_source(src, mode, opt_level, cache)
+        write_file(output, text)
+    except CompileError as e:
+        result.error = "\n".join("Error: " + msg for msg in e.diagnostics)
+    except Exception as e:
+        result.error = "%s: %s" % (type(e).__name__, e)
+    if cache is not None:
+        result.hits = cache.hits - hits
+        result.misses = cache.misses - misses
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def compile_batch(jobs, mode, opt_level, workers=None, cache_dir=None, cache_bytes=None):
+    """
+    Input : a list of (source, output) path pairs, the output mode and
+            optimization level, the number of worker processes (default:
+            the number of CPUs), and the compilation cache settings
+    Output: the list of the FileResults, in the order of the jobs
+
+    The files are compiled in parallel by a pool of processes.  A file
+    that fails to compile, or whose worker dies, only fails its own
+    FileResult.  With a single worker, the files are compiled in this
+    process.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(jobs) <= 1:
+        return [compile_file(path, out, mode, opt_level, cache_dir, cache_bytes)
+                for path, out in jobs]
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+        futures = [pool.submit(compile_file, path, out, mode, opt_level, cache_dir, cache_bytes)
+                   for path, out in jobs]
+        for (path, out), future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(FileResult(path, out, "%s: %s" % (type(e).__name__, e)))
+    return results
+
+
+def write_summary(results, seconds, workers, f):
+    """Write the time of every file and the totals of a batch to f."""
+    failed = 0
+    for r in results:
+        if r.error is None:
+            f.write("%8.3fs  %s -> %s\n" % (r.seconds, r.path, r.output))
+        else:
+            failed += 1
+            f.write("%8.3fs  %s: %s\n" % (r.seconds, r.path, r.error.replace("\n", "\n" + " " * 11)))
+    f.write("compiled %d of %d files in %.3fs (%.3fs in the workers, %d worker(s))\n" % (
+        len(results) - failed, len(results), seconds,
+        sum(r.seconds for r in results), workers))
+    return failed
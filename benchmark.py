@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from lexical_analyzer import lex
+from parser import parse
+from build_symbol_table import build_symtab
+from typecheck import typecheck
+from tac_gen import tac_gen
+from vm import compile_bytecode
+from compiler import front_end, back_end
+from instrument import Instrumentation
+from workload import generate
+
+
+def synthetic_program(copies):
+    """
+    Input : a number of copies
+    Output: the source of a mini program
+
+    Builds a large, valid mini program by repeating the body of
+    demos/fib.mini with fresh variable names, the way our
+    machine-generated programs look.
+    """
+    decls = []
+    stmts = []
+    for i in range(copies):
+        decls.append("var a%d: int;\nvar b%d: int;\nvar n%d: int;\nvar t%d: int;\n" % (i, i, i, i))
+        stmts.append(
+            "# copy %(i)d\n"
+            "a%(i)d = 0;\nb%(i)d = 1;\nn%(i)d = 10;\n"
+            "while n%(i)d do\n"
+            "  t%(i)d = a%(i)d;\n  a%(i)d = b%(i)d;\n  b%(i)d = b%(i)d + t%(i)d;\n  n%(i)d = n%(i)d - 1;\n"
+            "done\n"
+            "print a%(i)d;\n" % {"i": i}
+        )
+    return "".join(decls) + "".join(stmts)
+
+
+def best_of(fn, arg, repeat=5):
+    """Return the best wall time of `repeat` calls to fn(arg)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_lex(copies):
+    src = synthetic_program(copies)
+    ntoks = len(lex(src))
+    elapsed = best_of(lex, src)
+    print("lex: %8d lines %9d tokens %8.3fs %10.0f tokens/s %6.2f MB/s" % (
+        src.count("\n"), ntoks, elapsed, ntoks / elapsed, len(src) / elapsed / 1e6))
+
+
+def bench_parse(copies):
+    src = synthetic_program(copies)
+    toks = lex(src)
+    # parse() must not consume the caller's list, so every run can
+    # share the same tokens.
+    elapsed = best_of(parse, toks)
+    print("parse: %8d tokens %8.3fs %8.3f us/token" % (
+        len(toks), elapsed, elapsed / len(toks) * 1e6))
+
+
+def bench_memory(copies):
+    toks = lex(synthetic_program(copies))
+    tracemalloc.start()
+    ast = parse(toks)
+    ast_size = tracemalloc.get_traced_memory()[0]
+    typecheck(ast, build_symtab(ast))
+    typed_size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("memory: %8d tokens  AST %7.1f MB  typed AST %7.1f MB  peak %7.1f MB" % (
+        len(toks), ast_size / 1e6, typed_size / 1e6, peak / 1e6))
+
+
+def bench_deep(depth):
+    """
+    Time the traversals of one expression that is `depth` operators
+    deep, and of one that is `depth` operators long.  They are walked
+    with explicit stacks, so they must not hit the recursion limit.
+    """
+    for shape, src in (("deep", generate(2, 1, 0, 1, depth)), ("long", generate(2, 1, 0, depth, 1))):
+        toks = lex(src)
+        ast = parse(toks)
+        symtab = build_symtab(ast)
+        typecheck(ast, symtab)
+        times = [best_of(fn, arg) for fn, arg in (
+            (parse, toks),
+            (lambda ast: typecheck(ast, symtab), ast),
+            (lambda ast: tac_gen(ast, symtab), ast),
+            (lambda ast: compile_bytecode(ast, symtab), ast))]
+        print("%s expression: %7d operators  parse %.3fs  typecheck %.3fs  "
+              "tac_gen %.3fs  bytecode %.3fs" % tuple([shape, depth] + times))
+
+
+# The workloads of the phase suite, as arguments of workload.generate()
+# at scale 1.  Scaling multiplies the number of statements (and of
+# declarations), not the depths.
+WORKLOADS = {
+    "statements": dict(decls=100, stmts=500, loop_depth=1, expr_length=3, expr_depth=1),
+    "nested-loops": dict(decls=20, stmts=500, loop_depth=20, expr_length=2, expr_depth=1),
+    "long-expressions": dict(decls=20, stmts=25, loop_depth=1, expr_length=200, expr_depth=1),
+    "deep-expressions": dict(decls=20, stmts=50, loop_depth=1, expr_length=1, expr_depth=100),
+}
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+
+def workload_source(name, scale):
+    args = dict(WORKLOADS[name])
+    args["decls"] *= scale
+    args["stmts"] *= scale
+    return generate(**args)
+
+
+def time_phases(src, repeat=3):
+    """
+    Input : the source of a mini program, and a number of runs
+    Output: a dict mapping every phase, from lex to codegen and
+            write_tac, to its best CPU time over the runs
+
+    CPU time rather than wall time, so that the other processes of a
+    busy machine disturb the measurements less.
+    """
+    best = {}
+    for _ in range(repeat):
+        instr = Instrumentation()
+        entry = front_end(src, instr)
+        back_end(entry, "c", 2, instr)
+        back_end(entry, "tac", 2, instr)
+        for r in instr.records:
+            if r.name not in best or r.cpu < best[r.name]:
+                best[r.name] = r.cpu
+    return best
+
+
+def bench_phases(scale, repeat, slack):
+    """
+    Time every phase on every workload at scale and 4 * scale.  Return
+    the throughputs at 4 * scale in source lines per second, as
+    {workload: {phase: lines/s}}, leaving out the phases faster than
+    20ms, whose throughput is mostly noise.  Also return the list of
+    the phases that scale worse than linearly: their time grows more
+    than 4 * slack times from one scale to the other.  Phases that take
+    less than 5ms at the smaller scale are too noisy to be judged.
+    """
+    throughputs = {}
+    nonlinear = []
+    for name in sorted(WORKLOADS):
+        small = workload_source(name, scale)
+        large = workload_source(name, 4 * scale)
+        t_small = time_phases(small, repeat)
+        t_large = time_phases(large, repeat)
+        lines = large.count("\n")
+        throughputs[name] = {}
+        for phase, elapsed in sorted(t_large.items(), key=lambda x: -x[1]):
+            ratio = elapsed / max(t_small[phase], 1e-9)
+            throughput = lines / max(elapsed, 1e-9)
+            if elapsed > 0.02:
+                throughputs[name][phase] = throughput
+            flag = ""
+            if t_small[phase] > 0.005 and ratio > 4 * slack:
+                nonlinear.append((name, phase, ratio))
+                flag = "  NONLINEAR"
+            print("%-18s %-16s %8d lines %9.3fs %12.0f lines/s  x%.1f for 4x%s" % (
+                name, phase, lines, elapsed, throughput, ratio, flag))
+    return throughputs, nonlinear
+
+
+def compare_baseline(throughputs, baseline, tolerance):
+    """
+    Return the (workload, phase, throughput, baseline) of the phases
+    whose throughput fell under (1 - tolerance) times their baseline.
+    """
+    regressions = []
+    for name, phases in sorted(baseline.items()):
+        for phase, expected in sorted(phases.items()):
+            actual = throughputs.get(name, {}).get(phase)
+            if actual is not None and actual < expected * (1 - tolerance):
+                regressions.append((name, phase, actual, expected))
+    return regressions
+
+
+def run_suite(args):
+    throughputs, nonlinear = bench_phases(args.scale, args.repeat, args.slack)
+    failed = False
+    for name, phase, ratio in nonlinear:
+        print("nonlinear: %s on %s takes %.1fx longer on a 4x larger program" % (phase, name, ratio))
+        failed = True
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            rounded = dict((name, dict((phase, round(x)) for phase, x in phases.items()))
+                           for name, phases in throughputs.items())
+            json.dump(rounded, f, indent=2, sort_keys=True)
+            f.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name, phase, actual, expected in compare_baseline(throughputs, baseline, args.tolerance):
+            print("regression: %s on %s: %.0f lines/s, baseline %.0f lines/s" % (
+                phase, name, actual, expected))
+            failed = True
+    return failed
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Benchmark the compiler.")
+    argparser.add_argument(
+        "sizes", nargs="*", type=int,
+        help="numbers of copies of fib.mini for the lex, parse and memory "
+             "benchmarks (default: 1000 10000)")
+    argparser.add_argument(
+        "--suite", action="store_true",
+        help="instead, time every phase on the synthetic workloads, and fail "
+             "on nonlinear scaling or on regressions from the baseline")
+    argparser.add_argument(
+        "--scale", type=int, default=1, help="scale of the workloads (default: 1)")
+    argparser.add_argument(
+        "--repeat", type=int, default=3, help="runs per measurement (default: 3)")
+    argparser.add_argument(
+        "--slack", type=float, default=2.0,
+        help="how much worse than linear a phase may scale (default: 2.0)")
+    argparser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE,
+        help="throughputs to compare with (default: benchmark_baseline.json)")
+    argparser.add_argument(
+        "--tolerance", type=float, default=0.5,
+        help="fraction of the baseline throughput that may be lost (default: 0.5)")
+    argparser.add_argument(
+        "--save-baseline", metavar="PATH",
+        help="save the throughputs as the new baseline instead of comparing")
+    args = argparser.parse_args()
+
+    if args.suite:
+        sys.exit(1 if run_suite(args) else 0)
+
+    sizes = args.sizes or [1000, 10000]
+    for copies in sizes:
+        bench_lex(copies)
+    # Parse time per token should stay flat as the program grows.
+    for copies in sizes:
+        bench_parse(copies)
+    for copies in sizes:
+        bench_memory(copies)
+    for copies in sizes:
+        bench_deep(copies * 10)
+
+
+if __name__ == "__main__":
+    main()
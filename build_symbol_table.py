@@ -1,20 +1,116 @@
-from error import error
+from AST_NODES import *
+from error import Diagnostics, error
+
+
+# The type codes of the variables, indexing TYPE_NAMES.
+TYPE_INT = 0
+TYPE_FLOAT = 1
+TYPE_NAMES = ("int", "float")
+TYPE_CODES = {"int": TYPE_INT, "float": TYPE_FLOAT}
+
+
+class SymbolTable(dict):
+    """
+    A dictionary mapping variable names to types, which also numbers
+    the variables: the slot of a variable is its index in the order of
+    the declarations, and
+
+    - names : the name of the variable of every slot
+    - types : the type of the variable of every slot ("int" or "float")
+    - codes : the type code of the variable of every slot (TYPE_INT or
+              TYPE_FLOAT)
+    - slots : maps every variable name to its slot
+
+    so that a phase that walks the resolved AST can keep the variables
+    in a list (a frame) indexed by slot instead of a dictionary.
+    """
+
+    __slots__ = ("names", "types", "codes", "slots")
+
+    def __init__(self):
+        dict.__init__(self)
+        self.names = []
+        self.types = []
+        self.codes = []
+        self.slots = {}
+
+    def declare(self, name, ty):
+        """Add a variable, and return its slot."""
+        slot = len(self.names)
+        self[name] = ty
+        self.slots[name] = slot
+        self.names.append(name)
+        self.types.append(ty)
+        self.codes.append(TYPE_CODES[ty])
+        return slot
 
 
 def build_symtab(ast):
     """
     Input : the AST of a mini program
-    Output: a dictionary mapping variable names to types
+    Output: its symbol table (a SymbolTable)
 
     This procedure iterates over the declarations and adds them to a
-    symbol table (here, a dictionary that maps variable names to their
-    declared type).  If a variable is declared more than once, we
-    report an error.
+    symbol table (a dictionary that maps variable names to their
+    declared type, and numbers them).  If a variable is declared more
+    than once, we report an error.
+
+    The variables used by the statements are then resolved: the Id,
+    Assign and Read nodes of the AST get the slot of their variable
+    (in place), and a variable that was not declared is reported here,
+    so that the later phases can take them for granted.
+
+    All the errors are reported together, in one CompileError: every
+    declaration is checked, and every top-level statement is resolved
+    up to its first undeclared variable.
     """
-    symtab = {}
-    for decl in ast["decls"]:
-        if decl["id"] in symtab:
-            error("%s is already declared" % decl["id"])
+    diagnostics = Diagnostics()
+    symtab = SymbolTable()
+    for decl in ast.decls:
+        if decl.id in symtab:
+            with diagnostics:
+                error("%s is already declared" % decl.id)
         else:
-            symtab[decl["id"]] = decl["type"]
+            symtab.declare(decl.id, decl.type)
+    slots = symtab.slots
+    for stmt in ast.stmts:
+        with diagnostics:
+            resolve((stmt,), slots)
+    diagnostics.check()
     return symtab
+
+
+def resolve(stmts, slots):
+    """Fill in the slot of the variables used by stmts."""
+    for stmt in stmts:
+        nodetype = stmt.nodetype
+        if nodetype == AST_ASSIGN:
+            stmt.slot = lookup(slots, stmt.lhs)
+            expr = stmt.rhs
+        elif nodetype == AST_READ:
+            stmt.slot = lookup(slots, stmt.id)
+            continue
+        else:
+            expr = stmt.expr
+        # The operands are visited left to right, so that the first
+        # undeclared variable of an expression is the one reported.
+        exprs = [expr]
+        pop = exprs.pop
+        push = exprs.append
+        while exprs:
+            expr = pop()
+            nodetype = expr.nodetype
+            if nodetype == AST_BINOP:
+                push(expr.rhs)
+                push(expr.lhs)
+            elif nodetype == AST_ID:
+                slot = slots.get(expr.name)
+                expr.slot = slot if slot is not None else lookup(slots, expr.name)
+        if stmt.nodetype == AST_WHILE:
+            resolve(stmt.body, slots)
+
+
+def lookup(slots, name):
+    if name not in slots:
+        error("undeclared variable: %s" % name)
+    return slots[name]
@@ -0,0 +1,250 @@
+import glob
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import zlib
+
+
+_compiler_version = None
+
+
+def compiler_version():
+    """
+    Return a hash of the source of the compiler itself, so that cached
+    results are not reused by a different version of the compiler.
+    """
+    global _compiler_version
+    if _compiler_version is None:
+        h = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for path in sorted(glob.glob(os.path.join(here, "*.py"))):
+            with open(path, "rb") as f:
+                h.update(os.path.basename(path).encode("utf-8") + b"\0")
+                h.update(f.read())
+        _compiler_version = h.hexdigest()
+    return _compiler_version
+
+
+class DamagedEntryError(Exception):
+    """Raised by a CacheEntry when one of its outputs can't be decoded."""
+
+
+class UnsafeCacheError(Exception):
+    """Raised for a cache directory that other users could write to."""
+
+
+def check_directory(directory):
+    """
+    Create directory, readable and writable only by its owner, if it
+    does not exist.  Raise an UnsafeCacheError if it belongs to another
+    user or can be written by its group or by others: the entries are
+    pickles, and unpickling a file written by someone else would run
+    their code.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o700, exist_ok=True)
+    st = os.stat(directory)
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        raise UnsafeCacheError("cache directory %s belongs to another user" % directory)
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise UnsafeCacheError("cache directory %s can be written by other users" % directory)
+
+
+class CacheEntry(object):
+    """
+    The cached outputs of the phases for one source, by name.
+
+    Every output is pickled and compressed on its own, and only
+    unpickled when it is looked up, so that a caller that only needs
+    the generated code does not pay for loading the tokens and the AST.
+    An output that can't be decompressed or unpickled raises
+    DamagedEntryError when it is looked up (see CompileCache.damaged).
+    """
+
+    __slots__ = ("blobs", "values")
+
+    def __init__(self, values=None, blobs=None):
+        self.values = dict(values or {})
+        self.blobs = dict(blobs or {})
+
+    def __contains__(self, name):
+        return name in self.values or name in self.blobs
+
+    def __getitem__(self, name):
+        if name not in self.values:
+            blob = self.blobs[name]
+            try:
+                self.values[name] = pickle.loads(zlib.decompress(blob))
+            except Exception:
+                raise DamagedEntryError(name)
+        return self.values[name]
+
+    def __setitem__(self, name, value):
+        self.values[name] = value
+        self.blobs.pop(name, None)
+
+    def serialize(self):
+        blobs = dict(self.blobs)
+        for name, value in self.values.items():
+            if name not in blobs:
+                try:
+                    blobs[name] = zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                except RecursionError:
+                    # Very deeply nested ASTs can't be pickled; leave
+                    # them out of the cache.
+                    pass
+        return pickle.dumps(blobs, pickle.HIGHEST_PROTOCOL)
+
+
+class CompileCache(object):
+    """
+    A content-addressed cache of compilation results, stored on disk.
+
+    An entry is keyed on a hash of the source text and of the compiler
+    version, and is a CacheEntry holding the outputs of the phases for
+    that source: "tokens", "typed_ast" (typecheck() annotates the AST in
+    place, so it is also the AST), "symtab", and the generated outputs
+    (C code, TAC, bytecode) under names chosen by the caller.  There is
+    one file per entry.
+
+    The total size of the entries is kept under max_bytes by evicting
+    the least recently used entries: a hit refreshes the modification
+    time of its file, and eviction removes the oldest files first, down
+    to a fraction (LOW_WATER) of max_bytes so that the next puts have
+    room.  The directory is only scanned on the first put() and when
+    the size, kept up to date by the puts, goes over max_bytes; the
+    entries that other processes add in between are only seen by the
+    next scan.
+
+    The directory is created private to its owner, and a directory that
+    other users can write to is refused (see check_directory).
+
+    `hits` and `misses` count the lookups made through this object.
+    A CompileCache can be shared by threads: entries are written to a
+    temporary file and renamed into place, so a reader never sees half
+    an entry, and the counters are updated under a lock.
+    """
+
+    SUFFIX = ".mlc"
+    LOW_WATER = 0.75
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # The total size of the entries, None until the first scan.
+        self.size = None
+        check_directory(directory)
+
+    def key(self, src):
+        h = hashlib.sha256()
+        h.update(compiler_version().encode("ascii") + b"\0")
+        h.update(src.encode("utf-8"))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key):
+        """Return the CacheEntry stored under key, or None."""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                blobs = pickle.loads(f.read())
+            os.utime(path, None)
+        except (IOError, OSError):
+            self.count(False)
+            return None
+        except Exception:
+            # A corrupted entry is as good as no entry.
+            self.discard(key)
+            self.count(False)
+            return None
+        self.count(True)
+        return CacheEntry(blobs=blobs)
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def damaged(self, key):
+        """
+        Discard the entry under key, returned by get() but found damaged
+        when one of its outputs was looked up, and count that lookup as a
+        miss rather than a hit.
+        """
+        self.discard(key)
+        with self.lock:
+            self.hits -= 1
+            self.misses += 1
+
+    def put(self, key, entry):
+        """Store entry under key, then evict entries if the cache is too big."""
+        data = entry.serialize()
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.replace(tmp, self.path(key), len(data))
+
+    def replace(self, tmp, path, size):
+        """
+        Move the file tmp, of the given size, to the entry at path, and
+        update the size of the cache, evicting entries if it is too big.
+        """
+        try:
+            replaced = os.stat(path).st_size
+        except OSError:
+            replaced = 0
+        os.replace(tmp, path)
+        with self.lock:
+            if self.size is not None:
+                self.size += size - replaced
+            full = self.size is None or self.size > self.max_bytes
+        if full:
+            self.evict()
+
+    def discard(self, key):
+        path = self.path(key)
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+        except OSError:
+            return
+        with self.lock:
+            if self.size is not None:
+                self.size -= size
+
+    def evict(self):
+        """
+        Scan the entries, and if they take more than max_bytes, remove
+        the oldest ones until they take at most LOW_WATER of it.
+        """
+        entries = []
+        total = 0
+        for path in glob.glob(os.path.join(self.directory, "*" + self.SUFFIX)):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        limit = self.max_bytes if total <= self.max_bytes else self.max_bytes * self.LOW_WATER
+        for mtime, size, path in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+        with self.lock:
+            self.size = total
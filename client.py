@@ -0,0 +1,88 @@
+import argparse
+import json
+import socket
+import sys
+
+
+# This module only imports the standard library, so it starts fast.
+
+
+def exit_status(value):
+    """
+    Return the exit status of a program whose return statement gave
+    value, like the int main() of the C code (a copy of vm.exit_status).
+    """
+    if isinstance(value, float):
+        if value != value or not -2147483649.0 < value < 2147483648.0:
+            value = -0x80000000
+        else:
+            value = int(value)
+    return value & 0xFF
+
+
+class Client(object):
+    """
+    A connection to a compile server (see server.py), which can send
+    any number of requests:
+
+        client = Client(path)
+        response = client.request("c", src)
+        client.close()
+
+    See server.handle_request for the requests and responses.
+    """
+
+    __slots__ = ("sock", "rfile")
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile("rb")
+
+    def request(self, mode, source, opt_level=2, stdin=None):
+        request = {"mode": mode, "source": source, "opt": opt_level}
+        if stdin is not None:
+            request["stdin"] = stdin
+        self.sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("the compile server closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description="Compile or run a mini program with a compile server.")
+    argparser.add_argument("socket", help="the path of the socket of the server")
+    argparser.add_argument("mode", choices=("c", "tac", "asm", "py", "run"))
+    argparser.add_argument("file", nargs="?", help="the mini program (default: stdin)")
+    argparser.add_argument("-O", dest="opt_level", type=int, default=2,
+                           help="optimization level (default: 2)")
+    args = argparser.parse_args()
+    if args.file:
+        with open(args.file) as f:
+            src = f.read()
+    else:
+        src = sys.stdin.read()
+    stdin = sys.stdin.read() if args.mode == "run" and args.file else None
+
+    client = Client(args.socket)
+    try:
+        response = client.request(args.mode, src, args.opt_level, stdin)
+    finally:
+        client.close()
+    sys.stdout.write(response["output"])
+    if not response["ok"]:
+        for msg in response["errors"]:
+            print("Error: " + msg)
+        sys.exit(1)
+    if args.mode == "run":
+        sys.exit(exit_status(response["status"]))
+
+
+if __name__ == "__main__":
+    main()
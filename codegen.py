@@ -1,92 +1,193 @@
-from AST_NODES import *
-from error import error
+import math
 
+from tac_gen import BINOPS, tac_gen
+from optimize import optimize
+from regalloc import allocate_temps
+from output import write_lines
 
-curr_tmp = 0
 
+def c_operand(x):
+    """Return the C spelling of a TAC operand."""
+    if isinstance(x, float):
+        if x in (float("inf"), float("-inf")):
+            return "(%s1.0f / 0.0f)" % ("-" if x < 0 else "")
+        if x != x:
+            # 0.0f / 0.0f gives the NaN of the CPU, -nan on x86.
+            return "(0.0f / 0.0f)" if math.copysign(1.0, x) < 0 else "(-(0.0f / 0.0f))"
+        return repr(x) + "f"
+    return str(x)
 
-def codegen(ast, symtab):
+
+def c_variable(name, ty):
+    """Return the C declaration of a variable, which starts at 0 like in the VM."""
+    return "%s %s = %s;" % (ty, name, "0" if ty == "int" else "0.0f")
+
+
+def codegen(ast, symtab, passes=None, stats=None, out=None, profile=False):
     """
     Input : the AST and symbol table of a mini program
     Output: an equivalent C program
 
-    codegen(ast) will generate code for our Minilang program.  The code
-    is clearly not optimal, nor even really human readable, however it
-    is (a) correct, and (b) translated easily.
+    codegen(ast) will generate code for our Minilang program.  The
+    program is first lowered to three-address code by tac_gen(), which
+    is then run through the optimization passes (the default pipeline
+    of optimize.py, unless a list of passes is given), and every quad
+    of the optimized program is translated to one C statement.  The
+    code is clearly not very human readable, however it is (a) correct,
+    and (b) translated easily.
+
+    The temporaries of the TAC program then share a small pool of C
+    locals: a linear scan over their live intervals gives the local of
+    a temporary whose last use has passed to the next temporary of the
+    same type (see regalloc.py).  If a `stats` dict is given, the number
+    of temporaries before and after this allocation are stored in it
+    under "temps_before" and "temps_after".
+
+    Variables and the pooled temporaries are declared at the beginning
+    of main; the labels and jumps of the TAC program become C labels and
+    gotos.  Float constants are written as float literals,
+    so the arithmetic is done in single precision like it would be
+    with float variables.
+
+    The C code is written to `out`, an output sink (see
+    output.write_lines): stdout by default, or a list or a file-like
+    object.  It is generated line by line and written in chunks.
+
+    With profile, the C program counts how many times every statement
+    and loop runs and times its loops, and saves the profile when it
+    exits (see tac_gen and write_c).
+    """
+    prog = optimize(tac_gen(ast, symtab, profile=profile), passes)
+    temps_before, temps_after = allocate_temps(prog)
+    if stats is not None:
+        stats["temps_before"] = temps_before
+        stats["temps_after"] = temps_after
+    write_c(prog, out)
 
-    For expressions, we pass the expression to translate, and
-    gen_expr() prints the code for generating the expression
-    and returns the name of the variable in which
-    the result is stored.
 
-    The new_temp() function creates a new temporary variable for every
-    time it's called.
+def printf_flag(x, types):
+    """Return the printf/scanf conversion of an operand: "d" or "f"."""
+    if isinstance(x, str):
+        ty = types[x]
+    else:
+        ty = "float" if isinstance(x, float) else "int"
+    return "d" if ty == "int" else "f"
 
-    A typical code generator would return a structure that could then
-    be manipulated for analysis and optimization.
-    """
 
-    def new_temp():
-        """Return a new, unique temporary variable name."""
-        global curr_tmp
-        curr_tmp += 1
-        return "t_" + str(curr_tmp)
-
-    def gen_decl(decl):
-        print("%s %s;" % (decl["type"], decl["id"]))
-
-    def gen_stmt(stmt):
-        if stmt["nodetype"] == AST_ASSIGN:
-            if stmt["lhs"] not in symtab:
-                error("undeclared variable: %s" % stmt["lhs"])
-            expr_loc = gen_expr(stmt["rhs"])
-            print("%s = %s;" % (stmt["lhs"], expr_loc))
-        elif stmt["nodetype"] == AST_PRINT:
-            expr_loc = gen_expr(stmt["expr"])
-            if stmt["expr"]["type"] == "int":
-                flag = "d"
-            else:
-                flag = "f"
-            print('printf("%%%s\\n", %s);' % (flag, expr_loc))
-        elif stmt["nodetype"] == AST_READ:
-            id = stmt["id"]["value"]
-            if symtab[id] == "int":
-                flag = "d"
-            else:
-                flag = "f"
-            print('scanf("%%%s", &%s);' % (flag, id))
-        elif stmt["nodetype"] == AST_WHILE:
-            expr_loc = gen_expr(stmt["expr"])
-            print("while (%s) { " % expr_loc)
-            for body_stmt in stmt["body"]:
-                gen_stmt(body_stmt)
-            gen_expr(stmt["expr"], expr_loc)
-            print("}")
-
-    def gen_expr(expr, loc_name=None):
-        if expr["nodetype"] in (AST_INT, AST_FLOAT):
-            loc = loc_name or new_temp()
-            print("%s %s = %s;" % (expr["type"], loc, expr["value"]))
-            return loc
-        elif expr["nodetype"] == AST_ID:
-            return expr["name"]
-        elif expr["nodetype"] == AST_BINOP:
-            lhs_loc = gen_expr(expr["lhs"])
-            rhs_loc = gen_expr(expr["rhs"])
-            loc = new_temp()
-            print("%s %s = %s %s %s;" % (expr["type"], loc, lhs_loc, expr["op"], rhs_loc))
-            return loc
-
-    # Add the usual C headers and main declaration.
-    print("#include <stdio.h>")
-    print("int main(void) {")
-
-    # Add the variable declarations at the beginning of main.
-    for decl in ast["decls"]:
-        gen_decl(decl)
-
-    # Add the C statements to the main function.
-    for stmt in ast["stmts"]:
-        gen_stmt(stmt)
-
-    print("}")
+def c_statement(q, types):
+    """
+    Return the C statement of a quad, or None, given the types of the
+    names of its program.
+    """
+    op = q.op
+    if op == "=":
+        return "%s = %s;" % (q.dst, c_operand(q.arg1))
+    elif op in BINOPS:
+        return "%s = %s %s %s;" % (q.dst, c_operand(q.arg1), op, c_operand(q.arg2))
+    elif op == "label":
+        return "%s:;" % q.dst
+    elif op == "goto":
+        return "goto %s;" % q.arg1
+    elif op == "ifz":
+        return "if (!%s) goto %s;" % (c_operand(q.arg1), q.arg2)
+    elif op == "djnz":
+        return "if (--%s) goto %s;" % (q.dst, q.arg1)
+    elif op == "print":
+        return 'printf("%%%s\\n", %s);' % (printf_flag(q.arg1, types), c_operand(q.arg1))
+    elif op == "read":
+        return 'scanf("%%%s", &%s);' % (printf_flag(q.dst, types), q.dst)
+    elif op == "return":
+        return "return %s;" % c_operand(q.arg1)
+    elif op == "count":
+        return "minilang_profile_counts[%d]++;" % q.arg1
+    elif op == "timer_start":
+        return "minilang_profile_start[%d] = PROFILE_CLOCK();" % q.arg1
+    elif op == "timer_stop":
+        return "minilang_profile_cycles[%d] += PROFILE_CLOCK() - minilang_profile_start[%d];" % (
+            q.arg1, q.arg1)
+
+
+# The code saving the profile of a program generated with profiling.
+# The timers read the time stamp counter of the CPU where there is one,
+# and count clock() ticks elsewhere.
+PROFILE_SUPPORT = """\
+#include <stdlib.h>
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#define PROFILE_CLOCK() __rdtsc()
+#else
+#include <time.h>
+#define PROFILE_CLOCK() ((unsigned long long) clock())
+#endif
+static unsigned long long minilang_profile_counts[%(n)d];
+static unsigned long long minilang_profile_cycles[%(n)d];
+static unsigned long long minilang_profile_start[%(n)d];
+static const char *const minilang_profile_kinds[%(n)d] = {%(kinds)s};
+static const int minilang_profile_lines[%(n)d] = {%(lines)s};
+static void minilang_profile_dump(void) {
+const char *path = getenv("MINILANG_PROFILE");
+FILE *f;
+int i;
+minilang_profile_cycles[0] += PROFILE_CLOCK() - minilang_profile_start[0];
+f = fopen(path ? path : "%(path)s", "w");
+if (!f) return;
+fprintf(f, "%(magic)s\\n");
+for (i = 0; i < %(n)d; i++)
+fprintf(f, "%%s %%d %%llu %%llu\\n", minilang_profile_kinds[i], minilang_profile_lines[i],
+minilang_profile_counts[i], minilang_profile_cycles[i]);
+fclose(f);
+}"""
+
+PROFILE_PATH = "minilang.prof"
+PROFILE_MAGIC = "minilang-profile 1"
+
+
+def profile_support(sites):
+    """Return the lines of C code that hold and save the profile of the given sites."""
+    return (PROFILE_SUPPORT % {
+        "n": len(sites),
+        "kinds": ", ".join('"%s"' % kind for kind, line in sites),
+        "lines": ", ".join(str(line) for kind, line in sites),
+        "path": PROFILE_PATH,
+        "magic": PROFILE_MAGIC,
+    }).split("\n")
+
+
+def write_c(prog, out=None):
+    """
+    Write the C program equivalent to the TAC program prog, whose
+    temporaries were allocated, to the output sink out.
+
+    If prog was generated with profiling, the profile is written when
+    the program exits, to the file named by $MINILANG_PROFILE, or to
+    minilang.prof in the current directory: a "minilang-profile 1"
+    line, then a "kind line count cycles" line for every site of
+    prog.profile, in order.
+    """
+    types = prog.types
+
+    def gen_lines():
+        # Add the usual C headers and main declaration.
+        yield "#include <stdio.h>"
+        if prog.profile is not None:
+            for line in profile_support(prog.profile):
+                yield line
+        yield "int main(void) {"
+
+        # Add the variable and temporary declarations at the beginning of main.
+        for name, ty in prog.decls:
+            yield c_variable(name, ty)
+        for name in prog.temps():
+            yield "%s %s;" % (types[name], name)
+        if prog.profile is not None:
+            yield "atexit(minilang_profile_dump);"
+
+        # Add the C statements to the main function.
+        for q in prog.quads:
+            line = c_statement(q, types)
+            if line is not None:
+                yield line
+
+        yield "}"
+
+    write_lines(gen_lines(), out)
@@ -0,0 +1,278 @@
+import concurrent.futures
+import io
+import os
+import time
+from lexical_analyzer import lex
+from parser import parse
+from build_symbol_table import build_symtab
+from typecheck import typecheck
+from codegen import write_c
+from asmgen import write_asm
+from pygen import pygen, PyProgram
+from tac_gen import tac_gen, write_tac
+from optimize import optimize, PIPELINES, PARTIAL_EVAL_LEVEL
+from partial_eval import partial_evaluate
+from vm import compile_bytecode
+from regalloc import allocate_temps
+from cache import CacheEntry, DamagedEntryError
+from instrument import NO_INSTRUMENTATION, count_nodes
+from error import CompileError
+
+
+def front_end(src, instr=NO_INSTRUMENTATION):
+    """
+    Run the phases up to type checking, and return their outputs in a
+    CacheEntry.  The phases are measured by instr (see instrument.py).
+    """
+    with instr.phase("lex") as record:
+        toks = lex(src)  # source -> tokens
+        record.items, record.unit = len(toks), "tokens"
+    with instr.phase("parse") as record:
+        ast = parse(toks)  # tokens -> AST
+        if instr.enabled:
+            record.items, record.unit = count_nodes(ast), "nodes"
+    with instr.phase("build_symtab") as record:
+        symtab = build_symtab(ast)  # AST -> symbol table
+        record.items, record.unit = len(symtab), "symbols"
+    with instr.phase("typecheck") as record:
+        typed_ast = typecheck(ast, symtab)  # AST * symbol table -> Typed AST
+    return CacheEntry({"tokens": toks, "typed_ast": typed_ast, "symtab": symtab})
+
+
+def back_end(entry, mode, opt_level, instr=NO_INSTRUMENTATION, profile=False):
+    """
+    Generate the output of the given mode from the outputs of front_end():
+    C, TAC, x86-64 assembly or Python code as a (text, stats) pair, or
+    bytecode for the VM.
+    From PARTIAL_EVAL_LEVEL on, the program is partially evaluated first,
+    in every mode.
+    With profile, the C or TAC code counts and times the statements and
+    loops of the program (see tac_gen); the other modes can't profile.
+    """
+    if profile and mode not in ("c", "tac"):
+        raise ValueError("%s mode can't profile the program" % mode)
+    typed_ast = entry["typed_ast"]
+    symtab = entry["symtab"]
+    if opt_level >= PARTIAL_EVAL_LEVEL:
+        with instr.phase("partial_eval") as record:
+            typed_ast = partial_evaluate(typed_ast, symtab)
+            if instr.enabled:
+                record.items, record.unit = count_nodes(typed_ast), "nodes"
+    if mode == "run":
+        with instr.phase("compile_bytecode") as record:
+            bytecode = compile_bytecode(typed_ast, symtab)  # Typed AST * symbol table -> bytecode
+            record.items, record.unit = len(bytecode.code) // 4, "instructions"
+        return bytecode
+    stats = {}
+    out = io.StringIO()
+    if mode == "py":
+        with instr.phase("pygen") as record:
+            pygen(typed_ast, symtab, out)  # Typed AST * symbol table -> Python code
+            text = out.getvalue()
+            record.items, record.unit = text.count("\n"), "lines"
+        return text, stats
+    with instr.phase("tac_gen") as record:
+        prog = tac_gen(typed_ast, symtab, profile=profile)  # Typed AST * symbol table -> TAC Code
+        record.items, record.unit = len(prog.quads), "quads"
+    with instr.phase("optimize") as record:
+        prog = optimize(prog, PIPELINES[opt_level])
+        record.items, record.unit = len(prog.quads), "quads"
+    if mode == "tac":
+        with instr.phase("write_tac") as record:
+            write_tac(prog, out)
+            text = out.getvalue()
+            record.items, record.unit = text.count("\n"), "lines"
+    elif mode == "asm":
+        with instr.phase("asmgen") as record:
+            write_asm(prog, out)  # TAC Code -> x86-64 assembly
+            text = out.getvalue()
+            record.items, record.unit = text.count("\n"), "lines"
+    else:
+        with instr.phase("regalloc") as record:
+            stats["temps_before"], stats["temps_after"] = allocate_temps(prog)
+            record.items, record.unit = stats["temps_after"], "temps"
+        with instr.phase("codegen") as record:
+            write_c(prog, out)  # TAC Code -> C code
+            text = out.getvalue()
+            record.items, record.unit = text.count("\n"), "lines"
+    return text, stats
+
+
+def output_name(mode, opt_level, profile=False):
+    """Return the name under which the output of a mode is cached."""
+    if mode in ("run", "py"):
+        name = "bytecode" if mode == "run" else "py"
+        if opt_level >= PARTIAL_EVAL_LEVEL:
+            name += "-O%d" % opt_level
+        return name
+    return "%s-O%d%s" % (mode, opt_level, "-profile" if profile else "")
+
+
+def compile_source(src, mode, opt_level, cache=None, instr=NO_INSTRUMENTATION, profile=False):
+    """
+    Input : the text of a mini program, the mode and optimization level
+            of the output, optionally a CompileCache, and whether to
+            profile the program (C and TAC code only)
+    Output: the output of back_end() for that mode
+
+    The outputs of the phases are looked up in the cache first, and
+    the entry of the source is updated if anything had to be computed.
+    Only the phases that run are measured by instr.
+    """
+    context = CompilationContext(src, mode, opt_level, instr, profile)
+    context.run(cache)
+    return context.output
+
+
+class CompilationContext(object):
+    """
+    The state of one compilation.  Everything a compilation computes
+    hangs off its context (the symbol table and the counters of the
+    temporaries and labels are in the entry and in the TacProgram of
+    the back end, which are made for it), so compilations running in
+    different threads share nothing but their read-only Compiler and
+    the compilation cache.
+
+    - source, mode, opt_level : what is compiled, and to what
+    - instr   : measures the phases (see instrument.py)
+    - profile : whether the output profiles the program (see back_end)
+    - entry   : the outputs of the phases, a CacheEntry (see front_end)
+    - output  : the output of back_end() for the mode
+    - errors  : the messages of the errors in the program, or None
+    - hit     : whether the entry was found in the compilation cache
+    - seconds : the time the compilation took
+    """
+
+    __slots__ = ("source", "mode", "opt_level", "instr", "profile", "entry",
+                 "output", "errors", "hit", "seconds")
+
+    def __init__(self, source, mode="c", opt_level=2, instr=NO_INSTRUMENTATION, profile=False):
+        self.source = source
+        self.mode = mode
+        self.opt_level = opt_level
+        self.instr = instr
+        self.profile = profile
+        self.entry = None
+        self.output = None
+        self.errors = None
+        self.hit = False
+        self.seconds = 0.0
+
+    def run(self, cache=None):
+        """
+        Compile the source, with cache if given (see compile_source).
+        An entry of the cache with an output that can't be decoded is
+        as good as no entry: it is discarded, counted as a miss, and
+        the source is compiled from scratch.
+        """
+        start = time.perf_counter()
+        try:
+            key = None
+            entry = None
+            if cache is not None:
+                key = cache.key(self.source)
+                entry = cache.get(key)
+            self.hit = entry is not None
+            try:
+                self.compile(entry, cache, key)
+            except DamagedEntryError:
+                cache.damaged(key)
+                self.hit = False
+                self.compile(None, cache, key)
+        finally:
+            self.seconds = time.perf_counter() - start
+
+    def compile(self, entry, cache, key):
+        """
+        Set the output from the cached entry, computing what it lacks
+        (everything if entry is None), and store it in the cache under
+        key if anything had to be computed.
+        """
+        updated = entry is None
+        if entry is None:
+            entry = front_end(self.source, self.instr)
+        self.entry = entry
+        name = output_name(self.mode, self.opt_level, self.profile)
+        if name not in entry:
+            entry[name] = back_end(entry, self.mode, self.opt_level, self.instr,
+                                   self.profile)
+            updated = True
+        # Looked up before the entry is stored, so that a damaged entry
+        # is not stored again.
+        output = entry[name]
+        if cache is not None and updated:
+            cache.put(key, entry)
+        self.output = output
+
+
+class Compiler(object):
+    """
+    Compiles mini programs, one at a time or many at once in a pool of
+    threads.  A Compiler only holds what its compilations share and
+    don't change: the compilation cache (None for none), and the number
+    of threads of compile_many().  Each compilation gets a
+    CompilationContext of its own, so one Compiler can serve any number
+    of threads:
+
+        compiler = Compiler(CompileCache(directory))
+        for context in compiler.compile_many(sources, "c"):
+            if context.errors is None:
+                text, stats = context.output
+    """
+
+    __slots__ = ("cache", "workers")
+
+    def __init__(self, cache=None, workers=None):
+        self.cache = cache
+        self.workers = workers or os.cpu_count() or 1
+
+    def compile(self, source, mode="c", opt_level=2, instr=NO_INSTRUMENTATION):
+        """
+        Compile source, and return its CompilationContext.  The errors
+        in the program are not raised, but kept in the errors of the
+        context.
+        """
+        context = CompilationContext(source, mode, opt_level, instr)
+        try:
+            context.run(self.cache)
+        except CompileError as e:
+            context.errors = e.diagnostics
+        except ZeroDivisionError:
+            context.errors = ["division by zero"]
+        return context
+
+    def compile_many(self, sources, mode="c", opt_level=2):
+        """
+        Input : a list of program texts, the mode and optimization level
+        Output: the list of their CompilationContexts, in the same order
+
+        The programs are compiled by a pool of threads.  Under CPython,
+        the threads take turns rather than compile in parallel, so this
+        is for serving compilations concurrently, like the threads of
+        the compile server; compile_batch() uses processes to compile
+        many files faster.
+        """
+        workers = max(1, min(self.workers, len(sources)))
+        if workers == 1:
+            return [self.compile(src, mode, opt_level) for src in sources]
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(lambda src: self.compile(src, mode, opt_level), sources))
+
+
+def compile_to_string(src, mode="c", opt_level=2, cache=None):
+    """
+    Input : the text of a mini program, "c", "tac" or "py", the
+            optimization level, and optionally a CompileCache
+    Output: the C, TAC or Python code of the program, as a string
+    """
+    text, stats = compile_source(src, mode, opt_level, cache)
+    return text
+
+
+def compile_to_python(src, cache=None):
+    """
+    Input : the text of a mini program, and optionally a CompileCache
+    Output: a PyProgram, which runs the program when called (see pygen.py)
+    """
+    text, stats = compile_source(src, "py", 0, cache)
+    return PyProgram(text)
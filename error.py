@@ -1,6 +1,50 @@
-import sys
+class CompileError(Exception):
+    """
+    The errors found in a mini program.  `diagnostics` is the list of
+    their messages, in the order they were found; there is at least
+    one, and the first one is the message of the exception.
+    """
+
+    def __init__(self, diagnostics):
+        Exception.__init__(self, diagnostics[0])
+        self.diagnostics = list(diagnostics)
 
 
 def error(msg):
-    print("Error: " + msg)
-    sys.exit(1)
+    """Report an error in the program being compiled, by raising a CompileError."""
+    raise CompileError([msg])
+
+
+class Diagnostics(object):
+    """
+    Collects the errors of a phase that can go on after an error,
+    like the type checker does after a statement with an error:
+
+        diagnostics = Diagnostics()
+        for stmt in stmts:
+            with diagnostics:
+                check(stmt)
+        diagnostics.check()
+
+    A CompileError raised in a `with diagnostics:` block is recorded and
+    stops only that block; check() then raises one CompileError with
+    all the messages recorded, if there are any.
+    """
+
+    __slots__ = ("messages",)
+
+    def __init__(self):
+        self.messages = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ty, value, tb):
+        if ty is not None and issubclass(ty, CompileError):
+            self.messages.extend(value.diagnostics)
+            return True
+        return False
+
+    def check(self):
+        if self.messages:
+            raise CompileError(self.messages)
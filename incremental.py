@@ -0,0 +1,421 @@
+import bisect
+import os
+import re
+import time
+from AST_NODES import *
+from TOKEN_TYPES import TOK_VAR
+from lexical_analyzer import lex_line, TOKTYPE, VALUE, LINE, COL
+from parser import parse
+from build_symbol_table import build_symtab, resolve
+from typecheck import typecheck
+from cache import CacheEntry
+from error import CompileError, Diagnostics
+
+
+# What ends a fragment: a ';' or the 'done' of an outermost loop.  The
+# 'while's are needed to count the loops, and the comments to skip
+# what they contain.
+_BOUNDARY_RE = re.compile(r"#[^\n]*|;|\b(?:while|done)\b")
+
+
+def scan(src, start=0, line=1, col=1):
+    """
+    Yield the fragments of src after offset start, where a fragment
+    starts at (line, col), as (start, end, line, col) tuples.
+    """
+    depth = 0
+    for m in _BOUNDARY_RE.finditer(src, start):
+        lexeme = m.group()
+        if lexeme[0] == "#":
+            continue
+        elif lexeme == "while":
+            depth += 1
+            continue
+        elif lexeme == "done":
+            depth -= 1
+            if depth > 0:
+                continue
+            depth = 0
+        elif depth > 0:
+            continue
+        end = m.end()
+        yield start, end, line, col
+        newlines = src.count("\n", start, end)
+        if newlines:
+            line += newlines
+            col = end - src.rfind("\n", start, end)
+        else:
+            col += end - start
+        start = end
+    if start < len(src):
+        yield start, len(src), line, col
+
+
+def split_source(src):
+    """
+    Input : the text of a mini program
+    Output: the list of its fragments, as (text, line, col) triples
+
+    A fragment is the text of one declaration or statement at the top
+    level of the program (a whole loop, for a while statement) with the
+    blanks and comments before it, and (line, col) is where its text
+    starts.  The text after the last statement is a fragment too.
+    Joined together, the fragments give back src.
+    """
+    return [(src[start:end], line, col) for start, end, line, col in scan(src)]
+
+
+def common_prefix(a, b):
+    """Return the length of the longest common prefix of two strings."""
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i:i + 4096] == b[i:i + 4096]:
+        i += 4096
+    while i < n and a[i] == b[i]:
+        i += 1
+    return min(i, n)
+
+
+def common_suffix(a, b, n):
+    """Return the length of the longest common suffix of two strings, up to n."""
+    la, lb = len(a), len(b)
+    i = 0
+    while i < n and a[la - i - 4096:la - i] == b[lb - i - 4096:lb - i]:
+        i += 4096
+    while i < n and a[la - i - 1] == b[lb - i - 1]:
+        i += 1
+    return min(i, n)
+
+
+def lex_fragment(text, line, col):
+    """Return the tokens of a fragment of source starting at (line, col)."""
+    tokens = []
+    lines = text.split("\n")
+    # Blanks stand for the start of the first line, so the columns are
+    # the ones of the whole source.  The first line usually only holds
+    # the end of the line of the previous fragment, and lexing blanks
+    # alone is slow.
+    if lines[0].strip():
+        lex_line(" " * (col - 1) + lines[0], line, tokens)
+    for text in lines[1:]:
+        line += 1
+        lex_line(text, line, tokens)
+    return tokens
+
+
+def references(stmt):
+    """
+    Return the nodes of a statement that name a variable (Id, Assign
+    and Read nodes), each with the name of its variable.
+    """
+    refs = []
+    stmts = [stmt]
+    while stmts:
+        stmt = stmts.pop()
+        nodetype = stmt.nodetype
+        if nodetype == AST_ASSIGN:
+            refs.append((stmt, stmt.lhs))
+            exprs = [stmt.rhs]
+        elif nodetype == AST_READ:
+            refs.append((stmt, stmt.id))
+            continue
+        else:
+            exprs = [stmt.expr]
+            if nodetype == AST_WHILE:
+                stmts.extend(stmt.body)
+        while exprs:
+            expr = exprs.pop()
+            if expr.nodetype == AST_BINOP:
+                exprs.append(expr.lhs)
+                exprs.append(expr.rhs)
+            elif expr.nodetype == AST_ID:
+                refs.append((expr, expr.name))
+    return refs
+
+
+class Fragment(object):
+    """
+    The front end outputs of one fragment of a program (see
+    split_source): its tokens, as lexed at (line, col) (where the text
+    was when it was first seen); its node, a
+    Decl or a statement (None if it holds none, or until it is parsed);
+    and for a statement, the nodes naming its variables (see
+    references) and the set of their names, and whether it was
+    resolved and type checked against the current symbol table (the
+    slots and types of its variables may change without its text).
+    """
+
+    __slots__ = ("text", "tokens", "line", "col", "parsed", "node", "refs",
+                 "uses", "resolved", "checked")
+
+    def __init__(self, text, line, col):
+        self.text = text
+        self.tokens = lex_fragment(text, line, col)
+        self.line = line
+        self.col = col
+        self.parsed = False
+        self.node = None
+        self.refs = None
+        self.uses = None
+        self.resolved = False
+        self.checked = False
+
+    def parse(self):
+        program = parse(self.tokens)
+        if program.decls:
+            self.node = program.decls[0]
+        elif program.stmts:
+            self.node = program.stmts[0]
+            self.refs = references(self.node)
+            self.uses = frozenset(name for node, name in self.refs)
+        self.parsed = True
+
+    def tokens_at(self, line, col):
+        """Return the tokens of the fragment, as if its text started at (line, col)."""
+        dline = line - self.line
+        dcol = col - self.col
+        if dline == 0 and dcol == 0:
+            return self.tokens
+        first = self.line
+        return [(t[TOKTYPE], t[VALUE], t[LINE] + dline,
+                 t[COL] + dcol if t[LINE] == first else t[COL]) for t in self.tokens]
+
+
+class IncrementalCompiler(object):
+    """
+    Runs the front end of a program that is edited over and over,
+    redoing only the work that depends on what changed.
+
+    update(src) splits the program into fragments (see split_source),
+    and only lexes and parses the fragments whose text is new; the
+    others keep their tokens and AST from the previous updates.  The
+    symbol table is rebuilt only when the declarations change, and the
+    statements are resolved and type checked only when they are new,
+    or when they use a variable whose slot or type changed.  The back
+    end then runs on the whole program as usual, since the
+    optimizations are not local to a statement.
+
+    The program is the same as the one front_end() would see: parsing
+    stops at the first fragment that is not a declaration or statement,
+    or at a declaration after the statements.  The errors are the same
+    too, in the same order: those of the declarations and of the
+    undeclared variables of all the statements, or else the type errors
+    of all the statements.
+
+    After an update, `relexed` and `rechecked` count the fragments that
+    were lexed and checked by it, `fragments` is the list of all of
+    them and `positions` the (line, col) where each of them starts.  A
+    fragment that moved keeps the tokens lexed where it was; tokens()
+    gives them their current positions.
+    """
+
+    def __init__(self):
+        self.src = ""
+        self.fragments = []
+        self.offsets = []
+        self.positions = []
+        self.signature = None
+        self.symtab = None
+        self.relexed = 0
+        self.rechecked = 0
+
+    def update(self, src):
+        """
+        Input : the new text of the program
+        Output: a CacheEntry with its "typed_ast" and "symtab", for
+                compiler.back_end()
+        """
+        self.split(src)
+        fragments = self.fragments
+        self.rechecked = 0
+
+        decls = []
+        stmts = []
+        for fragment in fragments:
+            if stmts and fragment.tokens and fragment.tokens[0][TOKTYPE] == TOK_VAR:
+                # The parser stops there without reading the declaration.
+                break
+            if not fragment.parsed:
+                fragment.parse()
+            node = fragment.node
+            if node is None:
+                break
+            if node.nodetype == AST_DECL:
+                decls.append(node)
+            else:
+                stmts.append(fragment)
+
+        signature = [(decl.id, decl.type) for decl in decls]
+        if signature != self.signature:
+            try:
+                symtab = build_symtab(Program(decls, []))
+            except CompileError:
+                # Report the undeclared variables of the statements with
+                # the errors of the declarations, like front_end().  This
+                # resolves the statements against a symbol table that is
+                # dropped, so their slots must be filled in again.
+                for fragment in stmts:
+                    fragment.resolved = False
+                build_symtab(Program(decls, [fragment.node for fragment in stmts]))
+                raise
+            moved, retyped = self.changed_variables(symtab)
+            for fragment in fragments:
+                if fragment.uses is None:
+                    continue
+                if not retyped.isdisjoint(fragment.uses):
+                    fragment.checked = False
+                elif not moved.isdisjoint(fragment.uses):
+                    fragment.resolved = False
+            self.symtab = symtab
+            self.signature = signature
+        symtab = self.symtab
+
+        slots = symtab.slots
+        diagnostics = Diagnostics()
+        for fragment in stmts:
+            if not fragment.checked:
+                with diagnostics:
+                    resolve([fragment.node], slots)
+                    fragment.resolved = True
+            elif not fragment.resolved:
+                # Its variables are all still declared, with the same
+                # types, but some have a new slot.
+                for node, name in fragment.refs:
+                    node.slot = slots[name]
+                fragment.resolved = True
+        # As in front_end(), the types are only checked once every
+        # variable of the program was found.
+        diagnostics.check()
+        for fragment in stmts:
+            if not fragment.checked:
+                with diagnostics:
+                    typecheck(Program([], [fragment.node]), symtab)
+                    fragment.checked = True
+                self.rechecked += 1
+        diagnostics.check()
+
+        ast = Program(decls, [fragment.node for fragment in stmts])
+        return CacheEntry({"typed_ast": ast, "symtab": symtab})
+
+    def split(self, src):
+        """
+        Split src into fragments, reusing the fragments of the previous
+        text: the ones before the first difference are kept, and the
+        text after it is split again, until a boundary between two
+        fragments of the previous text is found after the last
+        difference; the fragments after it are kept too.  The fragments
+        in between are looked up by text among the ones that were
+        replaced, and only lexed if they are new.
+        """
+        old = self.src
+        fragments = self.fragments
+        offsets = self.offsets
+        positions = self.positions
+        n = len(fragments)
+        prefix = common_prefix(old, src)
+        suffix = common_suffix(old, src, min(len(old), len(src)) - prefix)
+        delta = len(src) - len(old)
+
+        # The fragments that end before the first difference (and so
+        # also before the character that follows them) are kept.
+        kept = max(bisect.bisect_left(offsets, prefix) - 1, 0)
+        if kept < n:
+            start = offsets[kept]
+            line, col = positions[kept]
+        else:
+            start, line, col = 0, 1, 1
+        new_fragments = fragments[:kept]
+        new_offsets = offsets[:kept]
+        new_positions = positions[:kept]
+
+        pool = {}
+        for fragment in fragments[kept:]:
+            pool.setdefault(fragment.text, []).append(fragment)
+        relexed = 0
+        resync = len(src) - suffix
+        tail = n
+        for start, end, line, col in scan(src, start, line, col):
+            text = src[start:end]
+            olds = pool.get(text)
+            if olds:
+                fragment = olds.pop()
+            else:
+                fragment = Fragment(text, line, col)
+                relexed += 1
+            new_fragments.append(fragment)
+            new_offsets.append(start)
+            new_positions.append((line, col))
+            if end > resync:
+                j = bisect.bisect_left(offsets, end - delta, kept)
+                if j < n and offsets[j] == end - delta:
+                    tail = j
+                    break
+
+        if tail < n:
+            # The line and column where fragment tail starts now.
+            line, col = new_positions[-1]
+            text = new_fragments[-1].text
+            newlines = text.count("\n")
+            if newlines:
+                line += newlines
+                col = len(text) - text.rfind("\n")
+            else:
+                col += len(text)
+            old_line, old_col = positions[tail]
+            dline = line - old_line
+            dcol = col - old_col
+            new_fragments.extend(fragments[tail:])
+            new_offsets.extend(offset + delta for offset in offsets[tail:])
+            new_positions.extend(
+                (l + dline, c + dcol if l == old_line else c) for l, c in positions[tail:])
+        self.src = src
+        self.fragments = new_fragments
+        self.offsets = new_offsets
+        self.positions = new_positions
+        self.relexed = relexed
+
+    def changed_variables(self, symtab):
+        """
+        Return the names whose slot changed between the current symbol
+        table and symtab, and the names whose type changed (or that
+        were added or removed).
+        """
+        if self.symtab is None:
+            return set(), set(symtab)
+        old = self.symtab
+        retyped = set(name for name in old if name not in symtab)
+        moved = set()
+        for name, slot in symtab.slots.items():
+            if name not in old or old[name] != symtab[name]:
+                retyped.add(name)
+            elif old.slots[name] != slot:
+                moved.add(name)
+        return moved, retyped
+
+    def tokens(self):
+        """Return the tokens of the whole program, like lex() does."""
+        tokens = []
+        for fragment, (line, col) in zip(self.fragments, self.positions):
+            tokens.extend(fragment.tokens_at(line, col))
+        return tokens
+
+
+def watch(path, on_change, interval=0.02):
+    """
+    Call on_change(src) with the contents of the file at path, and
+    again every time the file changes, until interrupted.  The file is
+    polled every `interval` seconds.
+    """
+    stamp = None
+    while True:
+        try:
+            st = os.stat(path)
+            current = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            current = None
+        if current is not None and current != stamp:
+            stamp = current
+            with open(path) as f:
+                src = f.read()
+            on_change(src)
+        time.sleep(interval)
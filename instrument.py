@@ -0,0 +1,165 @@
+import json
+import time
+import tracemalloc
+from AST_NODES import Node
+
+
+class PhaseRecord(object):
+    """
+    The measurements of one phase: wall and CPU time in seconds, the
+    peak of the memory allocated during the phase in bytes (None if
+    memory was not traced), and the number of items the phase produced
+    (tokens, AST nodes, quads, lines...), named by `unit`.
+    """
+
+    __slots__ = ("name", "wall", "cpu", "peak", "items", "unit")
+
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak = None
+        self.items = None
+        self.unit = ""
+
+    def as_dict(self):
+        return {"name": self.name, "wall": self.wall, "cpu": self.cpu,
+                "peak_bytes": self.peak, "items": self.items, "unit": self.unit}
+
+
+class _Phase(object):
+    """The context manager of Instrumentation.phase()."""
+
+    __slots__ = ("instr", "record", "wall", "cpu", "base")
+
+    def __init__(self, instr, name):
+        self.instr = instr
+        self.record = PhaseRecord(name)
+
+    def __enter__(self):
+        instr = self.instr
+        for hook in instr.hooks:
+            hook("start", self.record)
+        if instr.trace_memory:
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            else:
+                # Before Python 3.9, only clearing the traces resets the
+                # peak; the phases being measured one after the other,
+                # nothing needs the traces of the previous ones.
+                tracemalloc.clear_traces()
+            self.base = tracemalloc.get_traced_memory()[0]
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        record = self.record
+        record.wall = time.perf_counter() - self.wall
+        record.cpu = time.process_time() - self.cpu
+        instr = self.instr
+        if instr.trace_memory:
+            record.peak = max(0, tracemalloc.get_traced_memory()[1] - self.base)
+        instr.records.append(record)
+        for hook in instr.hooks:
+            hook("end", record)
+        return False
+
+
+class _NoPhase(object):
+    """A phase that measures nothing, for NullInstrumentation."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return PhaseRecord(None)
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class Instrumentation(object):
+    """
+    Measures the phases of a compilation.  A phase is timed with
+
+        with instr.phase("lex") as record:
+            toks = lex(src)
+            record.items, record.unit = len(toks), "tokens"
+
+    and its PhaseRecord is added to `records` when it ends.
+
+    Hooks are called at the boundaries of every phase, as
+    hook("start", record) and hook("end", record); at "start" the
+    record only has its name.  They let a profiler be attached to the
+    phases, e.g. to enable cProfile only during "optimize".
+
+    If trace_memory is true, tracemalloc is started (it slows down the
+    compilation a lot) and the peak memory of every phase is measured.
+    """
+
+    enabled = True
+
+    def __init__(self, trace_memory=False):
+        self.records = []
+        self.hooks = []
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def total(self):
+        record = PhaseRecord("total")
+        record.wall = sum(r.wall for r in self.records)
+        record.cpu = sum(r.cpu for r in self.records)
+        peaks = [r.peak for r in self.records if r.peak is not None]
+        if peaks:
+            record.peak = max(peaks)
+        return record
+
+    def format_table(self):
+        """Return the lines of a table of the records."""
+        lines = ["%-16s %10s %10s %10s  %s" % ("phase", "wall (ms)", "cpu (ms)", "peak (KB)", "items")]
+        for r in self.records + [self.total()]:
+            peak = "-" if r.peak is None else "%.1f" % (r.peak / 1024.0)
+            items = "" if r.items is None else "%d %s" % (r.items, r.unit)
+            lines.append("%-16s %10.3f %10.3f %10s  %s" % (
+                r.name, r.wall * 1000, r.cpu * 1000, peak, items))
+        return lines
+
+    def to_json(self):
+        return json.dumps({"phases": [r.as_dict() for r in self.records],
+                           "total": self.total().as_dict()}, indent=2)
+
+
+class NullInstrumentation(object):
+    """An Instrumentation that measures nothing, used by default."""
+
+    enabled = False
+    records = ()
+    hooks = ()
+    trace_memory = False
+
+    def phase(self, name):
+        return _NoPhase()
+
+
+NO_INSTRUMENTATION = NullInstrumentation()
+
+
+def count_nodes(ast):
+    """Return the number of nodes of an AST."""
+    count = 0
+    stack = [ast]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, Node):
+            count += 1
+            stack.extend(getattr(x, f) for f in x.__slots__)
+        elif isinstance(x, list):
+            stack.extend(x)
+    return count
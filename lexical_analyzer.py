@@ -1,9 +1,127 @@
+import re
+
 from TOKEN_TYPES import *
 from error import error
 
 
-def tok(ty, val):
-    return {"toktype": ty, "value": val}
+# Tokens are plain tuples (toktype, value, line, col); these are the
+# indices of their fields.
+TOKTYPE, VALUE, LINE, COL = range(4)
+
+
+# Keywords are looked up in a table once an identifier has been matched,
+# instead of being compared one by one.
+KEYWORDS = {
+    "print": TOK_PRINT,
+    "return": TOK_RETURN,
+    "read": TOK_READ,
+    "var": TOK_VAR,
+    "while": TOK_WHILE,
+    "do": TOK_DO,
+    "done": TOK_DONE,
+    "int": TOK_TYPE,
+    "float": TOK_TYPE,
+}
+
+PUNCTUATION = {
+    "=": TOK_EQ,
+    "+": TOK_PLUS,
+    "-": TOK_MINUS,
+    "*": TOK_STAR,
+    "/": TOK_SLASH,
+    "(": TOK_LPAREN,
+    ")": TOK_RPAREN,
+    ":": TOK_COLON,
+    ";": TOK_SEMI,
+    ">": TOK_GTHAN,
+    "<": TOK_LTHAN,
+}
+
+# A single master regex skips leading blanks and recognizes the next
+# lexeme of a line; the index of the group that matched tells us what
+# kind of lexeme it was.
+_COMMENT, _FLOAT, _INT, _IDENT, _PUNCT, _INVALID = range(1, 7)
+_TOKEN_RE = re.compile(r"""
+    \s*
+    (?:
+        (\#.*)
+      | (\d+\.\d*)
+      | (\d+)
+      | ([^\W\d]\w*)
+      | ([=+\-*/():;><])
+      | (\S)
+    )
+""", re.VERBOSE)
+
+
+def lex_line(text, line, tokens):
+    """
+    Append the tokens of one line of source, `text`, to the list
+    `tokens`.  Columns are counted from 1.
+    """
+    keywords = KEYWORDS
+    punctuation = PUNCTUATION
+    append = tokens.append
+    for m in _TOKEN_RE.finditer(text):
+        kind = m.lastindex
+        if kind == _IDENT:
+            ident = m.group(kind)
+            ty = keywords.get(ident, TOK_ID)
+            if ty == TOK_ID or ty == TOK_TYPE:
+                append((ty, ident, line, m.start(kind) + 1))
+            else:
+                append((ty, None, line, m.start(kind) + 1))
+        elif kind == _PUNCT:
+            append((punctuation[m.group(kind)], None, line, m.start(kind) + 1))
+        elif kind == _INT:
+            append((TOK_INT, int(m.group(kind)), line, m.start(kind) + 1))
+        elif kind == _FLOAT:
+            append((TOK_FLOAT, float(m.group(kind)), line, m.start(kind) + 1))
+        elif kind == _INVALID:
+            error("invalid character: %r (line %d, column %d)" % (
+                m.group(kind), line, m.start(kind) + 1))
+
+
+def tokenize(s):
+    """
+    Input : a string representing a mini program
+    Output: an iterator over the tokens of the program
+
+    tokenize(s) is the lazy version of lex(): tokens are produced one
+    line at a time, so a consumer that only needs a few tokens of
+    lookahead never holds the whole token list in memory.
+    """
+    line = 0
+    for text in s.split("\n"):
+        line += 1
+        tokens = []
+        lex_line(text, line, tokens)
+        for t in tokens:
+            yield t
+
+
+def tokenize_buffer(buf):
+    """
+    Input : a bytes-like object holding a UTF-8 mini program, such as
+            an mmap of its file
+    Output: an iterator over the tokens of the program
+
+    Like tokenize(), but the lines are found in the buffer and decoded
+    one at a time, so only the current line is ever copied out of it.
+    """
+    size = len(buf)
+    start = 0
+    line = 0
+    while start <= size:
+        end = buf.find(b"\n", start)
+        if end < 0:
+            end = size
+        line += 1
+        tokens = []
+        lex_line(buf[start:end].decode("utf-8"), line, tokens)
+        for t in tokens:
+            yield t
+        start = end + 1
 
 
 def lex(s):
@@ -11,112 +129,35 @@ def lex(s):
     Input : a string representing a mini program
     Output: a list of tokens
 
-    lex(s) will produce a sequence of tokens, which are dicts with two
-    bindings: the type of the token (as defined above) and a semantic
-    value.  The semantic value (also called lexeme) is a piece of
-    information associated with the token, such as the name of an
-    identifier or the value of an integer literal.  Some tokens, like
-    the plus symbol, do not have an associated semantic value.
+    lex(s) will produce a sequence of tokens, which are tuples with
+    four fields: the type of the token (as defined above), a semantic
+    value, and the line and column where the token starts.
+    The semantic value (also called lexeme) is a piece of information
+    associated with the token, such as the name of an identifier or
+    the value of an integer literal.  Some tokens, like the plus
+    symbol, do not have an associated semantic value.
 
     Example:
     x = x + dx;
     =>
-    { "toktype": TOK_ID   , "value": "x" }
-    { "toktype": TOK_EQ   , "value": None }
-    { "toktype": TOK_ID   , "value": "x" }
-    { "toktype": TOK_PLUS , "value": None }
-    { "toktype": TOK_ID   , "value": "dx" }
-    { "toktype": TOK_SEMI , "value": None }
+    (TOK_ID   , "x" , 1, 1)
+    (TOK_EQ   , None, 1, 3)
+    (TOK_ID   , "x" , 1, 5)
+    (TOK_PLUS , None, 1, 7)
+    (TOK_ID   , "dx", 1, 9)
+    (TOK_SEMI , None, 1, 11)
 
     alpha   ::= ['a'-'z'  'A'-'Z'  '_']
     digit   ::= ['0'-'9']
     alnum   ::= alpha | digit
     int     ::= digit+
     float   ::= digit+ '.' digit*
-    keyword ::= "var" | "print" | "read" | "while" | "do" | "done" | "int" | "float"
+    keyword ::= "var" | "print" | "read" | "return" | "while" | "do" | "done" | "int" | "float"
     ident   ::= alpha alnum*
     """
-    i = 0
     tokens = []
-    while i < len(s):
-        c = s[i]
-
-        # Skip spaces
-        if c.isspace():
-            pass
-
-        # Skip comments
-        elif c == "#":
-            while s[i] != "\n":
-                i += 1
-
-        # Operators and punctuation
-        elif c == "=":
-            tokens.append(tok(TOK_EQ, None))
-        elif c == "+":
-            tokens.append(tok(TOK_PLUS, None))
-        elif c == "-":
-            tokens.append(tok(TOK_MINUS, None))
-        elif c == "*":
-            tokens.append(tok(TOK_STAR, None))
-        elif c == "/":
-            tokens.append(tok(TOK_SLASH, None))
-        elif c == "(":
-            tokens.append(tok(TOK_LPAREN, None))
-        elif c == ")":
-            tokens.append(tok(TOK_RPAREN, None))
-        elif c == ":":
-            tokens.append(tok(TOK_COLON, None))
-        elif c == ";":
-            tokens.append(tok(TOK_SEMI, None))
-        elif c == ">":
-            tokens.append(tok(TOK_GTHAN, None))
-        elif c == "<":
-            tokens.append(tok(TOK_LTHAN, None))
-
-        # Integer and float literals
-        elif c.isdigit():
-            num = ""
-            while s[i].isdigit():
-                num += s[i]
-                i += 1
-            if s[i] == ".":
-                num += "."
-                i += 1
-                while s[i].isdigit():
-                    num += s[i]
-                    i += 1
-                tokens.append(tok(TOK_FLOAT, float(num)))
-            else:
-                tokens.append(tok(TOK_INT, int(num)))
-            i -= 1  # Read one char too many, readjust.
-
-        # Identifiers and keywords
-        elif c.isalpha() or c == "_":
-            ident = ""
-            while s[i].isalnum() or s[i] == "_":
-                ident += s[i]
-                i += 1
-            i -= 1  # Read one char too many, readjust.
-            if ident == "print":
-                tokens.append(tok(TOK_PRINT, None))
-            elif ident == "return":
-                tokens.append(tok(TOK_RETURN, None))
-            elif ident == "read":
-                tokens.append(tok(TOK_READ, None))
-            elif ident == "var":
-                tokens.append(tok(TOK_VAR, None))
-            elif ident == "while":
-                tokens.append(tok(TOK_WHILE, None))
-            elif ident == "do":
-                tokens.append(tok(TOK_DO, None))
-            elif ident == "done":
-                tokens.append(tok(TOK_DONE, None))
-            elif ident in ("int", "float"):
-                tokens.append(tok(TOK_TYPE, ident))
-            else:
-                tokens.append(tok(TOK_ID, ident))
-        else:
-            error("invalid character: %r" % c)
-        i += 1
+    line = 0
+    for text in s.split("\n"):
+        line += 1
+        lex_line(text, line, tokens)
     return tokens
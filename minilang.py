@@ -22,32 +22,311 @@
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 
+import argparse
+import os
 import sys
-from lexical_analyzer import lex
-from parser import parse
-from build_symbol_table import build_symtab
-from typecheck import typecheck
-from codegen import codegen
-from tac_gen import tac_gen
+import time
+from optimize import PIPELINES
+from vm import exit_status, run
+from pygen import PyProgram
+from cache import CompileCache, UnsafeCacheError, check_directory
+from compiler import compile_source, front_end, back_end
+from error import CompileError
+from incremental import IncrementalCompiler, watch
+from vectorize import run_lanes
+from instrument import Instrumentation, NO_INSTRUMENTATION
+from batch import find_sources, compile_batch, write_summary
+from native import C_OPT_LEVELS, BinaryCache, NativeProgram, cc_command, as_command
+from stream import compile_stream, open_source
+from codegen import PROFILE_PATH
+from profiling import read_profile, format_report
+
+
+def report_phases(instr, args):
+    """Print or save the measurements of the phases, if they were asked for."""
+    if args.time_passes:
+        sys.stderr.write("\n".join(instr.format_table()) + "\n")
+    if args.time_passes_json:
+        with open(args.time_passes_json, "w") as f:
+            f.write(instr.to_json() + "\n")
+
+
+def run_native(src, args, cache, instr):
+    """
+    Compile src to an executable with the C compiler (from C code, or
+    from assembly with --backend asm), run it and exit.  Executables are
+    cached under the native/ directory of the cache, so running the same
+    program again does not run the C compiler.
+    """
+    text, stats = compile_source(src, args.backend, args.opt_level, cache, instr, args.profile)
+    if args.backend == "asm":
+        command = as_command(args.cc)
+    else:
+        command = cc_command(args.cc, args.cc_opt)
+    binaries = None
+    if cache is not None:
+        binaries = BinaryCache(os.path.join(cache.directory, "native"), cache.max_bytes)
+    with instr.phase("cc"):
+        program = NativeProgram(text, command, binaries)
+    try:
+        with instr.phase("run") as record:
+            start = time.perf_counter()
+            if args.batch:
+                inputs = sys.stdin.readlines()
+                results = program.run_batch(inputs)
+                sys.stdout.writelines(" ".join(out.split()) + "\n" for status, out in results)
+                status = 0
+                record.items, record.unit = len(inputs), "runs"
+            else:
+                status, out = program.run()
+                results = [(status, out)]
+            run_seconds = time.perf_counter() - start
+    finally:
+        program.close()
+    sys.stderr.write("native: cc %.3fs%s, run %.3fs (%d run%s)\n" % (
+        program.compile_seconds, " (cached)" if program.cached else "",
+        run_seconds, len(results), "" if len(results) == 1 else "s"))
+    if args.profile:
+        sites = read_profile(os.environ.get("MINILANG_PROFILE", PROFILE_PATH))
+        sys.stderr.write("\n".join(format_report(src, sites)) + "\n")
+    if cache is not None and args.cache_stats:
+        sys.stderr.write("cache: %d hits, %d misses\n" % (cache.hits, cache.misses))
+        sys.stderr.write("executables: %d hits, %d misses\n" % (binaries.hits, binaries.misses))
+    report_phases(instr, args)
+    sys.exit(status)
+
+
+def watch_file(args):
+    """Print the output of the mode for the file, and again whenever it changes."""
+    compiler = IncrementalCompiler()
+
+    def recompile(src):
+        start = time.perf_counter()
+        try:
+            entry = compiler.update(src)
+            text, stats = back_end(entry, args.mode, args.opt_level)
+        except CompileError as e:
+            print_errors(e.diagnostics)
+            sys.stdout.flush()
+            return
+        front = len(compiler.fragments)
+        sys.stdout.write(text)
+        sys.stdout.flush()
+        sys.stderr.write("compiled in %.1f ms (%d of %d fragments lexed, %d checked)\n" % (
+            (time.perf_counter() - start) * 1000, compiler.relexed, front,
+            compiler.rechecked))
+
+    try:
+        watch(args.files[0], recompile)
+    except KeyboardInterrupt:
+        sys.exit(0)
 
 
 def main():
-    # src = sys.stdin.read()
-    src = open('./demos/conditional.mini', 'r').read()
-    toks = lex(src)  # source -> tokens
-    ast = parse(toks)  # tokens -> AST
-    symtab = build_symtab(ast)  # AST -> symbol table
-    typed_ast = typecheck(ast, symtab)  # AST * symbol table -> Typed AST
+    if sys.version_info < (3, 7):
+        sys.exit("minilang.py needs Python 3.7 or later")
+    argparser = argparse.ArgumentParser(description="Compile a mini program.")
+    argparser.add_argument(
+        "mode", nargs="?", default="c", choices=("c", "tac", "asm", "py", "run", "native"),
+        help="output C code (the default), three-address code, x86-64 "
+             "assembly or Python code, run the program, or compile it with "
+             "the C compiler and run the executable")
+    argparser.add_argument(
+        "files", nargs="*", metavar="file",
+        help="the mini programs, or directories of *.mini files (default: stdin)")
+    argparser.add_argument(
+        "--engine", choices=("vm", "py", "numpy"), default="vm",
+        help="what runs the program in run mode: the bytecode VM (the "
+             "default), the Python code of py mode, or NumPy, running the "
+             "program once for every line of stdin (the inputs of one run) "
+             "and printing the output of every run on one line")
+    argparser.add_argument(
+        "-O", dest="opt_level", type=int, choices=sorted(PIPELINES), default=2,
+        help="optimization level of the TAC, C and assembly outputs: 0 for none, 1 for "
+             "local optimizations, 2 to also optimize loops (the default), 3 "
+             "to also compute at compile time what does not depend on the "
+             "input (in every mode) and optimize globally in SSA form")
+    argparser.add_argument(
+        "--cc", default=None,
+        help="the C compiler of native mode (default: $CC, or cc)")
+    argparser.add_argument(
+        "--cc-opt", choices=C_OPT_LEVELS, default="2",
+        help="optimization level given to the C compiler in native mode "
+             "(default: 2)")
+    argparser.add_argument(
+        "--backend", choices=("c", "asm"), default="c",
+        help="what native mode gives the C compiler: C code (the default), "
+             "or x86-64 assembly, which it only has to assemble and link")
+    argparser.add_argument(
+        "--batch", action="store_true",
+        help="in native mode, run the executable once for every line of "
+             "stdin (the inputs of one run) and print the output of every "
+             "run on one line")
+    argparser.add_argument(
+        "--stats", action="store_true",
+        help="print how many C temporaries were needed before and after "
+             "they were pooled (c mode) on stderr")
+    argparser.add_argument(
+        "--cache-dir", default=os.environ.get("MINILANG_CACHE_DIR"),
+        help="directory of the compilation cache (default: $MINILANG_CACHE_DIR; "
+             "no caching if neither is set)")
+    argparser.add_argument(
+        "--cache-size", type=int, default=64,
+        help="maximum size of the compilation cache, in MB (default: 64)")
+    argparser.add_argument(
+        "--cache-stats", action="store_true",
+        help="print the cache hits and misses on stderr")
+    argparser.add_argument(
+        "-o", "--output-dir",
+        help="compile every file to its own output file in this directory "
+             "(default: next to each source, when there are several)")
+    argparser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1,
+        help="number of processes compiling files in parallel (default: "
+             "the number of CPUs)")
+    argparser.add_argument(
+        "--watch", action="store_true",
+        help="compile the file again every time it changes, only redoing "
+             "the work that depends on the statements that changed, and "
+             "print how long it took on stderr")
+    argparser.add_argument(
+        "--stream", action="store_true",
+        help="compile the file one top-level statement at a time, reading "
+             "it from a memory map, so that memory does not grow with the "
+             "size of the program (C and TAC code only; the statements are "
+             "optimized one by one, without partial evaluation)")
+    argparser.add_argument(
+        "--profile", action="store_true",
+        help="make the C or TAC code count how many times every statement "
+             "and loop runs and time the loops, and save the profile to "
+             "$MINILANG_PROFILE or %s when it exits (see profiling.py); "
+             "native mode prints the profile on stderr" % PROFILE_PATH)
+    argparser.add_argument(
+        "--time-passes", action="store_true",
+        help="print the wall time, CPU time, peak memory and output size of "
+             "every phase on stderr (tracing the memory slows the phases down)")
+    argparser.add_argument(
+        "--time-passes-json", metavar="PATH",
+        help="write the measurements of --time-passes to PATH as JSON")
+    args = argparser.parse_intermixed_args()
+    cache_bytes = args.cache_size * 1024 * 1024
+    if args.cache_dir:
+        try:
+            check_directory(args.cache_dir)
+        except UnsafeCacheError as e:
+            argparser.error(str(e))
+
+    batch = (len(args.files) > 1 or args.output_dir is not None
+             or any(os.path.isdir(path) for path in args.files))
+    if batch:
+        if args.mode in ("run", "native"):
+            argparser.error("%s mode takes a single file" % args.mode)
+        if args.time_passes or args.time_passes_json:
+            argparser.error("--time-passes takes a single file")
+        if args.watch:
+            argparser.error("--watch takes a single file")
+        if args.stream:
+            argparser.error("--stream takes a single file")
+        if args.profile:
+            argparser.error("--profile takes a single file")
+        jobs = find_sources(args.files, args.mode, args.output_dir)
+        workers = max(1, min(args.jobs, len(jobs)))
+        start = time.perf_counter()
+        results = compile_batch(jobs, args.mode, args.opt_level, workers,
+                                args.cache_dir, cache_bytes)
+        failed = write_summary(results, time.perf_counter() - start, workers, sys.stderr)
+        if args.cache_dir and args.cache_stats:
+            sys.stderr.write("cache: %d hits, %d misses\n" % (
+                sum(r.hits for r in results), sum(r.misses for r in results)))
+        sys.exit(1 if failed else 0)
+
+    if args.profile:
+        if args.mode not in ("c", "tac", "native") or args.backend != "c" \
+                or args.watch or args.stream:
+            argparser.error("--profile compiles a program to C or TAC code, "
+                            "or runs it from C code in native mode")
+        if args.batch:
+            argparser.error("--profile runs the program once")
+
+    if args.watch:
+        if not args.files or args.mode in ("run", "native"):
+            argparser.error("--watch compiles a file to C, TAC or Python code")
+        watch_file(args)
+
+    instr = NO_INSTRUMENTATION
+    if args.time_passes or args.time_passes_json:
+        instr = Instrumentation(trace_memory=True)
+
+    if args.stream:
+        if not args.files or args.mode not in ("c", "tac"):
+            argparser.error("--stream compiles a file to C or TAC code")
+        with open_source(args.files[0]) as buf:
+            compile_stream(buf, args.mode, args.opt_level, sys.stdout, instr)
+        report_phases(instr, args)
+        sys.exit(0)
+
+    if args.files:
+        with open(args.files[0]) as f:
+            src = f.read()
+    else:
+        src = sys.stdin.read()
+
+    cache = None
+    if args.cache_dir:
+        cache = CompileCache(args.cache_dir, cache_bytes)
+    if args.mode == "run" and args.engine == "numpy":
+        entry = front_end(src, instr)
+        with instr.phase("read_lanes"):
+            inputs = [[float(x) for x in line.split()] for line in sys.stdin]
+        with instr.phase("run") as record:
+            results = run_lanes(entry["typed_ast"], entry["symtab"], inputs)
+            record.items, record.unit = len(inputs), "lanes"
+        sys.stdout.writelines(" ".join(results.output(lane)) + "\n" for lane in range(len(inputs)))
+        if results.errors.any():
+            sys.stderr.write("division by zero in %d lanes\n" % results.errors.sum())
+        report_phases(instr, args)
+        sys.exit(0)
+
+    if args.mode == "native":
+        run_native(src, args, cache, instr)
+
+    mode = args.mode
+    if mode == "run" and args.engine == "py":
+        mode = "py"
+    output = compile_source(src, mode, args.opt_level, cache, instr, args.profile)
+    if cache is not None and args.cache_stats:
+        sys.stderr.write("cache: %d hits, %d misses\n" % (cache.hits, cache.misses))
 
-    print("\nTAC Equivalent\n==================================")
-    tac_gen(typed_ast, symtab)  # Typed AST * symbol table -> TAC Code
+    if args.mode == "run":
+        if args.engine == "py":
+            with instr.phase("compile"):
+                program = PyProgram(output[0])
+            with instr.phase("run"):
+                status = program()
+        else:
+            with instr.phase("run"):
+                status = run(output)
+        report_phases(instr, args)
+        sys.exit(exit_status(status))
+    text, stats = output
+    sys.stdout.write(text)
+    if args.stats and "temps_before" in stats:
+        sys.stderr.write("temporaries: %d before allocation, %d after\n" % (
+            stats["temps_before"], stats["temps_after"]))
+    report_phases(instr, args)
 
-    # print("\nC Equivalent\n==================================")
-    # codegen(typed_ast, symtab)  # Typed AST * symbol table -> C code
 
-    # print("\nExecuting Code\n==================================")
-    # codegen()
+def print_errors(diagnostics):
+    for msg in diagnostics:
+        print("Error: " + msg)
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except CompileError as e:
+        print_errors(e.diagnostics)
+        sys.exit(1)
+    except ZeroDivisionError:
+        print_errors(["division by zero"])
+        sys.exit(1)
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from cache import CompileCache
+from error import error
+
+
+C_OPT_LEVELS = ("0", "1", "2", "3", "s")
+
+
+def cc_command(cc=None, opt="2"):
+    """Return the command line that compiles C code, without its file arguments."""
+    if cc is None:
+        cc = os.environ.get("CC", "cc")
+    return [cc, "-O" + opt, "-w", "-x", "c"]
+
+
+def as_command(cc=None):
+    """
+    Return the command line that assembles and links the code of
+    asmgen.py, without its file arguments: the C compiler driver runs
+    the assembler and links with the C library.
+    """
+    if cc is None:
+        cc = os.environ.get("CC", "cc")
+    return [cc, "-x", "assembler"]
+
+
+class BinaryCache(CompileCache):
+    """
+    A cache of the executables built from generated C code or assembly,
+    stored on disk next to the compilation cache.  An executable is
+    keyed on a hash of the code, of the compiler command line, and of the path
+    and modification time of the C compiler, so that upgrading the
+    compiler does not reuse stale binaries.  It is evicted like the
+    entries of a CompileCache.
+    """
+
+    SUFFIX = ".bin"
+
+    def key(self, source, command):
+        h = hashlib.sha256()
+        cc = shutil.which(command[0]) or command[0]
+        try:
+            mtime = os.stat(cc).st_mtime
+        except OSError:
+            mtime = 0
+        h.update(("%s\0%r\0%s\0" % (cc, mtime, "\0".join(command))).encode("utf-8"))
+        h.update(source.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key):
+        """Return the path of the executable stored under key, or None."""
+        path = self.path(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            self.count(False)
+            return None
+        self.count(True)
+        return path
+
+    def put(self, key, executable):
+        """Move the executable at the given path into the cache, and return its new path."""
+        path = self.path(key)
+        self.replace(executable, path, os.stat(executable).st_size)
+        return path
+
+
+def build(source, command, directory):
+    """
+    Compile source with the command from cc_command() (C code) or
+    as_command() (assembly) into an executable in directory, and
+    return its path.
+    """
+    fd, exe = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        proc = subprocess.run(command + ["-o", exe, "-"], input=source,
+                              universal_newlines=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT)
+    except OSError as e:
+        os.remove(exe)
+        error("cannot run the C compiler %s: %s" % (command[0], e.strerror))
+    if proc.returncode != 0:
+        os.remove(exe)
+        error("the C compiler failed:\n%s" % proc.stdout)
+    return exe
+
+
+class NativeProgram(object):
+    """
+    A mini program compiled to a native executable.
+
+    `path` is the executable, `compile_seconds` the time spent in the C
+    compiler (0 when the executable came from the cache) and `cached`
+    tells whether it did.  Without a cache, the executable lives in a
+    temporary directory that close() removes.
+    """
+
+    __slots__ = ("path", "compile_seconds", "cached", "tmpdir")
+
+    def __init__(self, source, command, cache=None):
+        self.tmpdir = None
+        self.compile_seconds = 0.0
+        key = None
+        if cache is not None:
+            key = cache.key(source, command)
+            self.path = cache.get(key)
+            if self.path is not None:
+                self.cached = True
+                return
+            directory = cache.directory
+        else:
+            self.tmpdir = directory = tempfile.mkdtemp(prefix="minilang-")
+        self.cached = False
+        start = time.perf_counter()
+        try:
+            self.path = build(source, command, directory)
+        except BaseException:
+            self.close()
+            raise
+        self.compile_seconds = time.perf_counter() - start
+        if cache is not None:
+            self.path = cache.put(key, self.path)
+
+    def run(self, stdin=None):
+        """
+        Run the program with the given text as stdin, and return (status,
+        stdout).  Without a text, the program reads and writes the
+        standard streams of this process, and stdout is None.
+        """
+        if stdin is None:
+            return subprocess.run([self.path]).returncode, None
+        proc = subprocess.run([self.path], input=stdin, universal_newlines=True,
+                              stdout=subprocess.PIPE)
+        return proc.returncode, proc.stdout
+
+    def run_batch(self, inputs):
+        """Run the program once per input text, and return the list of (status, stdout)."""
+        return [self.run(stdin) for stdin in inputs]
+
+    def close(self):
+        if self.tmpdir is not None:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            self.tmpdir = None
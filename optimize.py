@@ -0,0 +1,858 @@
+import math
+
+from ssa import to_ssa
+from tac_gen import BINOPS, Quad, to_float32
+
+
+# Registry of the optimization passes, by name.  A pass is a function
+# that takes a TacProgram, transforms its quads in place and returns
+# True if it changed anything.
+PASSES = {}
+
+
+def register_pass(name):
+    """Decorator adding a pass to the registry under the given name."""
+    def register(fn):
+        PASSES[name] = fn
+        return fn
+    return register
+
+
+class PassManager(object):
+    """
+    Runs a pipeline of optimization passes over a TacProgram.
+
+    The pipeline is a list of pass names (looked up in PASSES) or of
+    pass functions.  It is run repeatedly until no pass changes the
+    program anymore, or until max_rounds rounds have been run.
+    """
+
+    def __init__(self, passes=None, max_rounds=10):
+        if passes is None:
+            passes = DEFAULT_PIPELINE
+        self.passes = [PASSES[p] if isinstance(p, str) else p for p in passes]
+        self.max_rounds = max_rounds
+
+    def add(self, p):
+        self.passes.append(PASSES[p] if isinstance(p, str) else p)
+
+    def run(self, prog):
+        for _ in range(self.max_rounds):
+            changed = False
+            for p in self.passes:
+                if p(prog):
+                    changed = True
+            if not changed:
+                break
+        return prog
+
+
+def is_const(x):
+    return isinstance(x, (int, float))
+
+
+def wrap_int(value):
+    """Wrap an integer around like a 32-bit C int."""
+    return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+
+def fold(op, ty, a, b):
+    """
+    Return the value of `a op b` computed like the C program would, or
+    None if it can't be computed at compile time.
+    """
+    if op == "/" and b == 0:
+        return None
+    if op == "<":
+        value = a < b
+    elif op == ">":
+        value = a > b
+    elif op == "+":
+        value = a + b
+    elif op == "-":
+        value = a - b
+    elif op == "*":
+        value = a * b
+    elif ty == "int":
+        # C truncates towards zero, Python floors.
+        value = abs(a) // abs(b)
+        if (a < 0) != (b < 0):
+            value = -value
+    else:
+        value = a / b
+    if ty == "int":
+        return wrap_int(int(value))
+    value = to_float32(float(value))
+    if not math.isfinite(value):
+        # C has no literal for an infinity or a NaN: leave it to run time.
+        return None
+    return value
+
+
+@register_pass("constant-folding")
+def constant_folding(prog):
+    """
+    Replace operations whose operands are all constants by their
+    result, and conditional jumps on a constant by a jump or nothing.
+    Additions of a negative constant become subtractions.
+    """
+    changed = False
+    quads = []
+    for q in prog.quads:
+        if q.op in BINOPS and is_const(q.arg1) and is_const(q.arg2):
+            value = fold(q.op, prog.types[q.dst], q.arg1, q.arg2)
+            if value is not None:
+                q = Quad("=", q.dst, value)
+                changed = True
+        elif q.op in ("+", "-") and is_const(q.arg2) and q.arg2 < 0 and q.arg2 != -0x80000000:
+            # x + -c  =>  x - c
+            q = Quad("-" if q.op == "+" else "+", q.dst, q.arg1, -q.arg2)
+            changed = True
+        elif q.op == "ifz" and is_const(q.arg1):
+            changed = True
+            if q.arg1 == 0:
+                q = Quad("goto", arg1=q.arg2)
+            else:
+                continue
+        quads.append(q)
+    prog.quads = quads
+    return changed
+
+
+@register_pass("copy-propagation")
+def copy_propagation(prog):
+    """
+    After a copy `x = y` (where y is a name or a constant), replace the
+    uses of x by y until either x or y is assigned again.  Facts are
+    forgotten at labels, where control flow from elsewhere joins in;
+    they stay valid across a conditional jump.
+    """
+    changed = False
+
+    # A temporary assigned once, with a constant, holds that constant
+    # everywhere it is used, even across labels (this happens to the
+    # constants hoisted out of loops).
+    defs = count_defs(prog.quads)
+    consts = {}
+    for q in prog.quads:
+        if q.op == "=" and is_const(q.arg1) and defs[q.dst] == 1 and prog.is_temp(q.dst):
+            consts[q.dst] = q.arg1
+
+    copies = {}     # x -> y
+    copied_by = {}  # y -> set of the x such that copies[x] == y
+
+    def kill(name):
+        y = copies.pop(name, None)
+        if y is not None and not is_const(y):
+            copied_by[y].discard(name)
+        for x in copied_by.pop(name, ()):
+            del copies[x]
+
+    for q in prog.quads:
+        op = q.op
+        if op == "label":
+            copies.clear()
+            copied_by.clear()
+            continue
+        if op in BINOPS or op in ("=", "ifz", "print", "return"):
+            if q.arg1 in copies:
+                q.arg1 = copies[q.arg1]
+                changed = True
+            elif q.arg1 in consts:
+                q.arg1 = consts[q.arg1]
+                changed = True
+            if op in BINOPS:
+                if q.arg2 in copies:
+                    q.arg2 = copies[q.arg2]
+                    changed = True
+                elif q.arg2 in consts:
+                    q.arg2 = consts[q.arg2]
+                    changed = True
+        if q.dst is not None and op != "label":
+            kill(q.dst)
+            if op == "=" and q.arg1 != q.dst:
+                copies[q.dst] = q.arg1
+                if not is_const(q.arg1):
+                    copied_by.setdefault(q.arg1, set()).add(q.dst)
+    return changed
+
+
+@register_pass("dead-temporaries")
+def dead_temporaries(prog):
+    """
+    Remove the quads computing a temporary that is never used.  Only
+    temporaries are considered: a variable may be printed, read or
+    returned later on, and its assignments are kept.
+    """
+    uses = {}
+    for q in prog.quads:
+        for x in (q.arg1, q.arg2):
+            if isinstance(x, str):
+                uses[x] = uses.get(x, 0) + 1
+        if q.op == "djnz":
+            uses[q.dst] = uses.get(q.dst, 0) + 1
+
+    changed = False
+    live = []
+    # Walk backwards, so that removing a quad can make the quads that
+    # compute its operands dead too.
+    for q in reversed(prog.quads):
+        if (q.op in BINOPS or q.op == "=") and prog.is_temp(q.dst) and not uses.get(q.dst):
+            for x in (q.arg1, q.arg2):
+                if isinstance(x, str):
+                    uses[x] -= 1
+            changed = True
+            continue
+        live.append(q)
+    live.reverse()
+    prog.quads = live
+    return changed
+
+
+DEFAULT_PIPELINE = ["constant-folding", "copy-propagation", "dead-temporaries"]
+
+
+def optimize(prog, passes=None):
+    """Run the given passes (the default pipeline if None) over prog."""
+    return PassManager(passes).run(prog)
+
+
+# Loop optimizations
+#
+# tac_gen() lowers every while loop to
+#
+#     L1:                      <- header label
+#     ...condition...
+#     ifz t goto L2
+#     ...body...
+#     goto L1                  <- back jump
+#     L2:                      <- exit label
+#
+# The passes below find the loops of a program by their back jumps and
+# insert the code that must run once before the loop (the preheader)
+# just before the header label, which is only reached by falling
+# through from the code before the loop and by the back jump.
+
+JUMPS = ("goto", "ifz", "djnz")
+
+
+def jump_target(q):
+    if q.op == "ifz":
+        return q.arg2
+    return q.arg1
+
+
+class Loop(object):
+    """
+    A loop of a TAC program: quads[head] is its header label and
+    quads[back] the jump back to it.  `defs` is the set of the names
+    assigned anywhere inside the loop, and `children` the loops nested
+    directly inside it.
+    """
+
+    __slots__ = ("head", "back", "defs", "children")
+
+    def __init__(self, head, back):
+        self.head = head
+        self.back = back
+        self.defs = set()
+        self.children = []
+
+    def top_level(self):
+        """Yield the indices of the quads of the loop that are not inside a nested loop."""
+        i = self.head + 1
+        for child in self.children:
+            while i < child.head:
+                yield i
+                i += 1
+            i = child.back + 1
+        while i < self.back:
+            yield i
+            i += 1
+
+
+def find_loops(quads):
+    """
+    Return the outermost loops of a list of quads (nested loops are
+    reachable through their `children`), or None if the control flow
+    is not made of properly nested loops that are only entered through
+    their header and only left through the label after their back jump.
+    """
+    labels = {}
+    for i, q in enumerate(quads):
+        if q.op == "label":
+            labels[q.dst] = i
+
+    loops = []
+    for i, q in enumerate(quads):
+        if q.op in JUMPS:
+            h = labels[jump_target(q)]
+            if h < i:
+                if i + 1 >= len(quads) or quads[i + 1].op != "label":
+                    return None
+                loops.append(Loop(h, i))
+    loops.sort(key=lambda loop: (loop.head, -loop.back))
+
+    # Nest the loops, checking that they are properly nested.
+    roots = []
+    stack = []
+    for loop in loops:
+        while stack and stack[-1].back < loop.head:
+            stack.pop()
+        if stack:
+            if loop.back > stack[-1].back:
+                return None
+            stack[-1].children.append(loop)
+        else:
+            roots.append(loop)
+        stack.append(loop)
+
+    # Check that every jump into or out of a loop goes through its
+    # header or its exit label.
+    innermost = [None] * len(quads)
+    for loop in loops:
+        for i in range(loop.head, loop.back + 1):
+            innermost[i] = loop
+            q = quads[i]
+            if q.dst is not None and q.op != "label":
+                loop.defs.add(q.dst)
+            if q.op in JUMPS:
+                t = labels[jump_target(q)]
+                if not (loop.head <= t <= loop.back + 1):
+                    return None
+    for i, q in enumerate(quads):
+        if q.op in JUMPS:
+            loop = innermost[labels[jump_target(q)]]
+            if loop is not None and not (loop.head <= i <= loop.back):
+                return None
+    return roots
+
+
+def all_loops(roots):
+    """Return every loop of the tree rooted at roots, innermost loops first."""
+    result = []
+    stack = [(loop, False) for loop in roots]
+    while stack:
+        loop, expanded = stack.pop()
+        if expanded:
+            result.append(loop)
+        else:
+            stack.append((loop, True))
+            stack.extend((child, False) for child in loop.children)
+    return result
+
+
+def count_defs(quads):
+    defs = {}
+    for q in quads:
+        if q.dst is not None and q.op != "label":
+            defs[q.dst] = defs.get(q.dst, 0) + 1
+    return defs
+
+
+def rebuild(quads, before, replace):
+    """
+    Return a copy of quads where the quads listed in before[i] are
+    inserted before quads[i], and quads[i] is replaced by the list of
+    quads replace[i].
+    """
+    result = []
+    for i, q in enumerate(quads):
+        if i in before:
+            result.extend(before[i])
+        if i in replace:
+            result.extend(replace[i])
+        else:
+            result.append(q)
+    return result
+
+
+@register_pass("loop-invariant-code-motion")
+def loop_invariant_code_motion(prog):
+    """
+    Move the computations of a loop whose operands do not change while
+    the loop runs to its preheader, so they are done once instead of
+    once per iteration.  Only temporaries that are assigned exactly once
+    are moved, and divisions only when the divisor is a non-zero
+    constant, since the moved code also runs when the loop runs zero
+    times.  Every loop only considers the quads that are not inside a
+    nested loop: the code hoisted out of a nested loop lands in the
+    enclosing loop and is considered again by the next round.
+    """
+    roots = find_loops(prog.quads)
+    if not roots:
+        return False
+    quads = prog.quads
+    defs = count_defs(quads)
+    before = {}
+    replace = {}
+    for loop in all_loops(roots):
+        hoisted = set()
+
+        def invariant(x):
+            return is_const(x) or x not in loop.defs or x in hoisted
+
+        for i in loop.top_level():
+            q = quads[i]
+            if (q.op in BINOPS or q.op == "=") and prog.is_temp(q.dst) \
+                    and defs[q.dst] == 1 and invariant(q.arg1) \
+                    and (q.arg2 is None or invariant(q.arg2)) \
+                    and not (q.op == "/" and not (is_const(q.arg2) and q.arg2 != 0)):
+                hoisted.add(q.dst)
+                before.setdefault(loop.head, []).append(q)
+                replace[i] = []
+    if not replace:
+        return False
+    prog.quads = rebuild(quads, before, replace)
+    return True
+
+
+@register_pass("strength-reduction")
+def strength_reduction(prog):
+    """
+    Replace the multiplications of an induction variable by a constant
+    or a loop invariant with additions.
+
+    A basic induction variable of a loop is an int variable i whose
+    only assignment in the loop is `i = i + c` or `i = i - c` (c a
+    constant), outside of any nested loop.  For every `t = i * k` in
+    the loop, a new variable s is set to i * k in the preheader and
+    kept equal to it by adding c * k to it right after i is updated, and
+    the multiplication becomes `t = s`.
+    """
+    roots = find_loops(prog.quads)
+    if not roots:
+        return False
+    quads = prog.quads
+    before = {}
+    replace = {}
+    for loop in all_loops(roots):
+        ivs = {}
+        seen = set()
+        for i in loop.top_level():
+            q = quads[i]
+            if q.dst is None or q.op == "label":
+                continue
+            if q.dst in seen:
+                ivs.pop(q.dst, None)
+                continue
+            seen.add(q.dst)
+            if q.op in ("+", "-") and q.arg1 == q.dst and isinstance(q.arg2, int) \
+                    and prog.types[q.dst] == "int":
+                ivs[q.dst] = (i, q.arg2 if q.op == "+" else -q.arg2)
+            elif q.op == "djnz":
+                ivs[q.dst] = (i, -1)
+        # An induction variable must not be assigned in nested loops.
+        for child in loop.children:
+            for name in child.defs:
+                ivs.pop(name, None)
+
+        for i in loop.top_level():
+            q = quads[i]
+            if q.op != "*" or i in replace or prog.types[q.dst] != "int":
+                continue
+            if q.arg1 in ivs and (is_const(q.arg2) or q.arg2 not in loop.defs):
+                iv, k = q.arg1, q.arg2
+            elif q.arg2 in ivs and (is_const(q.arg1) or q.arg1 not in loop.defs):
+                iv, k = q.arg2, q.arg1
+            else:
+                continue
+            update, step = ivs[iv]
+            s = prog.new_temp("int")
+            preheader = before.setdefault(loop.head, [])
+            preheader.append(Quad("*", s, iv, k))
+            if is_const(k):
+                increment = wrap_int(step * k)
+            else:
+                increment = prog.new_temp("int")
+                preheader.append(Quad("*", increment, k, step))
+            replace[i] = [Quad("=", q.dst, s)]
+            if is_const(increment) and increment < 0:
+                bump = Quad("-", s, s, -increment)
+            else:
+                bump = Quad("+", s, s, increment)
+            if quads[update].op == "djnz":
+                # The update is also the jump back: bump s just before.
+                replace[update] = replace.get(update, [quads[update]])
+                replace[update].insert(len(replace[update]) - 1, bump)
+            else:
+                replace[update] = replace.get(update, [quads[update]]) + [bump]
+    if not replace:
+        return False
+    prog.quads = rebuild(quads, before, replace)
+    return True
+
+
+@register_pass("countdown-loops")
+def countdown_loops(prog):
+    """
+    Rotate countdown loops so they test their counter once per
+    iteration, at the bottom.  A loop of the shape
+
+        L1:                        ifz n goto L2
+        ifz n goto L2              L3:
+        ...body...           =>    ...body...
+        n = n - 1                  djnz n goto L3
+        goto L1                    L2:
+        L2:
+
+    where n is an int variable that the body only assigns with that
+    decrement, and that is not used after it, loses the test at the top
+    and the separate jump: `djnz n goto L` decrements n and jumps if the
+    result is not zero.
+    """
+    roots = find_loops(prog.quads)
+    if not roots:
+        return False
+    quads = prog.quads
+    before = {}
+    replace = {}
+    for loop in all_loops(roots):
+        h, g = loop.head, loop.back
+        test = quads[h + 1]
+        if quads[g].op != "goto" or test.op != "ifz" or not isinstance(test.arg1, str) \
+                or test.arg2 != quads[g + 1].dst or prog.types.get(test.arg1) != "int":
+            continue
+        n = test.arg1
+        if any(n in child.defs for child in loop.children):
+            continue
+        decrements = [i for i in loop.top_level() if quads[i].dst == n]
+        if len(decrements) != 1:
+            continue
+        d = decrements[0]
+        dec = quads[d]
+        if dec.op != "-" or dec.arg1 != n or dec.arg2 != 1:
+            continue
+        if any(n in (quads[i].arg1, quads[i].arg2) for i in range(d + 1, g)):
+            continue
+        body = prog.new_label()
+        replace[h] = [test, Quad("label", body)]
+        replace[h + 1] = []
+        replace[d] = []
+        replace[g] = [Quad("djnz", n, body)]
+    if not replace:
+        return False
+    prog.quads = rebuild(quads, before, replace)
+    return True
+
+
+LOOP_PIPELINE = ["loop-invariant-code-motion", "strength-reduction", "countdown-loops"]
+
+
+# Global optimizations
+#
+# The passes below analyze the whole program in SSA form (see ssa.py),
+# so they follow values from block to block and around loops, where
+# the passes above forget what they know at every label.  They then
+# change the quads of the program itself, which stays out of SSA form.
+
+# The lattice of sparse_conditional_constant_propagation: a value is
+# UNDEFINED until its definition is known to run, then a constant, or
+# VARYING once it is known not to be one.
+UNDEFINED = object()
+VARYING = object()
+
+
+def same_constant(a, b):
+    """Tell whether the constants a and b are the same (0.0 and -0.0 are not)."""
+    return a == b and (not isinstance(a, float) or math.copysign(1.0, a) == math.copysign(1.0, b))
+
+
+def meet(a, b):
+    if a is UNDEFINED:
+        return b
+    if b is UNDEFINED or a is b:
+        return a
+    if a is VARYING or b is VARYING or not same_constant(a, b):
+        return VARYING
+    return a
+
+
+@register_pass("sccp")
+def sparse_conditional_constant_propagation(prog):
+    """
+    Sparse conditional constant propagation (Wegman and Zadeck,
+    "Constant Propagation with Conditional Branches"): find the values
+    of the SSA form that are constants, and the blocks that can run,
+    assuming that a block only runs once a jump to it is known to be
+    taken.  So a variable set to the same constant before a loop and in
+    it is a constant in the loop, and the code under a condition that
+    is always false is dropped.
+
+    The names used as a constant are replaced by the constant, the
+    conditional jumps on a constant are resolved, and the quads of the
+    blocks that can't run are removed (their labels are kept).  The
+    values of the names when the program starts are not known.
+    """
+    quads = prog.quads
+    ssa = to_ssa(prog)
+    values = [UNDEFINED] * len(ssa.names)
+    for value in ssa.entry_values:
+        values[value] = VARYING
+    types = prog.types
+
+    # The phis and quads reading every value, with their block.
+    readers = [[] for _ in ssa.names]
+    for block in ssa.order:
+        for phi in block.phis:
+            for arg in phi.args:
+                if arg is not None:
+                    readers[arg].append((block, phi))
+        for i in range(block.start, block.end):
+            for value in ssa.uses[i]:
+                if value is not None:
+                    readers[value].append((block, i))
+
+    reached = set()
+    executable = set()
+    # The blocks that a jump was just found to reach, and the values
+    # that just went down the lattice: only what reads them is evaluated
+    # again.  Values only go down, so every value changes at most twice.
+    block_work = [ssa.blocks[0]]
+    value_work = []
+
+    def operand(x, value):
+        return x if value is None else values[value]
+
+    def lower(value, new):
+        """Lower values[value] to its meet with new."""
+        old = values[value]
+        new = meet(old, new)
+        if new is not old:
+            values[value] = new
+            value_work.append(value)
+
+    def follow(block, test):
+        """
+        Mark the edges from block taken when its last quad tests test:
+        the first successor of a conditional jump is its target, taken
+        when the test is 0.
+        """
+        if test is UNDEFINED:
+            return
+        if test is VARYING or test is None or len(block.succs) < 2:
+            succs = block.succs
+        elif test == 0:
+            succs = block.succs[:1]
+        else:
+            succs = block.succs[1:]
+        for succ in succs:
+            if (block.index, succ.index) not in executable:
+                executable.add((block.index, succ.index))
+                block_work.append(succ)
+
+    def visit_phi(block, phi):
+        value = UNDEFINED
+        for pred, arg in zip(block.preds, phi.args):
+            if (pred.index, block.index) in executable:
+                value = meet(value, values[arg])
+        if value is not UNDEFINED:
+            lower(phi.value, value)
+
+    def visit_quad(block, i):
+        q = quads[i]
+        op = q.op
+        uses = ssa.uses[i]
+        if op == "=":
+            value = operand(q.arg1, uses[0])
+        elif op in BINOPS:
+            a = operand(q.arg1, uses[0])
+            b = operand(q.arg2, uses[1])
+            if a is UNDEFINED or b is UNDEFINED:
+                value = UNDEFINED
+            elif a is VARYING or b is VARYING:
+                value = VARYING
+            else:
+                value = fold(op, types[q.dst], a, b)
+                if value is None or value != value:
+                    value = VARYING
+        elif op == "ifz":
+            follow(block, operand(q.arg1, uses[0]))
+            return
+        elif op == "djnz":
+            n = values[uses[0]]
+            value = n if n is UNDEFINED or n is VARYING else wrap_int(n - 1)
+            # The jump is taken when the new value is not 0.
+            follow(block, value if value is UNDEFINED or value is VARYING else int(value == 0))
+        elif op == "read":
+            value = VARYING
+        else:
+            return
+        if value is not UNDEFINED:
+            lower(ssa.defs[i], value)
+
+    while block_work or value_work:
+        if block_work:
+            block = block_work.pop()
+            for phi in block.phis:
+                visit_phi(block, phi)
+            if block.index not in reached:
+                reached.add(block.index)
+                for i in range(block.start, block.end):
+                    visit_quad(block, i)
+                if block.end == block.start or quads[block.end - 1].op not in ("ifz", "djnz"):
+                    follow(block, None)
+        else:
+            for block, reader in readers[value_work.pop()]:
+                if block.index not in reached:
+                    continue
+                if isinstance(reader, int):
+                    visit_quad(block, reader)
+                else:
+                    visit_phi(block, reader)
+
+    def constant(value):
+        return value is not None and values[value] is not UNDEFINED \
+            and values[value] is not VARYING
+
+    changed = False
+    result = []
+    for block in ssa.blocks:
+        if block.index not in reached:
+            for i in range(block.start, block.end):
+                if quads[i].op == "label":
+                    result.append(quads[i])
+                else:
+                    changed = True
+            continue
+        for i in range(block.start, block.end):
+            q = quads[i]
+            uses = ssa.uses[i]
+            if q.op != "djnz":
+                if uses and constant(uses[0]):
+                    q.arg1 = values[uses[0]]
+                    changed = True
+                if len(uses) > 1 and constant(uses[1]):
+                    q.arg2 = values[uses[1]]
+                    changed = True
+            if q.op == "ifz" and is_const(q.arg1):
+                changed = True
+                if q.arg1 != 0:
+                    continue
+                q = Quad("goto", arg1=q.arg2)
+            result.append(q)
+    prog.quads = result
+    return changed
+
+
+@register_pass("global-value-numbering")
+def global_value_numbering(prog):
+    """
+    Reuse the result of an operation when the same operation was done
+    on the same values before, on every path leading to it.
+
+    Value numbers are given to the values of the SSA form walking the
+    dominator tree, as in Briggs, Cooper and Simpson, "Value
+    Numbering": a copy has the number of what it copies, a phi whose
+    arguments all have the same number has that number, and an
+    operation has the number of the operation with the same operator
+    and operand numbers in a block that dominates it, if there is one.
+    Such an operation is redundant, and becomes a copy of a temporary
+    holding the result of the first one: its destination if it is a
+    temporary assigned once, or else a new temporary it now assigns
+    before copying it to its destination.  Only the int additions and
+    multiplications are taken to be commutative: with floats, the
+    operand that gives its sign to a NaN result would change.
+    """
+    quads = prog.quads
+    ssa = to_ssa(prog)
+    numbers = [None] * len(ssa.names)
+    const_numbers = {}
+    count = [0]
+
+    def new_number():
+        count[0] += 1
+        return count[0]
+
+    for value in ssa.entry_values:
+        numbers[value] = new_number()
+
+    def number_of(x, value):
+        if value is None:
+            key = (type(x), repr(x))
+            if key not in const_numbers:
+                const_numbers[key] = new_number()
+            return const_numbers[key]
+        return numbers[value]
+
+    # available maps an operation to its number and the quad that
+    # computed it first, in the blocks dominating the current one.
+    available = {}
+    redundant = {}
+    walk = [(ssa.order[0], None)]
+    while walk:
+        block, added = walk.pop()
+        if added is not None:
+            for key in added:
+                del available[key]
+            continue
+        added = []
+        phis = {}
+        for phi in block.phis:
+            if None in phi.args or None in [numbers[arg] for arg in phi.args]:
+                numbers[phi.value] = new_number()
+                continue
+            args = tuple(numbers[arg] for arg in phi.args)
+            if len(set(args)) == 1:
+                numbers[phi.value] = args[0]
+            else:
+                # Phis of the same block with the same arguments are equal.
+                numbers[phi.value] = phis.setdefault(args, new_number())
+        for i in range(block.start, block.end):
+            q = quads[i]
+            value = ssa.defs[i]
+            if q.op == "=":
+                numbers[value] = number_of(q.arg1, ssa.uses[i][0])
+            elif q.op in BINOPS:
+                uses = ssa.uses[i]
+                ty = prog.types[q.dst]
+                a = number_of(q.arg1, uses[0])
+                b = number_of(q.arg2, uses[1])
+                if q.op in ("+", "*") and ty == "int" and a > b:
+                    a, b = b, a
+                key = (q.op, ty, a, b)
+                if key in available:
+                    numbers[value], redundant[i] = available[key]
+                else:
+                    numbers[value] = new_number()
+                    available[key] = (numbers[value], i)
+                    added.append(key)
+            elif value is not None:
+                numbers[value] = new_number()
+        walk.append((block, added))
+        walk.extend((child, None) for child in reversed(block.children))
+
+    if not redundant:
+        return False
+    defs = count_defs(quads)
+    replace = {}
+    holders = {}
+    for i in sorted(redundant):
+        j = redundant[i]
+        first = quads[j]
+        if prog.is_temp(first.dst) and defs[first.dst] == 1:
+            holder = first.dst
+        elif j in holders:
+            holder = holders[j]
+        else:
+            holder = holders[j] = prog.new_temp(prog.types[first.dst])
+            replace[j] = [Quad(first.op, holder, first.arg1, first.arg2),
+                          Quad("=", first.dst, holder)]
+        replace[i] = [Quad("=", quads[i].dst, holder)]
+    prog.quads = rebuild(quads, {}, replace)
+    return True
+
+
+GLOBAL_PIPELINE = ["sccp", "global-value-numbering"]
+
+# The TAC passes of every optimization level.  Level 3 also evaluates
+# the program at compile time before TAC is generated (see
+# partial_eval.py and PARTIAL_EVAL_LEVEL), and runs the global passes,
+# which take several times longer than the others on large programs.
+PIPELINES = {
+    0: [],
+    1: DEFAULT_PIPELINE,
+    2: DEFAULT_PIPELINE + LOOP_PIPELINE,
+    3: DEFAULT_PIPELINE + GLOBAL_PIPELINE + LOOP_PIPELINE,
+}
+PARTIAL_EVAL_LEVEL = 3
@@ -0,0 +1,32 @@
+import sys
+
+
+CHUNK_LINES = 4096
+
+
+def write_lines(lines, out=None):
+    """
+    Input : an iterable of lines of text (without their newline), and
+            an output sink: a list, or a file-like object such as an
+            open file or an io.StringIO (default: sys.stdout)
+    Output: none
+
+    The lines are appended to a list sink as they are.  For a file-like
+    sink, they are joined into chunks of CHUNK_LINES lines, and every
+    chunk is written with a single write() call.
+    """
+    if out is None:
+        out = sys.stdout
+    if isinstance(out, list):
+        out.extend(lines)
+        return
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == CHUNK_LINES:
+            chunk.append("")
+            out.write("\n".join(chunk))
+            chunk = []
+    if chunk:
+        chunk.append("")
+        out.write("\n".join(chunk))
@@ -1,18 +1,35 @@
 from AST_NODES import *
 from TOKEN_TYPES import *
 from error import error
+from lexical_analyzer import VALUE, LINE
+from token_stream import TokenStream
+
+
+# The binary operators, by token type, with their precedence level.
+BINARY_OPERATORS = {
+    TOK_PLUS: ("+", 1), TOK_MINUS: ("-", 1),
+    TOK_STAR: ("*", 2), TOK_SLASH: ("/", 2),
+    TOK_LTHAN: ("<", 2), TOK_GTHAN: (">", 2),
+}
+PRECEDENCE = dict(BINARY_OPERATORS.values())
+
+# The tokens a statement can start with.
+STATEMENT_STARTS = (TOK_PRINT, TOK_RETURN, TOK_READ, TOK_ID, TOK_WHILE)
 
 
 def parse(toks):
     """
-    Input : a list of tokens
+    Input : a list or an iterator of tokens
     Output: a list of statement nodes
 
     parse(toks) is a predictive, recursive-descent parser that will
     return a list of AST nodes (declarations and statements) from the
-    token stream computer by lex() above.  We parse the tokens
+    token stream computed by lex() above.  We parse the tokens
     according to the following grammar.  Every non-terminal (left-hand
-    side of a ::=) has its own local function definition.
+    side of a ::=) has its own local function definition in
+    parse_stream(), except for expressions: expr, term and factor are
+    parsed together by a loop that keeps the pending operators on a
+    stack (see expr()).
 
         program  ::=  decls stmts
         decls    ::=  decl decls
@@ -35,58 +52,66 @@ def parse(toks):
                    |  int
                    |  float
 
-    The AST nodes are represented with dicts as follows:
+    The AST nodes are instances of the classes in AST_NODES:
     - Declarations
-        - var id: type         : { "nodetype": AST_DECL, "id": id, "type": type }
+        - var id: type         : Decl(id, type)
 
     - Statements
-        - id = expr            : { "nodetype": AST_ASSIGN, "lhs": id, "rhs": expr }
-        - print expr           : { "nodetype": AST_PRINT, "expr": expr }
-        - read id              : { "nodetype": AST_READ, "id": id }
-        - while e do stmts done: { "nodetype": AST_WHILE, "expr": e, "body": stmts }
+        - id = expr            : Assign(lhs=id, rhs=expr)
+        - print expr           : Print(expr)
+        - return expr          : Return(expr)
+        - read id              : Read(id)
+        - while e do stmts done: While(expr=e, body=stmts)
+
+      with the line of their first token in their `line` field.
 
     - Expressions
-        - int                  : { "nodetype": AST_INT, "value": int }
-        - float                : { "nodetype": AST_FLOAT, "value": float }
-        - id                   : { "nodetype": AST_ID, "name": id }
-        - e1 + e2              : { "nodetype": AST_BINOP, op: "+", "lhs": e1, "rhs": e2 }
+        - int                  : Int(value)
+        - float                : Float(value)
+        - id                   : Id(name)
+        - e1 + e2              : BinOp(op="+", lhs=e1, rhs=e2)
 
-    For example, here is a simple statement and its AST representation:
+    The whole program is a Program(decls, stmts).  For example, here is
+    a simple statement and its AST representation:
 
         x = 3 + y
 
-        {
-          "nodetype": AST_ASSIGN,
-          "lhs": "x",
-          "rhs": {
-            "nodetype": AST_BINOP,
-            "op": "+",
-            "lhs": { "nodetype": AST_INT, "value": 3 },
-            "rhs": { "nodetype": AST_ID, "name": "y" }
-          }
-        }
+        Assign(
+          lhs="x",
+          rhs=BinOp(
+            op="+",
+            lhs=Int(value=3),
+            rhs=Id(name="y")
+          )
+        )
     """
+    decls, stmts = parse_stream(toks)
+    return Program(decls, list(stmts))
 
-    def consume(tok_type):
-        if tok_type == toks[0]["toktype"]:
-            t = toks.pop(0)
-            return t
-        else:
-            error("expected %d, found %d" % (tok_type, toks[0]["toktype"]))
 
-    def peek():
-        if toks:
-            return toks[0]["toktype"]
-        else:
-            return None
+def parse_stream(toks):
+    """
+    Input : a list or an iterator of tokens
+    Output: a (decls, stmts) pair: the list of the declarations, and an
+            iterator over the top-level statements
+
+    The declarations are parsed right away, and every statement only
+    when the iterator gets to it, pulling its tokens from toks: a
+    caller that handles every statement before getting the next one
+    never holds more than one statement of the program (see parse()
+    for the grammar).
+    """
+    stream = TokenStream(toks)
+    peek = stream.peek_type
 
-    def program():
-        ds = decls()
-        sts = stmts()
-        return {
-            "decls": ds,
-            "stmts": sts,
-        }
+    def consume(tok_type):
+        next_tok = peek()
+        if tok_type == next_tok:
+            return stream.next()
+        elif next_tok is None:
+            error("expected %d, found end of input" % tok_type)
+        else:
+            error("expected %d, found %d" % (tok_type, next_tok))
 
     def decls():
         decls = []
@@ -101,104 +126,100 @@ def parse(toks):
             consume(TOK_COLON)
             ty = consume(TOK_TYPE)
             consume(TOK_SEMI)
-            return astnode(AST_DECL, id=id["value"], type=ty["value"])
+            return Decl(id[VALUE], ty[VALUE])
         else:
             error("not a valid declaration")
 
     def stmts():
         stmts = []
-        while peek() in (TOK_PRINT, TOK_RETURN, TOK_READ, TOK_ID, TOK_WHILE):
+        while peek() in STATEMENT_STARTS:
             stmts.append(stmt())
         return stmts
 
+    def top_level_stmts():
+        while peek() in STATEMENT_STARTS:
+            yield stmt()
+
     def stmt():
         next_tok = peek()
+        line = stream.peek()[LINE]
         if next_tok == TOK_ID:
             id = consume(TOK_ID)
             consume(TOK_EQ)
             e = expr()
             consume(TOK_SEMI)
-            return astnode(AST_ASSIGN, lhs=id["value"], rhs=e)
+            return Assign(id[VALUE], e, line=line)
         elif next_tok == TOK_PRINT:
             consume(TOK_PRINT)
             e = expr()
             consume(TOK_SEMI)
-            return astnode(AST_PRINT, expr=e)
+            return Print(e, line)
         elif next_tok == TOK_RETURN:
             consume(TOK_RETURN)
             e = expr()
             consume(TOK_SEMI)
-            return astnode(AST_RETURN, expr=e)
+            return Return(e, line)
         elif next_tok == TOK_READ:
             consume(TOK_READ)
             id = consume(TOK_ID)
             consume(TOK_SEMI)
-            return astnode(AST_READ, id=id)
+            return Read(id[VALUE], line=line)
         elif next_tok == TOK_WHILE:
             consume(TOK_WHILE)
             e = expr()
             consume(TOK_DO)
             body = stmts()
             consume(TOK_DONE)
-            return astnode(AST_WHILE, expr=e, body=body)
+            return While(e, body, line)
         else:
             error("illegal statement")
 
     def expr():
-        t = term()
-        next_tok = peek()
-        while next_tok in (TOK_PLUS, TOK_MINUS):
-            if next_tok == TOK_PLUS:
-                consume(TOK_PLUS)
-                t2 = term()
-                t = astnode(AST_BINOP, op="+", lhs=t, rhs=t2)
-            elif next_tok == TOK_MINUS:
-                consume(TOK_MINUS)
-                t2 = term()
-                t = astnode(AST_BINOP, op="-", lhs=t, rhs=t2)
-            next_tok = peek()
-        return t
-
-    def term():
-        f = factor()
-        next_tok = peek()
-        while next_tok in (TOK_STAR, TOK_SLASH, TOK_GTHAN, TOK_LTHAN):
-            if next_tok == TOK_STAR:
-                consume(TOK_STAR)
-                f2 = factor()
-                f = astnode(AST_BINOP, op="*", lhs=f, rhs=f2)
-            elif next_tok == TOK_SLASH:
-                consume(TOK_SLASH)
-                f2 = factor()
-                f = astnode(AST_BINOP, op="/", lhs=f, rhs=f2)
-            elif next_tok == TOK_GTHAN:
-                consume(TOK_GTHAN)
-                f2 = factor()
-                f = astnode(AST_BINOP, op=">", lhs=f, rhs=f2)
-            elif next_tok == TOK_LTHAN:
-                consume(TOK_LTHAN)
-                f2 = factor()
-                f = astnode(AST_BINOP, op="<", lhs=f, rhs=f2)
+        """
+        Parse an expression with two stacks instead of one recursive
+        call per nesting level (operator precedence parsing), so
+        expressions of any depth can be parsed.  `operators` holds the
+        operators waiting for their right operand, and None for an open
+        parenthesis.  An operator is applied as soon as the next one
+        does not bind tighter, which makes them all left-associative.
+        """
+        operands = []
+        operators = []
+        while True:
+            # An operand: a factor, after any number of '('.
             next_tok = peek()
-        return f
-
-    def factor():
-        next_tok = peek()
-        if next_tok == TOK_LPAREN:
-            consume(TOK_LPAREN)
-            e = expr()
-            consume(TOK_RPAREN)
-            return e
-        elif next_tok == TOK_INT:
-            tok = consume(TOK_INT)
-            return astnode(AST_INT, value=tok["value"])
-        elif next_tok == TOK_FLOAT:
-            tok = consume(TOK_FLOAT)
-            return astnode(AST_FLOAT, value=tok["value"])
-        elif next_tok == TOK_ID:
-            tok = consume(TOK_ID)
-            return astnode(AST_ID, name=tok["value"])
-        else:
-            error("illegal token %d" % next_tok)
-
-    return program()
+            while next_tok == TOK_LPAREN:
+                stream.next()
+                operators.append(None)
+                next_tok = peek()
+            if next_tok == TOK_INT:
+                operands.append(Int(stream.next()[VALUE]))
+            elif next_tok == TOK_FLOAT:
+                operands.append(Float(stream.next()[VALUE]))
+            elif next_tok == TOK_ID:
+                operands.append(Id(stream.next()[VALUE]))
+            elif next_tok is None:
+                error("unexpected end of input")
+            else:
+                error("illegal token %d" % next_tok)
+
+            # Then the operator after it, once the ')' are closed.
+            while True:
+                next_tok = peek()
+                if next_tok in BINARY_OPERATORS:
+                    op, prec = BINARY_OPERATORS[next_tok]
+                    while operators and operators[-1] is not None and PRECEDENCE[operators[-1]] >= prec:
+                        rhs = operands.pop()
+                        operands[-1] = BinOp(operators.pop(), operands[-1], rhs)
+                    stream.next()
+                    operators.append(op)
+                    break
+                while operators and operators[-1] is not None:
+                    rhs = operands.pop()
+                    operands[-1] = BinOp(operators.pop(), operands[-1], rhs)
+                if not operators:
+                    return operands[0]
+                consume(TOK_RPAREN)
+                operators.pop()
+
+    return decls(), top_level_stmts()
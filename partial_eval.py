@@ -0,0 +1,208 @@
+import math
+from AST_NODES import *
+from optimize import fold, wrap_int
+from tac_gen import to_float32
+
+
+# The work allowed to partial_evaluate(): the statements it evaluates,
+# and the statements it emits while unrolling loops.  A loop that is
+# still running when either is exceeded is left to run at run time.
+MAX_STEPS = 100000
+MAX_EMITTED = 10000
+
+INF = float("inf")
+
+
+def known(value):
+    """
+    Tell whether value can be written as a literal: NaNs and infinities
+    can't, and neither can -0.0 (the back ends would merge it with 0.0).
+    """
+    return (value is not None and value == value and value not in (INF, -INF)
+            and (value != 0 or math.copysign(1.0, value) > 0))
+
+
+def literal(value, ty):
+    if ty == "int":
+        return Int(value, "int")
+    return Float(value, "float")
+
+
+def assigned_slots(stmts):
+    """Return the slots of the variables that stmts assign or read, in order."""
+    slots = []
+    stack = list(reversed(stmts))
+    while stack:
+        stmt = stack.pop()
+        if stmt.nodetype in (AST_ASSIGN, AST_READ):
+            if stmt.slot not in slots:
+                slots.append(stmt.slot)
+        elif stmt.nodetype == AST_WHILE:
+            stack.extend(reversed(stmt.body))
+    return slots
+
+
+def partial_evaluate(ast, symtab, max_steps=MAX_STEPS, max_emitted=MAX_EMITTED):
+    """
+    Input : the typed AST and symbol table of a mini program
+    Output: a typed AST of an equivalent program, where what does not
+            depend on the input was computed
+
+    The program is run at compile time on abstract values: a variable
+    holds a known value, or an unknown one once it depends on a read.
+    Variables start at 0, like in the VM.  Every statement is either
+    evaluated, when its values are known, or emitted, with the known
+    variables of its expressions replaced by their values:
+
+    - An assignment of a known value only updates the value of the
+      variable; the assignment is emitted when the variable is needed
+      at run time (before it is read, or before a loop that assigns it
+      runs at run time).
+    - A print or return of a known value prints or returns a literal,
+      and nothing after a return is emitted.
+    - A loop whose condition is known is unrolled: its body is
+      evaluated (and its statements that depend on the input emitted)
+      as long as the condition is true.  A loop whose condition is not
+      known, or that runs out of the budget of max_steps evaluated
+      statements or max_emitted emitted ones, is emitted and runs at
+      run time from there.  The variables it assigns are unknown in it
+      and after it; its body is specialized for the variables it does
+      not assign.
+
+    So a program that never reads is compiled to its prints, and a
+    program that reads is specialized up to its first read.  Values are
+    computed like the C program does (see optimize.fold): an int
+    division by zero, or a float operation giving an infinity, a NaN
+    or -0.0, is left to run time.  The AST given is not modified.
+    """
+    names = symtab.names
+    types = symtab.types
+    env = [0 if ty == "int" else 0.0 for ty in types]
+    budget = [max_steps, max_emitted]
+
+    def value_of(expr):
+        """Return the known value of a leaf, or None."""
+        nodetype = expr.nodetype
+        if nodetype == AST_ID:
+            return env[expr.slot]
+        elif nodetype == AST_INT:
+            return wrap_int(expr.value)
+        value = to_float32(expr.value)
+        return value if known(value) else None
+
+    def residual(expr):
+        """
+        Return the (value, node) of expr: its value if it is known (or
+        None), and the expression to emit for it.  The tree is walked in
+        post-order with an explicit stack.
+        """
+        if expr.nodetype != AST_BINOP:
+            value = value_of(expr)
+            if value is not None and expr.nodetype == AST_ID:
+                return value, literal(value, expr.type)
+            return value, expr
+        results = []
+        stack = [expr]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            e = pop()
+            if e is None:
+                e = pop()
+                rhs, lhs = e.rhs, e.lhs
+                if rhs.nodetype == AST_BINOP:
+                    b, rnode = results.pop()
+                else:
+                    b = value_of(rhs)
+                    rnode = literal(b, rhs.type) if b is not None and rhs.nodetype == AST_ID else rhs
+                if lhs.nodetype == AST_BINOP:
+                    a, lnode = results.pop()
+                else:
+                    a = value_of(lhs)
+                    lnode = literal(a, lhs.type) if a is not None and lhs.nodetype == AST_ID else lhs
+                value = None
+                if a is not None and b is not None:
+                    value = fold(e.op, e.type, a, b)
+                if known(value):
+                    results.append((value, literal(value, e.type)))
+                elif lnode is lhs and rnode is rhs:
+                    results.append((None, e))
+                else:
+                    results.append((None, BinOp(e.op, lnode, rnode, e.type)))
+            else:
+                push(e)
+                push(None)
+                if e.rhs.nodetype == AST_BINOP:
+                    push(e.rhs)
+                if e.lhs.nodetype == AST_BINOP:
+                    push(e.lhs)
+        return results[0]
+
+    def materialize(slot, out):
+        """Emit the assignment of the known value of a variable, which becomes unknown."""
+        value = env[slot]
+        if value is not None:
+            out.append(Assign(names[slot], literal(value, types[slot]), slot))
+            budget[1] -= 1
+            env[slot] = None
+
+    def eval_stmts(stmts, out):
+        """
+        Evaluate stmts, appending the statements to emit to out.  Return
+        False if they end with a return.
+        """
+        for stmt in stmts:
+            budget[0] -= 1
+            nodetype = stmt.nodetype
+            if nodetype == AST_ASSIGN:
+                value, node = residual(stmt.rhs)
+                if known(value):
+                    env[stmt.slot] = value
+                else:
+                    out.append(Assign(stmt.lhs, node, stmt.slot, stmt.line))
+                    budget[1] -= 1
+                    env[stmt.slot] = None
+            elif nodetype == AST_PRINT:
+                value, node = residual(stmt.expr)
+                out.append(stmt if node is stmt.expr else Print(node, stmt.line))
+                budget[1] -= 1
+            elif nodetype == AST_RETURN:
+                value, node = residual(stmt.expr)
+                out.append(stmt if node is stmt.expr else Return(node, stmt.line))
+                return False
+            elif nodetype == AST_READ:
+                # A read that fails leaves the variable unchanged.
+                materialize(stmt.slot, out)
+                out.append(stmt)
+                budget[1] -= 1
+            elif nodetype == AST_WHILE:
+                while True:
+                    value, node = residual(stmt.expr)
+                    if value is None or budget[0] <= 0 or budget[1] <= 0:
+                        emit_loop(stmt, out)
+                        break
+                    if value == 0:
+                        break
+                    if not eval_stmts(stmt.body, out):
+                        return False
+        return True
+
+    def emit_loop(stmt, out):
+        """Emit a loop that runs at run time, from the current values."""
+        slots = assigned_slots(stmt.body)
+        for slot in slots:
+            materialize(slot, out)
+        value, cond = residual(stmt.expr)
+        body = []
+        if eval_stmts(stmt.body, body):
+            # Every iteration must start with the same values.
+            for slot in slots:
+                materialize(slot, body)
+        for slot in slots:
+            env[slot] = None
+        out.append(While(cond, body, stmt.line))
+        budget[1] -= 1
+
+    stmts = []
+    eval_stmts(ast.stmts, stmts)
+    return Program(ast.decls, stmts)
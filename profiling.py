@@ -0,0 +1,124 @@
+import argparse
+import os
+import sys
+
+from codegen import PROFILE_PATH, PROFILE_MAGIC
+
+
+# Execution profiles
+#
+# A program compiled with profiling (`--profile`, see tac_gen) counts
+# how many times every statement runs, and how many times every loop is
+# entered and iterates, and times every loop and the whole program.
+# When it exits, it saves these numbers in a profile file (see
+# codegen.write_c), one line per site with the line of its statement in
+# the source.  format_report() puts them back next to the source.
+#
+# The times are in CPU time stamp counter cycles on x86, and clock()
+# ticks elsewhere.  The time of a loop includes that of the loops it
+# contains.  With -O3, the statements computed at compile time run no
+# code and have no counts; those the compiler made up have no line.
+
+
+def read_profile(path):
+    """
+    Input : the path of a profile file
+    Output: the list of its sites, as (kind, line, count, cycles) tuples,
+            site 0 being the whole program
+    """
+    with open(path) as f:
+        lines = f.read().splitlines()
+    if not lines or lines[0] != PROFILE_MAGIC:
+        raise ValueError("%s is not a minilang profile" % path)
+    sites = []
+    for text in lines[1:]:
+        kind, line, count, cycles = text.split()
+        sites.append((kind, int(line), int(count), int(cycles)))
+    return sites
+
+
+def format_report(src, sites, top=10):
+    """
+    Input : the text of a mini program, the sites of one of its profiles
+            (see read_profile), and how many loops to list
+    Output: the lines of the report
+
+    The report starts with the source, every line annotated with the
+    number of times its statements ran and, for the loop starting on it,
+    the times the loop was entered, its iterations and cycles, and the
+    share of the cycles of the program spent in it.  It ends with the
+    `top` loops that took the most cycles.
+    """
+    kind, line, runs, total = sites[0]
+    # The counts and cycles of every line, by (line, kind): a line can
+    # hold statements and the start of a loop, counted separately.
+    counts = {}
+    cycles = {}
+    unplaced = 0
+    for kind, line, count, time in sites[1:]:
+        if line == 0:
+            # The compiler's own statements and loops.
+            if kind == "stmt":
+                unplaced += count
+            continue
+        counts[line, kind] = counts.get((line, kind), 0) + count
+        if kind == "loop":
+            cycles[line] = cycles.get(line, 0) + time
+
+    def percent(time):
+        return "%.1f%%" % (100.0 * time / total) if total else "-"
+
+    def column(number, kind):
+        count = counts.get((number, kind))
+        return "" if count is None else count
+
+    report = ["program: %d run%s, %d cycles" % (runs, "" if runs == 1 else "s", total)]
+    if unplaced:
+        report.append("statements added by the compiler: %d runs" % unplaced)
+    report.append("")
+    report.append("%10s %10s %10s %14s %6s %5s" % ("runs", "entries", "iters", "cycles", "%", "line"))
+    source = src.split("\n")
+    if source and source[-1] == "":
+        source.pop()
+    for number, text in enumerate(source, 1):
+        if number in cycles:
+            report.append("%10s %10d %10d %14d %6s %5d  %s" % (
+                column(number, "stmt"), counts[number, "loop"],
+                counts.get((number, "iter"), 0), cycles[number],
+                percent(cycles[number]), number, text))
+        else:
+            report.append("%10s %10s %10s %14s %6s %5d  %s" % (
+                column(number, "stmt"), "", "", "", "", number, text))
+
+    loops = sorted(cycles, key=lambda number: -cycles[number])[:top]
+    if loops:
+        report.append("")
+        report.append("hottest loops:")
+        report.append("%5s %10s %10s %14s %6s" % ("line", "entries", "iters", "cycles", "%"))
+        for number in loops:
+            text = source[number - 1].strip() if number <= len(source) else ""
+            report.append("%5d %10d %10d %14d %6s  %s" % (
+                number, counts[number, "loop"], counts.get((number, "iter"), 0),
+                cycles[number], percent(cycles[number]), text))
+    return report
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description="Report the profile of a mini program compiled with --profile.")
+    argparser.add_argument("file", help="the mini program")
+    argparser.add_argument(
+        "profile", nargs="?", default=os.environ.get("MINILANG_PROFILE", PROFILE_PATH),
+        help="the profile saved by the program (default: $MINILANG_PROFILE, "
+             "or %s)" % PROFILE_PATH)
+    argparser.add_argument(
+        "--top", type=int, default=10,
+        help="how many of the hottest loops to list (default: 10)")
+    args = argparser.parse_args()
+    with open(args.file) as f:
+        src = f.read()
+    sys.stdout.write("\n".join(format_report(src, read_profile(args.profile), args.top)) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import sys
+from array import array
+
+from AST_NODES import *
+from error import error
+from optimize import wrap_int
+from output import write_lines
+from tac_gen import to_float32
+from vm import ScanfReader, divide_by_zero, format_float
+
+
+# CPython refuses to compile more than 20 nested loops, and too deeply
+# nested parentheses.  Subexpressions deeper than MAX_EXPR_DEPTH are
+# computed into temporaries first.
+MAX_LOOP_DEPTH = 20
+MAX_EXPR_DEPTH = 32
+
+INF = float("inf")
+
+
+def rounding_functions():
+    """
+    Return a new pair of functions (f32, fdiv):
+
+    - f32(x) rounds x to a C float, like storing it in a float variable
+    - fdiv(a, b) divides two C floats; dividing by zero gives an
+      infinity or a NaN like in C
+
+    They round through an array of their own, so that programs running
+    in different threads never share one.
+    """
+    buf = array("f", [0.0])
+
+    def f32(x):
+        buf[0] = x
+        return buf[0]
+
+    def fdiv(a, b):
+        if b == 0.0:
+            return divide_by_zero(a, b)
+        buf[0] = a / b
+        return buf[0]
+
+    return f32, fdiv
+
+
+def idiv(a, b):
+    """
+    Divide two C ints, truncating towards zero like C.  Dividing by
+    zero raises ZeroDivisionError.
+    """
+    q = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        q = -q
+    return ((q + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+
+def wrap(text):
+    """Return the Python expression of the C int value of an int expression."""
+    return "(((%s + 2147483648) & 4294967295) - 2147483648)" % text
+
+
+def pygen(ast, symtab, out=None):
+    """
+    Input : the typed AST and symbol table of a mini program
+    Output: the source of an equivalent Python function, written to the
+            output sink out (see output.write_lines)
+
+    The program becomes one function,
+
+        def program(read, write, f32, idiv, fdiv, format_float, inf):
+
+    whose variables are Python locals named v_<name>.  `read` is called
+    as read("int") or read("float") by every read statement and returns
+    the value read, or None to leave the variable unchanged; `write` is
+    called with every line printed.  The other parameters are the
+    helpers of this module, passed as arguments so they are locals too.
+    The function returns the value of the return statement, or 0.
+
+    The arithmetic is the one of the C program:
+
+    - Ints are wrapped around to 32 bits, but only where the difference
+      shows: before a comparison, a division or a multiplication, and
+      when the value is stored, printed or tested by a loop.  Sums and
+      differences in between are exact, which gives the same result
+      modulo 2^32.
+    - Every float operation is rounded to a C float by f32() or fdiv().
+
+    Subexpressions deeper than MAX_EXPR_DEPTH are computed into
+    temporaries _t<n> first, so expressions of any depth compile.
+    """
+    lines = ["def program(read, write, f32, idiv, fdiv, format_float, inf):"]
+    for name, ty in symtab.items():
+        lines.append("    v_%s = %s" % (name, "0" if ty == "int" else "0.0"))
+
+    def leaf(expr):
+        """Return the (text, depth, wrapped) of an operand that is not a BinOp."""
+        if expr.nodetype == AST_ID:
+            return "v_" + expr.name, 0, True
+        if expr.type == "int":
+            return str(wrap_int(expr.value)), 0, True
+        value = to_float32(expr.value)
+        if value == INF:
+            return "inf", 0, True
+        return repr(value), 0, True
+
+    def gen_expr(expr, indent, temps):
+        """
+        Append the statements computing the temporaries of expr to
+        lines, and return the (text, depth, wrapped) of expr: its
+        Python expression, its nesting depth, and whether it is known
+        to be in the range of a C int.
+        """
+        if expr.nodetype != AST_BINOP:
+            return leaf(expr)
+        results = []
+        stack = [expr]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            e = pop()
+            if e is None:
+                e = pop()
+                lhs, rhs = e.lhs, e.rhs
+                rtext, rdepth, rwrapped = results.pop() if rhs.nodetype == AST_BINOP else leaf(rhs)
+                ltext, ldepth, lwrapped = results.pop() if lhs.nodetype == AST_BINOP else leaf(lhs)
+                op = e.op
+                wrapped = False
+                if lhs.type == "float":
+                    if op in "<>":
+                        text = "(%s %s %s)" % (ltext, op, rtext)
+                        wrapped = True
+                    elif op == "/":
+                        text = "fdiv(%s, %s)" % (ltext, rtext)
+                    else:
+                        text = "f32(%s %s %s)" % (ltext, op, rtext)
+                else:
+                    if op in "*/<>":
+                        if not lwrapped:
+                            ltext = wrap(ltext)
+                        if not rwrapped:
+                            rtext = wrap(rtext)
+                    if op == "/":
+                        text = "idiv(%s, %s)" % (ltext, rtext)
+                        wrapped = True
+                    elif op in "<>":
+                        text = "(%s %s %s)" % (ltext, op, rtext)
+                        wrapped = True
+                    else:
+                        text = "(%s %s %s)" % (ltext, op, rtext)
+                depth = max(ldepth, rdepth) + 1
+                if depth > MAX_EXPR_DEPTH:
+                    temp = "_t%d" % len(temps)
+                    temps.append(temp)
+                    lines.append("%s%s = %s" % (indent, temp, text))
+                    text, depth = temp, 0
+                results.append((text, depth, wrapped))
+            else:
+                push(e)
+                push(None)
+                if e.rhs.nodetype == AST_BINOP:
+                    push(e.rhs)
+                if e.lhs.nodetype == AST_BINOP:
+                    push(e.lhs)
+        return results[0]
+
+    def gen_value(expr, indent):
+        """Return the Python expression of the value of expr, wrapped if it is an int."""
+        text, depth, wrapped = gen_expr(expr, indent, [])
+        if expr.type == "int" and not wrapped:
+            text = wrap(text)
+        return text
+
+    def gen_stmts(stmts, level):
+        if level > MAX_LOOP_DEPTH:
+            error("the Python backend supports at most %d nested loops" % MAX_LOOP_DEPTH)
+        indent = "    " * level
+        for stmt in stmts:
+            nodetype = stmt.nodetype
+            if nodetype == AST_ASSIGN:
+                lines.append("%sv_%s = %s" % (indent, stmt.lhs, gen_value(stmt.rhs, indent)))
+            elif nodetype == AST_PRINT:
+                value = gen_value(stmt.expr, indent)
+                if stmt.expr.type == "int":
+                    lines.append('%swrite("%%d\\n" %% (%s))' % (indent, value))
+                else:
+                    lines.append('%swrite(format_float(%s) + "\\n")' % (indent, value))
+            elif nodetype == AST_RETURN:
+                lines.append("%sreturn %s" % (indent, gen_value(stmt.expr, indent)))
+            elif nodetype == AST_READ:
+                ty = symtab.types[stmt.slot]
+                lines.append('%s_v = read("%s")' % (indent, ty))
+                lines.append("%sif _v is not None:" % indent)
+                if ty == "float":
+                    lines.append("%s    v_%s = f32(_v)" % (indent, stmt.id))
+                else:
+                    lines.append("%s    v_%s = _v" % (indent, stmt.id))
+            elif nodetype == AST_WHILE:
+                start = len(lines)
+                cond = gen_value(stmt.expr, indent + "    ")
+                if len(lines) == start:
+                    lines.append("%swhile %s:" % (indent, cond))
+                else:
+                    # The condition needs temporaries: compute them at
+                    # the start of every iteration.
+                    lines.insert(start, "%swhile True:" % indent)
+                    lines.append("%s    if not (%s):" % (indent, cond))
+                    lines.append("%s        break" % indent)
+                body = len(lines)
+                gen_stmts(stmt.body, level + 1)
+                if len(lines) == body:
+                    lines.append("%s    pass" % indent)
+
+    gen_stmts(ast.stmts, 1)
+    lines.append("    return 0")
+    write_lines(lines, out)
+
+
+class PyProgram(object):
+    """
+    A mini program compiled to a Python function by pygen().  It is
+    compiled once, and can then be called any number of times:
+
+        program = PyProgram(source)
+        status = program(read, write)
+
+    Without a read or write callable, the numbers are read from stdin
+    like scanf() does, and the lines are written to stdout.  An int
+    division by zero raises ZeroDivisionError.
+    """
+
+    __slots__ = ("source", "function")
+
+    def __init__(self, source):
+        namespace = {}
+        exec(compile(source, "<minilang>", "exec"), namespace)
+        self.source = source
+        self.function = namespace["program"]
+
+    def __call__(self, read=None, write=None):
+        if read is None:
+            reader = ScanfReader(sys.stdin)
+            read = lambda ty: reader.read_int() if ty == "int" else reader.read_float()
+        if write is None:
+            write = sys.stdout.write
+        f32, fdiv = rounding_functions()
+        return self.function(read, write, f32, idiv, fdiv, format_float, INF)
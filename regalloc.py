@@ -0,0 +1,162 @@
+from optimize import find_loops, all_loops
+
+
+def live_intervals(prog):
+    """
+    Input : a TAC program
+    Output: a dict mapping every temporary to its live interval, a
+            [start, end] pair of quad indices
+
+    The interval of a temporary goes from its first to its last
+    occurrence.  A temporary that is live when a loop starts over (it
+    is set before the loop and used inside, or used inside before being
+    set) stays live for the whole loop.  If the program has no loop
+    structure find_loops() can make sense of, every temporary is kept
+    live for the whole program.
+    """
+    intervals = {}
+    first_is_def = {}
+    for i, q in enumerate(prog.quads):
+        for x in (q.arg1, q.arg2):
+            if prog.is_temp(x):
+                if x in intervals:
+                    intervals[x][1] = i
+                else:
+                    intervals[x] = [i, i]
+                    first_is_def[x] = False
+        if q.op == "djnz" and q.dst in intervals:
+            intervals[q.dst][1] = i
+        if prog.is_temp(q.dst) and q.op != "label":
+            if q.dst in intervals:
+                intervals[q.dst][1] = i
+            else:
+                intervals[q.dst] = [i, i]
+                first_is_def[q.dst] = True
+
+    roots = find_loops(prog.quads)
+    if roots is None:
+        for interval in intervals.values():
+            interval[0] = 0
+            interval[1] = len(prog.quads)
+        return intervals
+    loops = all_loops(roots)
+    if not loops:
+        return intervals
+
+    # Only the loops around the first or the last occurrence of a
+    # temporary can extend its interval, so find the innermost loop
+    # around every quad, and the loop around every loop.
+    order = dict((loop, k) for k, loop in enumerate(loops))
+    parent = {}
+    for loop in loops:
+        for child in loop.children:
+            parent[child] = loop
+    innermost = [None] * len(prog.quads)
+    open_loops = []
+    by_head = sorted(loops, key=lambda loop: loop.head)
+    k = 0
+    for i in range(len(prog.quads)):
+        while open_loops and open_loops[-1].back < i:
+            open_loops.pop()
+        while k < len(by_head) and by_head[k].head == i:
+            open_loops.append(by_head[k])
+            k += 1
+        if open_loops:
+            innermost[i] = open_loops[-1]
+
+    for name, interval in intervals.items():
+        start, end = interval
+        around = set()
+        for i in (start, end):
+            loop = innermost[i]
+            while loop is not None and loop not in around:
+                around.add(loop)
+                loop = parent.get(loop)
+        # Innermost loops come first, so extending the interval to an
+        # inner loop is seen by the loops around it.
+        for loop in sorted(around, key=order.get):
+            if loop.head <= start and end <= loop.back and first_is_def[name]:
+                continue
+            start = min(start, loop.head)
+            end = max(end, loop.back)
+        interval[0] = start
+        interval[1] = end
+    return intervals
+
+
+def linear_scan(prog, intervals, pools=None):
+    """
+    Input : a TAC program, the live intervals of its temporaries, and
+            optionally a dict mapping each type to the list of the
+            locations available for it
+    Output: a dict mapping every temporary to a location
+
+    Temporaries are visited by increasing start of their interval.  The
+    locations of the temporaries whose interval ended are given back to
+    the pool of their type, and reused by the next temporaries of that
+    type.  Without pools, locations are new names, created on demand.
+    A temporary can reuse the location of one whose last use is the
+    quad that sets it, since a quad reads its operands before writing
+    its result.
+    """
+    free = {}
+    if pools is not None:
+        for ty, locs in pools.items():
+            free[ty] = list(reversed(locs))
+    variables = prog.vars
+    counter = [0]
+
+    def new_location():
+        while True:
+            counter[0] += 1
+            name = "t" + str(counter[0])
+            if name not in variables:
+                return name
+
+    active = []
+    assignment = {}
+    for name in sorted(intervals, key=lambda t: intervals[t][0]):
+        start, end = intervals[name]
+        still_active = []
+        for other in active:
+            if intervals[other][1] <= start:
+                free.setdefault(prog.types[other], []).append(assignment[other])
+            else:
+                still_active.append(other)
+        active = still_active
+        ty = prog.types[name]
+        if free.get(ty):
+            assignment[name] = free[ty].pop()
+        elif pools is None:
+            assignment[name] = new_location()
+        else:
+            assignment[name] = None
+            continue
+        active.append(name)
+    return assignment
+
+
+def allocate_temps(prog):
+    """
+    Rename the temporaries of prog in place so they share a small pool
+    of locations, and return a (before, after) pair with the number of
+    temporaries before and after the allocation.
+    """
+    intervals = live_intervals(prog)
+    assignment = linear_scan(prog, intervals)
+
+    # Only the types of the temporaries change, so that this does not
+    # depend on the number of variables.
+    types = prog.types
+    locations = dict((loc, types[name]) for name, loc in assignment.items())
+    for name in assignment:
+        del types[name]
+    types.update(locations)
+    for q in prog.quads:
+        if q.op != "label":
+            q.dst = assignment.get(q.dst, q.dst)
+        if q.op not in ("goto", "djnz"):
+            q.arg1 = assignment.get(q.arg1, q.arg1)
+        if q.op != "ifz":
+            q.arg2 = assignment.get(q.arg2, q.arg2)
+    return len(intervals), len(set(assignment.values()))
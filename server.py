@@ -0,0 +1,170 @@
+import argparse
+import io
+import json
+import os
+import signal
+import socketserver
+import stat
+import sys
+import time
+from cache import CompileCache, UnsafeCacheError
+from compiler import compile_source
+from error import CompileError
+from vm import IterationLimitError, run
+
+
+MODES = ("c", "tac", "asm", "py", "run")
+
+# How many loop iterations a program may run in run mode, so that a
+# program that never ends does not hold a server thread forever.
+MAX_ITERATIONS = 1000000
+
+
+def handle_request(request, cache=None, max_iterations=MAX_ITERATIONS):
+    """
+    Input : a request, as a dictionary with the keys
+            - "mode": "c", "tac", "asm", "py" or "run"
+            - "source": the text of the mini program
+            - "opt": the optimization level of C, TAC and assembly (default: 2)
+            - "stdin": the input of the program in run mode (default: none)
+            optionally a CompileCache, and the number of loop iterations
+            a program may run in run mode (None for no limit)
+    Output: the response, as a dictionary with the keys
+            - "ok": whether the program compiled (and ran)
+            - "output": the generated code, or what the program printed
+            - "status": in run mode, the value returned by the program
+            - "errors": the list of the error messages, if not ok
+            - "seconds": the time spent in the server
+
+    Never raises: a bad request, and any other exception, is answered
+    with the error.  A program that runs more than max_iterations loop
+    iterations is stopped, and answered with an error (and what it
+    printed until then).
+    """
+    start = time.perf_counter()
+    response = {"ok": False, "output": ""}
+    try:
+        mode = request.get("mode", "c")
+        if mode not in MODES:
+            raise CompileError(["unknown mode: %r" % (mode,)])
+        src = request["source"]
+        opt_level = int(request.get("opt", 2))
+        output = compile_source(src, mode, opt_level, cache)
+        if mode == "run":
+            out = io.StringIO()
+            try:
+                response["status"] = run(output, io.StringIO(request.get("stdin") or ""), out,
+                                         max_iterations)
+            finally:
+                response["output"] = out.getvalue()
+        else:
+            response["output"] = output[0]
+        response["ok"] = True
+    except CompileError as e:
+        response["errors"] = e.diagnostics
+    except ZeroDivisionError:
+        response["errors"] = ["division by zero"]
+    except IterationLimitError as e:
+        response["errors"] = [str(e)]
+    except Exception as e:
+        response["errors"] = ["%s: %s" % (type(e).__name__, e)]
+    response["seconds"] = time.perf_counter() - start
+    return response
+
+
+class CompileHandler(socketserver.StreamRequestHandler):
+    """
+    Serves the requests of one connection: every line received is a
+    request in JSON (see handle_request), answered by a line holding
+    the response in JSON.
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("a request is an object")
+            except ValueError as e:
+                response = {"ok": False, "output": "", "errors": ["bad request: %s" % e]}
+            else:
+                response = handle_request(request, self.server.cache,
+                                          self.server.max_iterations)
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class ThreadingCompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves every connection in its own thread."""
+
+    daemon_threads = True
+
+
+class ForkingCompileServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Serves every connection in a child process, forked from the warm server."""
+
+
+def serve(path, fork=False, cache=None, max_iterations=MAX_ITERATIONS):
+    """
+    Serve compile requests on a Unix socket at path until interrupted.
+
+    Connections are served concurrently, by threads or, with fork, by
+    processes forked from this one (which compile in parallel, and
+    still start with all the modules of the compiler loaded).  A socket
+    file left at path by a server that died is replaced.  Programs run
+    at most max_iterations loop iterations (see handle_request).
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except OSError:
+        pass
+    server_class = ForkingCompileServer if fork else ThreadingCompileServer
+    server = server_class(path, CompileHandler)
+    server.cache = cache
+    server.max_iterations = max_iterations
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description="Serve compile requests on a Unix socket (see client.py).")
+    argparser.add_argument("socket", help="the path of the socket")
+    argparser.add_argument(
+        "--fork", action="store_true",
+        help="serve every connection in a forked process instead of a thread")
+    argparser.add_argument(
+        "--cache-dir", default=os.environ.get("MINILANG_CACHE_DIR"),
+        help="directory of the compilation cache (default: $MINILANG_CACHE_DIR; "
+             "no caching if neither is set)")
+    argparser.add_argument(
+        "--cache-size", type=int, default=64,
+        help="maximum size of the compilation cache, in MB (default: 64)")
+    argparser.add_argument(
+        "--max-iterations", type=int, default=MAX_ITERATIONS,
+        help="stop a program of run mode after this many loop iterations "
+             "(default: %d; 0 for no limit)" % MAX_ITERATIONS)
+    args = argparser.parse_args()
+    cache = None
+    if args.cache_dir:
+        try:
+            cache = CompileCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        except UnsafeCacheError as e:
+            argparser.error(str(e))
+    sys.stderr.write("serving on %s\n" % args.socket)
+    # Stop cleanly on SIGTERM too, removing the socket.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve(args.socket, args.fork, cache, args.max_iterations or None)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+from tac_gen import BINOPS
+
+
+# Static single assignment form of a TAC program.
+#
+# The quads are split into basic blocks, linked into a control-flow
+# graph: a while loop, lowered by tac_gen() to a header label, its
+# condition and exit test, the body and a jump back, becomes a header
+# block with two successors (the body and the exit) and a body whose
+# last block jumps back to the header.  Every name assigned in the
+# program is then split into values, one per assignment, and a phi
+# node is placed where several values of a name meet (at the header of
+# a loop that assigns it, for instance), as in Cytron et al., "Efficiently
+# Computing Static Single Assignment Form and the Control Dependence
+# Graph".
+#
+# The quads themselves are not rewritten: an SSAForm records which
+# value every quad defines and reads, for the passes of optimize.py
+# that analyze the program in SSA form and then change its quads.
+
+
+def used_operands(q):
+    """Return the operands that q reads: names or constants."""
+    op = q.op
+    if op in BINOPS:
+        return (q.arg1, q.arg2)
+    if op in ("=", "ifz", "print", "return"):
+        return (q.arg1,)
+    if op == "djnz":
+        return (q.dst,)
+    return ()
+
+
+def defined_name(q):
+    """Return the name that q assigns, or None."""
+    if q.op in BINOPS or q.op in ("=", "read", "djnz"):
+        return q.dst
+    return None
+
+
+class BasicBlock(object):
+    """
+    A basic block: the quads[start:end] of the program, which only the
+    first can be jumped to, and only the last can jump from.
+
+    - succs, preds : the successor and predecessor blocks; the first
+                     successor of a conditional jump is its target, the
+                     second the block that follows it
+    - idom         : the immediate dominator (None for the entry block
+                     and the blocks that can't be reached)
+    - children     : the blocks whose immediate dominator this is
+    - phis         : the phi nodes at the start of the block
+    """
+
+    __slots__ = ("index", "start", "end", "succs", "preds", "idom", "children", "phis")
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.succs = []
+        self.preds = []
+        self.idom = None
+        self.children = []
+        self.phis = []
+
+    def __repr__(self):
+        return "BasicBlock(%d, %d, %d)" % (self.index, self.start, self.end)
+
+
+def build_cfg(quads):
+    """
+    Return the basic blocks of a list of quads, in program order, with
+    their successors and predecessors.  The first block is the entry:
+    it is empty, so that no jump leads to it.
+    """
+    leaders = set([0])
+    labels = {}
+    for i, q in enumerate(quads):
+        if q.op == "label":
+            leaders.add(i)
+            labels[q.dst] = i
+        elif q.op in ("goto", "ifz", "djnz", "return"):
+            leaders.add(i + 1)
+    starts = sorted(i for i in leaders if i < len(quads))
+    blocks = [BasicBlock(0, 0, 0)]
+    block_at = {}
+    for k, start in enumerate(starts):
+        end = starts[k + 1] if k + 1 < len(starts) else len(quads)
+        block_at[start] = len(blocks)
+        blocks.append(BasicBlock(len(blocks), start, end))
+
+    for block in blocks:
+        follow = blocks[block.index + 1] if block.index + 1 < len(blocks) else None
+        last = quads[block.end - 1] if block.end > block.start else None
+        op = last.op if last is not None else None
+        if op == "goto":
+            succs = [blocks[block_at[labels[last.arg1]]]]
+        elif op in ("ifz", "djnz"):
+            target = last.arg2 if op == "ifz" else last.arg1
+            succs = [blocks[block_at[labels[target]]]]
+            if follow is not None and follow is not succs[0]:
+                succs.append(follow)
+        elif op == "return" or follow is None:
+            succs = []
+        else:
+            succs = [follow]
+        block.succs = succs
+        for succ in succs:
+            succ.preds.append(block)
+    return blocks
+
+
+def compute_dominators(blocks):
+    """
+    Set the idom and children of the blocks, and return the blocks that
+    can be reached from the entry, in reverse postorder.
+
+    The dominators are computed iteratively over the reverse postorder,
+    as in Cooper, Harvey and Kennedy, "A Simple, Fast Dominance
+    Algorithm".
+    """
+    entry = blocks[0]
+    postorder = []
+    visited = set([entry.index])
+    stack = [(entry, iter(entry.succs))]
+    while stack:
+        block, succs = stack[-1]
+        for succ in succs:
+            if succ.index not in visited:
+                visited.add(succ.index)
+                stack.append((succ, iter(succ.succs)))
+                break
+        else:
+            stack.pop()
+            postorder.append(block)
+    order = postorder[::-1]
+    number = {}
+    for k, block in enumerate(order):
+        number[block.index] = k
+
+    idom = {entry.index: entry}
+
+    def intersect(a, b):
+        while a is not b:
+            while number[a.index] > number[b.index]:
+                a = idom[a.index]
+            while number[b.index] > number[a.index]:
+                b = idom[b.index]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new = None
+            for pred in block.preds:
+                if pred.index in idom:
+                    new = pred if new is None else intersect(pred, new)
+            if idom.get(block.index) is not new:
+                idom[block.index] = new
+                changed = True
+
+    for block in blocks:
+        block.idom = None
+        block.children = []
+    for block in order[1:]:
+        block.idom = idom[block.index]
+        block.idom.children.append(block)
+    return order
+
+
+def dominance_frontiers(order):
+    """
+    Return the dominance frontier of every reachable block (given in
+    reverse postorder, after compute_dominators), by block index: the
+    blocks where the blocks it dominates meet other control flow.
+    """
+    reachable = set(block.index for block in order)
+    frontiers = dict((block.index, set()) for block in order)
+    for block in order:
+        preds = [pred for pred in block.preds if pred.index in reachable]
+        if len(preds) < 2:
+            continue
+        for pred in preds:
+            runner = pred
+            while runner is not block.idom:
+                frontiers[runner.index].add(block)
+                runner = runner.idom
+    return frontiers
+
+
+class Phi(object):
+    """
+    value = phi(args) at the start of a block: args[k] is the value of
+    name coming from the k-th predecessor of the block (None if that
+    predecessor can't be reached).
+    """
+
+    __slots__ = ("name", "value", "args")
+
+    def __init__(self, name, value, nargs):
+        self.name = name
+        self.value = value
+        self.args = [None] * nargs
+
+    def __repr__(self):
+        return "Phi(%r, %r, %r)" % (self.name, self.value, self.args)
+
+
+class SSAForm(object):
+    """
+    The SSA form of a TAC program.  Values are numbered from 0:
+
+    - blocks     : the basic blocks (see build_cfg), with their phis
+    - order      : the reachable blocks, in reverse postorder
+    - uses       : for every quad, the values of its used_operands(), in
+                   order (None for a constant)
+    - defs       : for every quad, the value it defines, or None
+    - names      : the name of every value
+    - entry_values : the set of the values names have when the program
+                     starts
+    """
+
+    __slots__ = ("blocks", "order", "uses", "defs", "names", "entry_values")
+
+    def __init__(self, blocks, order, nquads):
+        self.blocks = blocks
+        self.order = order
+        self.uses = [()] * nquads
+        self.defs = [None] * nquads
+        self.names = []
+        self.entry_values = set()
+
+    def new_value(self, name):
+        self.names.append(name)
+        return len(self.names) - 1
+
+
+def to_ssa(prog):
+    """
+    Input : a TAC program
+    Output: its SSA form (an SSAForm)
+
+    The SSA form is pruned: a phi is only placed where its name is
+    live, that is, where the value it merges may still be read.
+    Quads that can't be reached are left out.
+    """
+    quads = prog.quads
+    blocks = build_cfg(quads)
+    order = compute_dominators(blocks)
+    ssa = SSAForm(blocks, order, len(quads))
+
+    # Find the names read in a block before being assigned in it (the
+    # others, like most temporaries, never live from a block to
+    # another), and the blocks assigning every name.
+    exposed = {}
+    def_blocks = {}
+    for block in order:
+        assigned = set()
+        reads = exposed[block.index] = []
+        for i in range(block.start, block.end):
+            q = quads[i]
+            for x in used_operands(q):
+                if isinstance(x, str) and x not in assigned:
+                    reads.append(x)
+            name = defined_name(q)
+            if name is not None:
+                assigned.add(name)
+                def_blocks.setdefault(name, set()).add(block)
+
+    # Compute the names live at the start of every block, as bit sets
+    # (ints) over these names.
+    bits = {}
+    for block in order:
+        for x in exposed[block.index]:
+            if x not in bits:
+                bits[x] = 1 << len(bits)
+    use_bits = {}
+    def_bits = {}
+    for block in order:
+        use_bits[block.index] = sum(bits[x] for x in set(exposed[block.index]))
+        def_bits[block.index] = 0
+    for name, assigning in def_blocks.items():
+        if name in bits:
+            for block in assigning:
+                def_bits[block.index] |= bits[name]
+    live_in = dict(use_bits)
+    work = list(order)
+    pending = set(live_in)
+    while work:
+        block = work.pop()
+        pending.discard(block.index)
+        live_out = 0
+        for succ in block.succs:
+            live_out |= live_in[succ.index]
+        live = use_bits[block.index] | (live_out & ~def_bits[block.index])
+        if live != live_in[block.index]:
+            live_in[block.index] = live
+            for pred in block.preds:
+                if pred.index in live_in and pred.index not in pending:
+                    pending.add(pred.index)
+                    work.append(pred)
+
+    # Place the phis on the iterated dominance frontiers of the blocks
+    # assigning a name, where it is live.
+    frontiers = dominance_frontiers(order)
+    for name in sorted(bits):
+        bit = bits[name]
+        has_phi = set()
+        work = list(def_blocks.get(name, ()))
+        while work:
+            block = work.pop()
+            for f in frontiers[block.index]:
+                if f.index not in has_phi and live_in[f.index] & bit:
+                    has_phi.add(f.index)
+                    f.phis.append(Phi(name, ssa.new_value(name), len(f.preds)))
+                    work.append(f)
+
+    # Rename, walking the dominator tree: current maps the names to their
+    # values where the walk is, and the values that a block replaced are
+    # put back when the walk leaves the blocks it dominates.
+    current = {}
+    uses = ssa.uses
+    defs = ssa.defs
+    values = ssa.names
+
+    def read(x):
+        if x.__class__ is not str:
+            return None
+        value = current.get(x)
+        if value is None:
+            value = current[x] = len(values)
+            values.append(x)
+            ssa.entry_values.add(value)
+        return value
+
+    walk = [(order[0], None)]
+    while walk:
+        block, replaced = walk.pop()
+        if replaced is not None:
+            for name, value in reversed(replaced):
+                current[name] = value
+            continue
+        replaced = []
+        for phi in block.phis:
+            replaced.append((phi.name, read(phi.name)))
+            current[phi.name] = phi.value
+        for i in range(block.start, block.end):
+            q = quads[i]
+            op = q.op
+            if op in BINOPS:
+                uses[i] = (read(q.arg1), read(q.arg2))
+            elif op in ("=", "ifz", "print", "return"):
+                uses[i] = (read(q.arg1),)
+            elif op == "djnz":
+                uses[i] = (read(q.dst),)
+            elif op != "read":
+                continue
+            name = q.dst
+            if name is not None:
+                replaced.append((name, read(name)))
+                current[name] = defs[i] = len(values)
+                values.append(name)
+        for succ in block.succs:
+            if succ.phis:
+                k = succ.preds.index(block)
+                for phi in succ.phis:
+                    phi.args[k] = read(phi.name)
+        walk.append((block, replaced))
+        walk.extend((child, None) for child in reversed(block.children))
+    return ssa
@@ -0,0 +1,125 @@
+import contextlib
+import mmap
+
+from AST_NODES import Program
+from lexical_analyzer import tokenize_buffer
+from parser import parse_stream
+from build_symbol_table import build_symtab, resolve
+from typecheck import typecheck
+from tac_gen import TacProgram, tac_gen, write_tac
+from optimize import optimize, PIPELINES
+from regalloc import allocate_temps
+from codegen import c_statement, c_variable
+from error import Diagnostics
+from output import write_lines
+from instrument import NO_INSTRUMENTATION
+
+
+# Streaming compilation
+#
+# compile_source() holds the whole program at every step: its text,
+# its tokens, its AST and its TAC code.  compile_stream() only holds
+# the declarations and one top-level statement at a time: the tokens
+# are lexed from the buffer as the parser asks for them, and every
+# statement is checked, lowered, optimized and written out before the
+# next one is parsed.  Its peak memory is that of the largest
+# statement, whatever the size of the program.
+#
+# The price is that the optimizations only see one statement at a
+# time, and that the program is not partially evaluated (which needs
+# all of it), so the code can be slower than that of compile_source()
+# at the same level.
+
+
+def compile_stream(buf, mode="c", opt_level=2, out=None, instr=NO_INSTRUMENTATION):
+    """
+    Input : a bytes-like object holding the text of a mini program (see
+            open_source()), "c" or "tac", the optimization level, and an
+            output sink (see output.write_lines)
+    Output: none
+
+    The C or TAC code of the program is written to out as it is
+    generated.  Every statement is compiled into the same TacProgram,
+    so its labels are unique in the program, but its temporaries start
+    over at t1: in C, they are declared in a block of their own around
+    the code of the statement.
+
+    The errors of all the statements are reported together, in one
+    CompileError raised at the end, as by compile_source(); no code is
+    written for the statements after the first error.
+    """
+    with instr.phase("stream") as record:
+        decls, stmts = parse_stream(tokenize_buffer(buf))
+        symtab = build_symtab(Program(decls, []))
+        slots = symtab.slots
+        passes = PIPELINES[opt_level]
+        prog = TacProgram(list(symtab.items()))
+        diagnostics = Diagnostics()
+        if mode == "c":
+            write_lines(c_header(prog), out)
+        count = 0
+        for stmt in stmts:
+            count += 1
+            with diagnostics:
+                resolve((stmt,), slots)
+                typecheck(Program([], [stmt]), symtab)
+            if diagnostics.messages:
+                continue
+            prog.quads = []
+            prog.ntemps = 0
+            prog = optimize(tac_gen(Program([], [stmt]), symtab, prog), passes)
+            if mode == "tac":
+                write_tac(prog, out)
+            else:
+                allocate_temps(prog)
+                write_lines(c_block(prog), out)
+        diagnostics.check()
+        if mode == "c":
+            write_lines(["}"], out)
+        record.items, record.unit = count, "statements"
+
+
+def c_header(prog):
+    """Generate the lines of C code before the first statement."""
+    yield "#include <stdio.h>"
+    yield "int main(void) {"
+    for name, ty in prog.decls:
+        yield c_variable(name, ty)
+
+
+def c_block(prog):
+    """
+    Generate the lines of C code of the statement compiled in prog,
+    in a block that declares its temporaries if it has any.
+    """
+    types = prog.types
+    temps = prog.temps()
+    if temps:
+        yield "{"
+        for name in temps:
+            yield "%s %s;" % (types[name], name)
+    for q in prog.quads:
+        line = c_statement(q, types)
+        if line is not None:
+            yield line
+    if temps:
+        yield "}"
+
+
+@contextlib.contextmanager
+def open_source(path):
+    """
+    A context manager giving a read-only memory map of the file at
+    path, closed at the end, or an empty bytes object for an empty file
+    (which can't be mapped).
+    """
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            yield b""
+            return
+    try:
+        yield buf
+    finally:
+        buf.close()
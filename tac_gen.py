@@ -1,67 +1,281 @@
+import struct
+
 from AST_NODES import *
-from error import error
+from output import write_lines
+
+
+# Operations of the three-address code.  Operands are either names (of
+# declared variables or of temporaries) or Python int/float constants.
+#
+#   op          dst     arg1    arg2     meaning
+#   "="         x       a                x = a
+#   "+" ...     x       a       b        x = a op b   (+ - * / < >)
+#   "label"     L                        L:
+#   "goto"              L                goto L
+#   "ifz"               a       L        if a == 0 goto L
+#   "djnz"      x       L                x = x - 1; if x != 0 goto L
+#   "print"             a                print a
+#   "read"      x                        read x
+#   "return"            a                return a
+#
+# and, in programs generated with profiling (see tac_gen), where k is
+# the index of a profiling site:
+#
+#   "count"             k                add 1 to the count of site k
+#   "timer_start"       k                start the timer of site k
+#   "timer_stop"        k                add the time since it started to site k
+BINOPS = ("+", "-", "*", "/", "<", ">")
+PROFILE_OPS = ("count", "timer_start", "timer_stop")
+
+
+class Quad(object):
+    __slots__ = ("op", "dst", "arg1", "arg2")
+
+    def __init__(self, op, dst=None, arg1=None, arg2=None):
+        self.op = op
+        self.dst = dst
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def __repr__(self):
+        return "Quad(%r, %r, %r, %r)" % (self.op, self.dst, self.arg1, self.arg2)
+
+
+class TacProgram(object):
+    """
+    A mini program in three-address code.
+
+    - quads : the list of instructions
+    - decls : the declared variables, in order, as (name, type) pairs
+    - types : maps every variable and temporary name to its type
+    - profile : None, or the list of the profiling sites of the
+      program, as (kind, line) pairs (see tac_gen)
+    """
+
+    __slots__ = ("quads", "decls", "types", "vars", "ntemps", "nlabels", "profile")
+
+    def __init__(self, decls):
+        self.quads = []
+        self.decls = decls
+        self.types = dict(decls)
+        self.vars = frozenset(self.types)
+        self.ntemps = 0
+        self.nlabels = 0
+        self.profile = None
+
+    def new_temp(self, ty):
+        """Return a new, unique temporary variable name of type ty."""
+        while True:
+            self.ntemps += 1
+            name = "t" + str(self.ntemps)
+            if name not in self.vars:
+                break
+        self.types[name] = ty
+        return name
+
+    def new_label(self):
+        self.nlabels += 1
+        return "L" + str(self.nlabels)
+
+    def is_temp(self, x):
+        return isinstance(x, str) and x in self.types and x not in self.vars
+
+    def temps(self):
+        """Return the names of the temporaries still used by the program."""
+        seen = set()
+        for q in self.quads:
+            if self.is_temp(q.dst):
+                seen.add(q.dst)
+        return sorted(seen, key=lambda t: int(t[1:]))
 
 
-curr_tmp = 0
+def to_float32(value):
+    """Round a Python float to the nearest C float."""
+    try:
+        return struct.unpack("f", struct.pack("f", value))[0]
+    except OverflowError:
+        return value * float("inf")
 
 
-def tac_gen(ast, symtab):
+def tac_gen(ast, symtab, prog=None, profile=False):
     """
-    Input : the AST and symbol table of a mini program
-    Output: an equivalent TAC program
+    Input : the AST and symbol table of a mini program, optionally
+            the TacProgram to add the quads to (a new one by default),
+            and whether to profile the program
+    Output: an equivalent TAC program (a TacProgram)
+
+    Every expression is flattened into a sequence of quadruples, each
+    computing one operation into a fresh temporary; literals are used
+    directly as operands, and the value of an assignment is computed
+    directly into its variable.  Loops become a
+    header label that evaluates the condition, a conditional jump to
+    the exit label, the body, and a jump back to the header:
+
+        while e do body done   =>   L1:
+                                    t = e
+                                    ifz t goto L2
+                                    body
+                                    goto L1
+                                    L2:
+
+    Float literals are rounded to C floats here, so that optimizations
+    compute with the values the C program will see.
+
+    With profile, the program also counts how many times every
+    statement runs, and times its loops.  prog.profile is the list of
+    its profiling sites, as (kind, line) pairs, where line is the line
+    of the statement in the source (0 if it has none): site 0 is the
+    "program", which is counted and timed from the start, every
+    statement gets a "stmt" site counted before it runs, and every
+    loop a "loop" site, counted and timed around the whole loop, and
+    an "iter" site counted at the start of every iteration (after the
+    test, so that the loop keeps the shape the loop optimizations
+    look for).  The timers of the loops a `return` leaves are stopped
+    before it; the program timer is stopped by the code that saves
+    the profile (see codegen.write_c).
     """
+    if prog is None:
+        prog = TacProgram(list(symtab.items()))
+    emit = prog.quads.append
+    sites = None
+    loops = []  # the "loop" sites of the loops being generated
+    if profile:
+        sites = prog.profile = [("program", 0)]
+        emit(Quad("count", arg1=0))
+        emit(Quad("timer_start", arg1=0))
 
-    def new_temp():
-        """Return a new, unique temporary variable name."""
-        global curr_tmp
-        curr_tmp += 1
-        return "t" + str(curr_tmp)
+    def new_site(kind, line):
+        sites.append((kind, line or 0))
+        return len(sites) - 1
 
     def gen_stmt(stmt):
-        if stmt["nodetype"] == AST_ASSIGN:
-            if stmt["lhs"] not in symtab:
-                error("undeclared variable: %s" % stmt["lhs"])
-            expr_loc = gen_expr(stmt["rhs"])
-            print("%s = %s;" % (stmt["lhs"], expr_loc))
-        elif stmt["nodetype"] == AST_PRINT:
-            expr_loc = gen_expr(stmt["expr"])
-            if stmt["expr"]["type"] == "int":
-                flag = "d"
-            else:
-                flag = "f"
-            print('printf("%%%s\\n", %s);' % (flag, expr_loc))
-        elif stmt["nodetype"] == AST_RETURN:
-            expr_loc = gen_expr(stmt["expr"])
-            print('\nreturn %s;' % expr_loc)
-        elif stmt["nodetype"] == AST_READ:
-            id = stmt["id"]["value"]
-            if symtab[id] == "int":
-                flag = "d"
-            else:
-                flag = "f"
-            print('scanf("%%%s", &%s);' % (flag, id))
-        elif stmt["nodetype"] == AST_WHILE:
-            expr_loc = gen_expr(stmt["expr"])
-            print("\nwhile (%s) { " % expr_loc)
-            for body_stmt in stmt["body"]:
+        if sites is not None and stmt.nodetype != AST_WHILE:
+            emit(Quad("count", arg1=new_site("stmt", stmt.line)))
+        if stmt.nodetype == AST_ASSIGN:
+            gen_expr(stmt.rhs, stmt.lhs)
+        elif stmt.nodetype == AST_PRINT:
+            emit(Quad("print", arg1=gen_expr(stmt.expr)))
+        elif stmt.nodetype == AST_RETURN:
+            value = gen_expr(stmt.expr)
+            for site in reversed(loops):
+                emit(Quad("timer_stop", arg1=site))
+            emit(Quad("return", arg1=value))
+        elif stmt.nodetype == AST_READ:
+            emit(Quad("read", stmt.id))
+        elif stmt.nodetype == AST_WHILE:
+            head = prog.new_label()
+            end = prog.new_label()
+            if sites is not None:
+                site = new_site("loop", stmt.line)
+                iteration = new_site("iter", stmt.line)
+                emit(Quad("count", arg1=site))
+                emit(Quad("timer_start", arg1=site))
+                loops.append(site)
+            emit(Quad("label", head))
+            emit(Quad("ifz", arg1=gen_expr(stmt.expr), arg2=end))
+            if sites is not None:
+                emit(Quad("count", arg1=iteration))
+            for body_stmt in stmt.body:
                 gen_stmt(body_stmt)
-            gen_expr(stmt["expr"], expr_loc)
-            print("}")
+            emit(Quad("goto", arg1=head))
+            emit(Quad("label", end))
+            if sites is not None:
+                emit(Quad("timer_stop", arg1=loops.pop()))
+
+    def leaf_operand(expr):
+        if expr.nodetype == AST_ID:
+            return expr.name
+        elif expr.type == "float":
+            return to_float32(expr.value)
+        return expr.value
 
     def gen_expr(expr, loc_name=None):
-        if expr["nodetype"] in (AST_INT, AST_FLOAT):
-            loc = loc_name or new_temp()
-            print("%s = %s;" % (loc, expr["value"]))
-            return loc
-        elif expr["nodetype"] == AST_ID:
-            return expr["name"]
-        elif expr["nodetype"] == AST_BINOP:
-            lhs_loc = gen_expr(expr["lhs"])
-            rhs_loc = gen_expr(expr["rhs"])
-            loc = new_temp()
-            print("%s = %s %s %s;" % (loc, lhs_loc, expr["op"], rhs_loc))
-            return loc
-
-    # Add the C statements to the main function.
-    for stmt in ast["stmts"]:
+        """
+        Emit the quads computing expr, into loc_name if it is given, and
+        return the operand holding the value: a name, or the value
+        itself for a literal.
+
+        The BinOps of the tree are walked in post-order with an explicit
+        stack, and the operands they computed are kept on a second
+        stack, so expressions of any depth can be lowered.
+        """
+        if expr.nodetype != AST_BINOP:
+            value = leaf_operand(expr)
+            if loc_name:
+                emit(Quad("=", loc_name, value))
+                return loc_name
+            return value
+        values = []
+        # None on the stack marks that the operands of the BinOp below
+        # it were computed.
+        stack = [expr]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            e = pop()
+            if e is None:
+                e = pop()
+                lhs, rhs = e.lhs, e.rhs
+                rhs_loc = values.pop() if rhs.nodetype == AST_BINOP else leaf_operand(rhs)
+                lhs_loc = values.pop() if lhs.nodetype == AST_BINOP else leaf_operand(lhs)
+                if e is expr and loc_name:
+                    loc = loc_name
+                else:
+                    loc = prog.new_temp(e.type)
+                emit(Quad(e.op, loc, lhs_loc, rhs_loc))
+                values.append(loc)
+            else:
+                push(e)
+                push(None)
+                if e.rhs.nodetype == AST_BINOP:
+                    push(e.rhs)
+                if e.lhs.nodetype == AST_BINOP:
+                    push(e.lhs)
+        return values[0]
+
+    for stmt in ast.stmts:
         gen_stmt(stmt)
+    return prog
+
+
+def format_operand(x):
+    if isinstance(x, float):
+        return repr(x)
+    return str(x)
+
+
+def format_tac(prog):
+    """Return the lines of text of a TAC program."""
+    return list(tac_lines(prog))
+
+
+def write_tac(prog, out=None):
+    """Write the text of a TAC program to an output sink (see output.write_lines)."""
+    write_lines(tac_lines(prog), out)
+
+
+def tac_lines(prog):
+    """Generate the lines of text of a TAC program."""
+    for q in prog.quads:
+        op = q.op
+        if op == "=":
+            yield "%s = %s;" % (q.dst, format_operand(q.arg1))
+        elif op in BINOPS:
+            yield "%s = %s %s %s;" % (
+                q.dst, format_operand(q.arg1), op, format_operand(q.arg2))
+        elif op == "label":
+            yield "%s:" % q.dst
+        elif op == "goto":
+            yield "goto %s;" % q.arg1
+        elif op == "ifz":
+            yield "ifz %s goto %s;" % (format_operand(q.arg1), q.arg2)
+        elif op == "djnz":
+            yield "djnz %s goto %s;" % (q.dst, q.arg1)
+        elif op == "print":
+            yield "print %s;" % format_operand(q.arg1)
+        elif op == "read":
+            yield "read %s;" % q.dst
+        elif op == "return":
+            yield "return %s;" % format_operand(q.arg1)
+        elif op in PROFILE_OPS:
+            yield "%s %d;" % (op, q.arg1)
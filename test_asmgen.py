@@ -0,0 +1,87 @@
+import unittest
+
+from compiler import compile_to_string
+from test_loops import COUNTDOWN, NESTED
+from test_vm import (CC, FLOAT_DIVISION, FLOAT_RETURN, INT_WRAP, NON_FINITE, demo,
+                     run_native, run_vm)
+
+
+def many_variables(n):
+    """
+    Return a program with n int and n float variables that are all live
+    at once, more than there are registers.
+    """
+    lines = ["var k: int;"]
+    lines += ["var i%d: int;\nvar f%d: float;" % (v, v) for v in range(n)]
+    lines.append("read k;")
+    for v in range(n):
+        lines.append("i%d = k * %d + %d;" % (v, v + 1, v))
+        lines.append("f%d = %d.5 / (%d.0 + 1.0);" % (v, v, v))
+    lines.append("while k do")
+    for v in range(n):
+        lines.append("  i%d = i%d + i%d;" % (v, v, (v + 1) % n))
+        lines.append("  f%d = f%d * 0.5 + f%d;" % (v, v, (v + 1) % n))
+    lines.append("  k = k - 1;")
+    lines.append("done")
+    for v in range(n):
+        lines.append("print i%d;\nprint f%d;" % (v, v))
+    return "\n".join(lines) + "\n"
+
+
+SPILLS = many_variables(20)
+
+
+class AsmgenTest(unittest.TestCase):
+
+    def test_output(self):
+        text = compile_to_string(demo("fib.mini"), "asm")
+        self.assertIn("main:", text)
+        self.assertIn("printf", text)
+        # Four variables fit in registers.
+        self.assertNotIn("(%rsp)", text)
+
+    def test_spills(self):
+        # Without enough registers, values live in stack slots.
+        self.assertIn("(%rsp)", compile_to_string(SPILLS, "asm"))
+
+
+@unittest.skipIf(CC is None, "no C compiler")
+class NativeTest(unittest.TestCase):
+    """The assembly, the VM and the C code give the same results."""
+
+    def check(self, src, inputs=("",), opt_levels=(0, 2, 3)):
+        for stdin in inputs:
+            expected = run_vm(src, stdin)
+            for opt_level in opt_levels:
+                self.assertEqual(run_native(src, stdin, opt_level, "asm"), expected,
+                                 "asm at -O%d on %r" % (opt_level, stdin))
+
+    def test_demos(self):
+        self.check(demo("fib.mini"))
+        self.check(demo("conditional.mini"))
+        self.check(demo("sqrt.mini"), ("2\n", "9\n", "0\n"))
+
+    def test_loops(self):
+        self.check(COUNTDOWN, ("5\n", "0\n"))
+        self.check(NESTED, ("-3\n",))
+
+    def test_int_wraparound(self):
+        self.check(INT_WRAP, ("0\n", "1\n", "-1\n"))
+
+    def test_float_division_by_zero(self):
+        self.check(FLOAT_DIVISION, ("0\n", "-0\n", "2\n"))
+
+    def test_non_finite_floats(self):
+        self.check(NON_FINITE, ("100\n", "-100\n"))
+
+    def test_float_return(self):
+        self.check(FLOAT_RETURN, ("3.7\n", "-1.5\n", "300.9\n", "1e10\n", "nan\n", "inf\n"),
+                   opt_levels=(2,))
+
+    def test_spills(self):
+        self.check(SPILLS, ("3\n",))
+        self.assertEqual(run_native(SPILLS, "3\n", 2, "asm"), run_native(SPILLS, "3\n", 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import pickle
+import shutil
+import stat
+import tempfile
+import unittest
+import zlib
+
+from cache import CacheEntry, CompileCache, DamagedEntryError, UnsafeCacheError
+from compiler import compile_source, compile_to_string
+from native import BinaryCache, NativeProgram, cc_command
+from test_vm import CC, demo
+
+
+class CompileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="minilang-test-")
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.directory = os.path.join(self.tmpdir, "cache")
+
+    def entries(self, cache):
+        return sorted(name for name in os.listdir(cache.directory)
+                      if name.endswith(cache.SUFFIX))
+
+    def test_hit_and_miss(self):
+        cache = CompileCache(self.directory)
+        src = demo("fib.mini")
+        expected = compile_to_string(src)
+        self.assertEqual(compile_source(src, "c", 2, cache)[0], expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertEqual(compile_source(src, "c", 2, cache)[0], expected)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # Another mode of the same source adds to the same entry.
+        self.assertEqual(compile_source(src, "tac", 2, cache)[0], compile_to_string(src, "tac"))
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertEqual(len(self.entries(cache)), 1)
+        self.assertNotEqual(cache.key(src), cache.key(src + "\n"))
+
+    def test_entry(self):
+        entry = CacheEntry({"a": [1, 2.5], "b": "text"})
+        blobs = pickle.loads(entry.serialize())
+        loaded = CacheEntry(blobs=blobs)
+        self.assertIn("a", loaded)
+        self.assertNotIn("c", loaded)
+        self.assertEqual(loaded["a"], [1, 2.5])
+        self.assertEqual(loaded.values, {"a": [1, 2.5]})
+
+    def test_corrupted_file(self):
+        cache = CompileCache(self.directory)
+        src = demo("fib.mini")
+        compile_source(src, "c", 2, cache)
+        path = cache.path(cache.key(src))
+        with open(path, "wb") as f:
+            f.write(b"not a pickle")
+        self.assertIsNone(cache.get(cache.key(src)))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(compile_source(src, "c", 2, cache)[0], compile_to_string(src))
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+
+    def test_damaged_output(self):
+        cache = CompileCache(self.directory)
+        src = demo("fib.mini")
+        compile_source(src, "c", 2, cache)
+        key = cache.key(src)
+        with open(cache.path(key), "rb") as f:
+            blobs = pickle.loads(f.read())
+        blobs["c-O2"] = zlib.compress(b"not a pickle")
+        cache.put(key, CacheEntry(blobs=blobs))
+        with self.assertRaises(DamagedEntryError):
+            cache.get(key)["c-O2"]
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # The damaged lookup is a miss, and the entry is stored again.
+        self.assertEqual(compile_source(src, "c", 2, cache)[0], compile_to_string(src))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertEqual(compile_source(src, "c", 2, cache)[0], compile_to_string(src))
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_private_directory(self):
+        cache = CompileCache(self.directory)
+        self.assertEqual(stat.S_IMODE(os.stat(cache.directory).st_mode), 0o700)
+        shared = os.path.join(self.tmpdir, "shared")
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        with self.assertRaises(UnsafeCacheError):
+            CompileCache(shared)
+        os.chmod(shared, 0o775)
+        with self.assertRaises(UnsafeCacheError):
+            CompileCache(shared)
+        os.chmod(shared, 0o755)
+        CompileCache(shared)
+
+    def test_eviction(self):
+        cache = CompileCache(self.directory, 4000)
+        sizes = {}
+        for n in range(40):
+            key = cache.key(str(n))
+            cache.put(key, CacheEntry({"c": os.urandom(300)}))
+            sizes[key] = os.path.getsize(cache.path(key))
+            os.utime(cache.path(key), (n, n))
+            total = sum(os.path.getsize(os.path.join(cache.directory, name))
+                        for name in self.entries(cache))
+            self.assertLessEqual(total, 4000)
+            self.assertEqual(cache.size, total)
+        # The most recent entries are kept.
+        self.assertIsNotNone(cache.get(cache.key("39")))
+        self.assertIsNone(cache.get(cache.key("0")))
+        # Replacing an entry counts the difference of the sizes.
+        key = cache.key("39")
+        before = cache.size
+        cache.put(key, CacheEntry({"c": "y"}))
+        self.assertEqual(cache.size, before - sizes[key] + os.path.getsize(cache.path(key)))
+        cache.discard(key)
+        self.assertEqual(cache.size, sum(os.path.getsize(os.path.join(cache.directory, name))
+                                         for name in self.entries(cache)))
+
+    @unittest.skipIf(CC is None, "no C compiler")
+    def test_binary_cache(self):
+        cache = BinaryCache(os.path.join(self.directory, "native"))
+        text = compile_to_string(demo("sqrt.mini"))
+        program = NativeProgram(text, cc_command(), cache)
+        self.assertFalse(program.cached)
+        self.assertEqual(program.run("9\n"), (0, "3.000000\n9.000000\n"))
+        program = NativeProgram(text, cc_command(), cache)
+        self.assertTrue(program.cached)
+        self.assertEqual(program.run("9\n"), (0, "3.000000\n9.000000\n"))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertNotEqual(cache.key(text, cc_command()), cache.key(text, cc_command(opt="0")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+from compiler import front_end
+from error import CompileError
+from incremental import IncrementalCompiler
+
+
+VALID = """\
+var a: int;
+var b: float;
+a = 1;
+b = 2.0;
+print a + 1;
+"""
+
+# Every statement has an error: c is not declared, and the types of
+# the other statements are wrong.
+INVALID = """\
+var a: int;
+var b: float;
+a = 1.5;
+b = c + 1;
+print a + 2.0;
+"""
+
+# A declaration is repeated, and c is not declared.
+DUPLICATE = """\
+var a: int;
+var b: float;
+var a: float;
+a = 1;
+b = c;
+print d;
+"""
+
+
+def errors(compile, src):
+    """Return the messages of the errors of src, or None if it compiles."""
+    try:
+        compile(src)
+    except CompileError as e:
+        return e.diagnostics
+    return None
+
+
+class IncrementalErrorsTest(unittest.TestCase):
+
+    def check_edit(self, src):
+        compiler = IncrementalCompiler()
+        self.assertIsNone(errors(compiler.update, VALID))
+        expected = errors(front_end, src)
+        self.assertIsNotNone(expected)
+        self.assertEqual(errors(compiler.update, src), expected)
+        # The errors are reported again while they are not fixed.
+        self.assertEqual(errors(compiler.update, src), expected)
+        self.assertIsNone(errors(compiler.update, VALID))
+
+    def test_undeclared_variables_come_before_type_errors(self):
+        self.assertEqual(errors(front_end, INVALID), ["undeclared variable: c"])
+        self.check_edit(INVALID)
+
+    def test_type_errors_of_every_statement(self):
+        self.check_edit(INVALID.replace("c + 1", "a + 1"))
+
+    def test_duplicate_declaration(self):
+        self.check_edit(DUPLICATE)
+
+
+if __name__ == "__main__":
+    unittest.main()
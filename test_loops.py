@@ -0,0 +1,138 @@
+import io
+import unittest
+
+from compiler import front_end
+from optimize import DEFAULT_PIPELINE, optimize
+from tac_gen import tac_gen, write_tac
+from test_vm import CC, demo, run_native, run_vm
+
+
+# An invariant product, a multiplication of the counter, and a countdown.
+SUM = """\
+var a: int;
+var b: int;
+var i: int;
+var s: int;
+read a;
+read b;
+i = 10;
+while i do
+  s = s + a * b + i * 3;
+  i = i - 1;
+done
+print s;
+"""
+
+# The counter is read, and may be zero or negative.
+COUNTDOWN = """\
+var n: int;
+var s: int;
+read n;
+while n do
+  s = s + n * n;
+  n = n - 1;
+  print s;
+done
+return s;
+"""
+
+# The loop doesn't run when d is 0: a / d must not be moved out of it.
+DIVISION = """\
+var a: int;
+var d: int;
+var q: int;
+read a;
+read d;
+while d do
+  q = q + a / d;
+  d = 0;
+done
+print q;
+"""
+
+NESTED = """\
+var i: int;
+var j: int;
+var k: int;
+var s: int;
+read k;
+i = 4;
+while i do
+  j = 3;
+  while j do
+    s = s + (i * k + j * 7) / 2;
+    j = j - 1;
+  done
+  i = i - 1;
+done
+print s;
+"""
+
+
+def tac(src, passes):
+    """Return the lines of the TAC of src after the given passes."""
+    entry = front_end(src)
+    prog = optimize(tac_gen(entry["typed_ast"], entry["symtab"]), passes)
+    out = io.StringIO()
+    write_tac(prog, out)
+    return [line.strip() for line in out.getvalue().splitlines()]
+
+
+def loop_body(lines):
+    """Return the lines of the first loop, from its label to its back jump."""
+    start = next(i for i, line in enumerate(lines) if line.endswith(":"))
+    end = next(i for i, line in enumerate(lines) if line.startswith(("goto", "djnz")))
+    return lines[start:end + 1]
+
+
+class LoopPassesTest(unittest.TestCase):
+
+    def test_loop_invariant_code_motion(self):
+        lines = tac(SUM, DEFAULT_PIPELINE + ["loop-invariant-code-motion"])
+        self.assertIn("t1 = a * b;", lines)
+        self.assertNotIn("t1 = a * b;", loop_body(lines))
+
+    def test_division_not_hoisted(self):
+        lines = tac(DIVISION, DEFAULT_PIPELINE + ["loop-invariant-code-motion"])
+        self.assertTrue(any("/" in line for line in loop_body(lines)))
+        self.assertEqual(run_vm(DIVISION, "7 0\n"), (0, "0\n"))
+        self.assertEqual(run_vm(DIVISION, "7 2\n"), (0, "3\n"))
+
+    def test_strength_reduction(self):
+        lines = tac(SUM, DEFAULT_PIPELINE + ["strength-reduction"])
+        body = loop_body(lines)
+        self.assertFalse(any("i * 3" in line for line in body), body)
+        self.assertTrue(any(" - 3;" in line for line in body), body)
+
+    def test_countdown_loops(self):
+        lines = tac(COUNTDOWN, DEFAULT_PIPELINE + ["countdown-loops"])
+        self.assertEqual(sum(line.startswith("djnz n goto") for line in lines), 1)
+        self.assertEqual(sum(line.startswith("ifz n goto") for line in lines), 1)
+        self.assertNotIn("n = n - 1;", lines)
+
+    def test_same_results(self):
+        for src, inputs in ((SUM, ("3 4\n", "-5 2147483647\n")),
+                            (COUNTDOWN, ("5\n", "0\n", "1\n")),
+                            (DIVISION, ("7 0\n", "7 -2\n")),
+                            (NESTED, ("2\n", "-3\n")),
+                            (demo("fib.mini"), ("",)),
+                            (demo("sqrt.mini"), ("2\n",))):
+            for stdin in inputs:
+                expected = run_vm(src, stdin, 0)
+                for opt_level in (2, 3):
+                    self.assertEqual(run_vm(src, stdin, opt_level), expected,
+                                     "VM at -O%d on %r" % (opt_level, stdin))
+
+
+@unittest.skipIf(CC is None, "no C compiler")
+class NativeTest(unittest.TestCase):
+
+    def test_same_results(self):
+        for src, stdin in ((SUM, "-5 2147483647\n"), (COUNTDOWN, "5\n"),
+                           (DIVISION, "7 0\n"), (NESTED, "-3\n")):
+            expected = run_vm(src, stdin, 0)
+            self.assertEqual(run_native(src, stdin, 2), expected, "C on %r" % stdin)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import re
+import unittest
+
+from compiler import compile_to_string
+from optimize import fold
+from test_vm import CC, run_native, run_vm
+
+
+# Constant expressions: ints that wrap around, C divisions, and float
+# operations giving an infinity or a NaN, which must be left to run time.
+CONSTANTS = """\
+var a: int;
+var x: float;
+a = 2147483647 + 1;
+print a;
+print 65536 * 65536 + 3;
+print (0 - 7) / 2;
+print 7 / (0 - 2);
+print (2 < 3) + (3 > 2) * 2;
+x = 100000000000000000000.0 * 100000000000000000000.0;
+print x;
+print x - x;
+print (0.0 - x) * 0.0;
+print 1.0 / 3.0;
+print 0.1 + 0.2;
+return a / 65536;
+"""
+
+# A copy to propagate, and temporaries that become dead.
+COPIES = """\
+var a: int;
+var b: int;
+var c: int;
+read a;
+b = a;
+c = b * (2 + 3);
+print c + 0 * b;
+print b;
+"""
+
+
+def tac(src, opt_level):
+    """Return the lines of the TAC code of src, stripped."""
+    return [line.strip() for line in compile_to_string(src, "tac", opt_level).splitlines()]
+
+
+class FoldTest(unittest.TestCase):
+
+    def test_int_wraparound(self):
+        self.assertEqual(fold("+", "int", 2147483647, 1), -2147483648)
+        self.assertEqual(fold("*", "int", 65536, 65536), 0)
+        self.assertEqual(fold("-", "int", -2147483648, 1), 2147483647)
+
+    def test_int_division(self):
+        # Like C, towards zero.
+        self.assertEqual(fold("/", "int", -7, 2), -3)
+        self.assertEqual(fold("/", "int", 7, -2), -3)
+        self.assertEqual(fold("/", "int", -7, -2), 3)
+        self.assertIsNone(fold("/", "int", 7, 0))
+
+    def test_comparisons(self):
+        self.assertEqual(fold("<", "int", 2, 3), 1)
+        self.assertEqual(fold(">", "int", 2, 3), 0)
+        self.assertEqual(fold("<", "int", 1.5, 2.5), 1)
+
+    def test_float_rounding(self):
+        self.assertEqual(fold("/", "float", 1.0, 3.0), 0.3333333432674408)
+        self.assertEqual(fold("+", "float", 0.1, 0.2), 0.30000001192092896)
+
+    def test_non_finite_floats(self):
+        big = 1.0000000200408773e+20
+        self.assertIsNone(fold("*", "float", big, big))
+        self.assertIsNone(fold("/", "float", 1.0, 0.0))
+        self.assertIsNone(fold("/", "float", 0.0, 0.0))
+        inf = float("inf")
+        self.assertIsNone(fold("-", "float", inf, inf))
+        self.assertIsNone(fold("*", "float", inf, 0.0))
+        self.assertIsNone(fold("+", "float", inf, 1.0))
+
+
+class ConstantFoldingTest(unittest.TestCase):
+
+    def test_folded(self):
+        self.assertEqual(tac("var a: int;\nprint 2 * 3 + 4;\n", 0),
+                         ["t1 = 2 * 3;", "t2 = t1 + 4;", "print t2;"])
+        self.assertEqual(tac("var a: int;\nprint 2 * 3 + 4;\n", 1), ["print 10;"])
+
+    def test_no_non_finite_literals(self):
+        for opt_level in range(4):
+            text = compile_to_string(CONSTANTS, "c", opt_level)
+            self.assertIsNone(re.search(r"\b(inf|nan|INFINITY|NAN)\b", text), text)
+        # The operation giving an infinity is still there.
+        self.assertIn("x = 1.0000000200408773e+20 * 1.0000000200408773e+20;", tac(CONSTANTS, 2))
+
+    def test_copies_and_dead_temporaries(self):
+        optimized = tac(COPIES, 1)
+        self.assertLess(len(optimized), len(tac(COPIES, 0)))
+        self.assertIn("c = a * 5;", optimized)
+        self.assertIn("print a;", optimized)
+
+    def test_same_results(self):
+        for src, stdin in ((CONSTANTS, ""), (COPIES, "3\n"), (COPIES, "-2147483648\n")):
+            expected = run_vm(src, stdin, 0)
+            for opt_level in range(1, 4):
+                self.assertEqual(run_vm(src, stdin, opt_level), expected)
+
+    def test_vm_results(self):
+        self.assertEqual(run_vm(CONSTANTS), (
+            0, "-2147483648\n3\n-3\n-3\n3\ninf\n-nan\n-nan\n0.333333\n0.300000\n"))
+
+
+@unittest.skipIf(CC is None, "no C compiler")
+class NativeTest(unittest.TestCase):
+
+    def test_same_results(self):
+        for src, stdin in ((CONSTANTS, ""), (COPIES, "3\n"), (COPIES, "-2147483648\n")):
+            expected = run_vm(src, stdin, 0)
+            for opt_level in range(4):
+                self.assertEqual(run_native(src, stdin, opt_level), expected,
+                                 "C at -O%d on %r" % (opt_level, stdin))
+
+
+if __name__ == "__main__":
+    unittest.main()
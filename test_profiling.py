@@ -0,0 +1,42 @@
+import unittest
+
+from profiling import format_report
+
+
+SRC = """\
+var i: int;
+var s: int;
+i = 5;
+while i do s = s + i; i = i - 1; done
+print s;
+"""
+
+SITES = [("program", 0, 1, 1000), ("stmt", 3, 1, 0), ("stmt", 4, 1, 0),
+         ("loop", 4, 1, 400), ("iter", 4, 5, 0), ("stmt", 4, 5, 0), ("stmt", 4, 5, 0),
+         ("stmt", 5, 1, 0), ("stmt", 0, 7, 0), ("loop", 0, 2, 100), ("iter", 0, 9, 0)]
+
+
+class FormatReportTest(unittest.TestCase):
+
+    def test_counts_by_kind(self):
+        report = format_report(SRC, SITES)
+        self.assertEqual(report[0], "program: 1 run, 1000 cycles")
+        self.assertEqual(report[1], "statements added by the compiler: 7 runs")
+        self.assertEqual(report[3].split(), ["runs", "entries", "iters", "cycles", "%", "line"])
+        # The columns before the line number, and the source after it.
+        lines = [(row[:54].split(), row[54:60].strip(), row[62:]) for row in report[4:9]]
+        self.assertEqual(lines[0], ([], "1", "var i: int;"))
+        self.assertEqual(lines[2], (["1"], "3", "i = 5;"))
+        # The statements of line 4 ran 11 times, and its loop was entered once.
+        self.assertEqual(lines[3][:2], (["11", "1", "5", "400", "40.0%"], "4"))
+
+    def test_hottest_loops(self):
+        report = format_report(SRC, SITES)
+        index = report.index("hottest loops:")
+        self.assertEqual(report[index + 2].split()[:5], ["4", "1", "5", "400", "40.0%"])
+        # The loops the compiler made up have no line, and are not listed.
+        self.assertEqual(len(report), index + 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from cache import CompileCache
+from client import Client, exit_status
+from compiler import compile_to_string
+from server import CompileHandler, ThreadingCompileServer, handle_request
+from test_vm import FLOAT_RETURN, FOREVER, INT_DIVISION_BY_ZERO, demo, run_vm
+import vm
+
+
+class HandleRequestTest(unittest.TestCase):
+
+    def test_modes(self):
+        src = demo("fib.mini")
+        for mode in ("c", "tac", "asm", "py"):
+            response = handle_request({"mode": mode, "source": src, "opt": 1})
+            self.assertTrue(response["ok"])
+            self.assertEqual(response["output"], compile_to_string(src, mode, 1))
+
+    def test_run(self):
+        response = handle_request({"mode": "run", "source": demo("sqrt.mini"), "stdin": "9\n"})
+        self.assertTrue(response["ok"])
+        self.assertEqual((response["status"], response["output"]), run_vm(demo("sqrt.mini"), "9\n"))
+
+    def test_errors(self):
+        response = handle_request({"mode": "c", "source": "var a: int;\na = b + 1.0;\n"})
+        self.assertFalse(response["ok"])
+        self.assertEqual(response["errors"], ["undeclared variable: b"])
+        response = handle_request({"mode": "run", "source": INT_DIVISION_BY_ZERO, "stdin": "0"})
+        self.assertEqual((response["ok"], response["output"], response["errors"]),
+                         (False, "1\n", ["division by zero"]))
+        response = handle_request({"mode": "exe", "source": ""})
+        self.assertEqual(response["errors"], ["unknown mode: 'exe'"])
+        response = handle_request({"mode": "c"})
+        self.assertFalse(response["ok"])
+
+    def test_iteration_limit(self):
+        response = handle_request({"mode": "run", "source": FOREVER}, max_iterations=1000)
+        self.assertFalse(response["ok"])
+        self.assertEqual(len(response["errors"]), 1)
+        response = handle_request({"mode": "run", "source": demo("fib.mini")}, max_iterations=10)
+        self.assertTrue(response["ok"])
+
+    def test_cache(self):
+        directory = tempfile.mkdtemp(prefix="minilang-test-")
+        self.addCleanup(shutil.rmtree, directory)
+        cache = CompileCache(os.path.join(directory, "cache"))
+        for n in range(2):
+            response = handle_request({"mode": "c", "source": demo("fib.mini")}, cache)
+            self.assertEqual(response["output"], compile_to_string(demo("fib.mini")))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_exit_status(self):
+        # client.py has its own copy of vm.exit_status.
+        for value in (0, 300, -1, 3.7, -1.5, 2147483520.0, 1e10,
+                      float("nan"), float("inf"), float("-inf")):
+            self.assertEqual(exit_status(value), vm.exit_status(value), value)
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="minilang-test-")
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "server.sock")
+        server = ThreadingCompileServer(self.path, CompileHandler)
+        server.cache = None
+        server.max_iterations = 1000
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+
+    def test_requests(self):
+        client = Client(self.path)
+        self.addCleanup(client.close)
+        response = client.request("c", demo("fib.mini"))
+        self.assertEqual(response["output"], compile_to_string(demo("fib.mini")))
+        response = client.request("run", FLOAT_RETURN, stdin="nan\n")
+        self.assertEqual(exit_status(response["status"]), run_vm(FLOAT_RETURN, "nan\n")[0])
+        response = client.request("run", FOREVER)
+        self.assertFalse(response["ok"])
+        # The connection still serves requests after an error.
+        response = client.request("run", demo("fib.mini"))
+        self.assertEqual((response["ok"], response["output"]), (True, "55\n"))
+
+    def test_bad_request(self):
+        client = Client(self.path)
+        self.addCleanup(client.close)
+        client.sock.sendall(b"[1, 2]\n{\n")
+        for n in range(2):
+            response = client.rfile.readline()
+            self.assertIn(b"bad request", response)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+
+from compiler import front_end
+from optimize import DEFAULT_PIPELINE, optimize
+from ssa import to_ssa
+from tac_gen import tac_gen
+from test_loops import tac
+from test_vm import CC, run_native, run_vm
+
+
+# a is 1 on every path to its uses, even around the loop.
+CONSTANT_IN_LOOP = """\
+var a: int;
+var n: int;
+var x: int;
+read n;
+a = 1;
+while n do
+  x = x + a;
+  a = 1;
+  n = n - 1;
+done
+print a;
+print x;
+"""
+
+# The loop never runs, but only SCCP can tell: a is 0 on both paths.
+NEVER_RUNS = """\
+var a: int;
+a = 0;
+while a do
+  print 5;
+  a = 0;
+done
+print a;
+"""
+
+# The same products, with the operands swapped or not.
+PRODUCTS = """\
+var a: int;
+var b: int;
+var f: float;
+var g: float;
+read a;
+read b;
+read f;
+read g;
+print a * b + 1;
+print b * a + 2;
+print f * g;
+print g * f;
+print f * g;
+"""
+
+
+def ssa_form(src):
+    """Return the TAC program of src after the default pipeline, and its SSA form."""
+    entry = front_end(src)
+    prog = optimize(tac_gen(entry["typed_ast"], entry["symtab"]), DEFAULT_PIPELINE)
+    return prog, to_ssa(prog)
+
+
+class SSATest(unittest.TestCase):
+
+    def test_dominators_and_phis(self):
+        prog, ssa = ssa_form(CONSTANT_IN_LOOP)
+        entry = ssa.order[0]
+        self.assertIsNone(entry.idom)
+        head = next(block for block in ssa.blocks
+                    if prog.quads[block.start].op == "label" and block.preds
+                    and any(pred.index > block.index for pred in block.preds))
+        # The head is dominated by the block before the loop, not by the
+        # end of the body that jumps back to it.
+        self.assertIn(head.idom, head.preds)
+        self.assertLess(head.idom.index, head.index)
+        self.assertEqual(sorted(phi.name for phi in head.phis), ["a", "n", "x"])
+        for phi in head.phis:
+            self.assertEqual(len(phi.args), len(head.preds))
+            self.assertNotIn(None, phi.args)
+        for block in ssa.order[1:]:
+            self.assertIsNotNone(block.idom)
+
+    def test_single_definitions(self):
+        prog, ssa = ssa_form(CONSTANT_IN_LOOP)
+        defined = [value for value in ssa.defs if value is not None]
+        defined += [phi.value for block in ssa.order for phi in block.phis]
+        self.assertEqual(len(defined), len(set(defined)))
+        self.assertFalse(ssa.entry_values & set(defined))
+
+
+class GlobalPassesTest(unittest.TestCase):
+
+    def test_sccp_constant_in_loop(self):
+        lines = tac(CONSTANT_IN_LOOP, DEFAULT_PIPELINE + ["sccp"])
+        self.assertIn("x = x + 1;", lines)
+        self.assertIn("print 1;", lines)
+
+    def test_sccp_dead_code(self):
+        self.assertIn("print 5;", tac(NEVER_RUNS, DEFAULT_PIPELINE))
+        self.assertNotIn("print 5;", tac(NEVER_RUNS, DEFAULT_PIPELINE + ["sccp"]))
+
+    def test_global_value_numbering(self):
+        lines = tac(PRODUCTS, DEFAULT_PIPELINE + ["global-value-numbering"])
+        # Int products commute, float products don't.
+        self.assertEqual(sum(" * " in line for line in lines), 3)
+        self.assertIn("t6 = g * f;", lines)
+        self.assertEqual(lines.count("print t5;"), 2)
+
+    def test_same_results(self):
+        for src, inputs in ((CONSTANT_IN_LOOP, ("0\n", "4\n")),
+                            (NEVER_RUNS, ("",)),
+                            (PRODUCTS, ("3 -4 1.5 nan\n", "65536 65536 -0 inf\n"))):
+            for stdin in inputs:
+                expected = run_vm(src, stdin, 0)
+                self.assertEqual(run_vm(src, stdin, 3), expected, "VM on %r" % stdin)
+
+
+@unittest.skipIf(CC is None, "no C compiler")
+class NativeTest(unittest.TestCase):
+
+    def test_same_results(self):
+        for src, stdin in ((CONSTANT_IN_LOOP, "4\n"), (NEVER_RUNS, ""),
+                           (PRODUCTS, "65536 65536 -0 inf\n")):
+            expected = run_vm(src, stdin, 0)
+            self.assertEqual(run_native(src, stdin, 3), expected, "C on %r" % stdin)
+
+
+if __name__ == "__main__":
+    unittest.main()
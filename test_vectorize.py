@@ -0,0 +1,58 @@
+import unittest
+
+from compiler import front_end
+from test_loops import COUNTDOWN
+from test_vm import FLOAT_DIVISION, INT_WRAP, demo, run_vm
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+else:
+    from vectorize import run_lanes
+
+
+# Float comparisons are floats, so adding them to a float rounds to
+# single precision (16777217 is not a float32).
+FLOAT_COMPARISONS = """\
+var x: float;
+var y: float;
+read x;
+y = (x < 0.3) + 0.1;
+print y / 3.0 * 3.0;
+print ((x > 0.0) + 16777216.0) + 1.0;
+print (x < 0.3) * (x > 0.0);
+"""
+
+
+@unittest.skipIf(numpy is None, "no NumPy")
+class LanesTest(unittest.TestCase):
+
+    def check(self, src, inputs):
+        """Check that every lane prints what one VM run on its input prints."""
+        entry = front_end(src)
+        results = run_lanes(entry["typed_ast"], entry["symtab"], inputs)
+        for lane, row in enumerate(inputs):
+            stdin = " ".join(repr(float(x)) for x in row) + "\n"
+            status, output = run_vm(src, stdin, 0)
+            self.assertEqual(results.output(lane), output.splitlines(), "lane %r" % (row,))
+
+    def test_demos(self):
+        self.check(demo("sqrt.mini"), [[2.0], [9.0], [100.0], [0.0]])
+        self.check(demo("fib.mini"), [[], []])
+
+    def test_float_comparisons(self):
+        self.check(FLOAT_COMPARISONS, [[0.2], [0.5], [-1.0]])
+        entry = front_end(FLOAT_COMPARISONS)
+        results = run_lanes(entry["typed_ast"], entry["symtab"], [[0.2]])
+        for ty, mask, values in results.prints:
+            self.assertEqual(values.dtype, numpy.float32)
+
+    def test_edge_cases(self):
+        self.check(FLOAT_DIVISION, [[0.0], [-0.0], [2.0]])
+        self.check(COUNTDOWN, [[5.0], [0.0], [1.0]])
+        self.check(INT_WRAP, [[0.0], [1.0], [-1.0]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+import io
+import os
+import shutil
+import unittest
+
+from compiler import compile_source
+from native import NativeProgram, as_command, cc_command
+from pygen import PyProgram
+from vm import IterationLimitError, ScanfReader, exit_status, run
+
+
+DEMOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "demos")
+
+# The C compiler of the native tests, if there is one.
+CC = shutil.which(os.environ.get("CC", "cc"))
+
+
+def demo(name):
+    with open(os.path.join(DEMOS, name)) as f:
+        return f.read()
+
+
+def run_vm(src, stdin="", opt_level=2, max_iterations=None):
+    """Run src in the VM, and return its (exit status, output)."""
+    out = io.StringIO()
+    status = run(compile_source(src, "run", opt_level), io.StringIO(stdin), out, max_iterations)
+    return exit_status(status), out.getvalue()
+
+
+def run_py(src, stdin="", opt_level=2):
+    """Run src as a Python function, and return its (exit status, output)."""
+    text, stats = compile_source(src, "py", opt_level)
+    reader = ScanfReader(io.StringIO(stdin))
+    out = []
+    status = PyProgram(text)(lambda ty: reader.read_int() if ty == "int" else reader.read_float(),
+                             out.append)
+    return exit_status(status), "".join(out)
+
+
+def run_native(src, stdin="", opt_level=2, backend="c"):
+    """Compile src to an executable, and return its (exit status, output)."""
+    text, stats = compile_source(src, backend, opt_level)
+    command = as_command() if backend == "asm" else cc_command()
+    program = NativeProgram(text, command)
+    try:
+        return program.run(stdin)
+    finally:
+        program.close()
+
+
+# Arithmetic that overflows 32-bit ints, in literals and at run time.
+INT_WRAP = """\
+var a: int;
+var b: int;
+read a;
+b = 2147483647;
+print b + a;
+print b * (a + 1);
+print 3000000000;
+print 0 - 2147483647 - a - 1;
+print (0 - 7) / 2;
+return b + a + 255;
+"""
+
+# Float divisions by zero, of a read divisor (+0 or -0).
+FLOAT_DIVISION = """\
+var x: float;
+var z: float;
+read z;
+x = 1.5;
+print x / z;
+print (0.0 - x) / z;
+print z / z;
+print (z / z) / z;
+print (0.0 - z / z) / z;
+"""
+
+# Infinities and NaNs, from an overflow rather than a division.
+NON_FINITE = """\
+var x: float;
+var n: int;
+read x;
+n = 5;
+while n do
+  x = x * x;
+  n = n - 1;
+done
+print x;
+print 0.0 - x;
+print x - x;
+print x * 0.0;
+return x;
+"""
+
+# A float return value becomes the exit status like in C.
+FLOAT_RETURN = """\
+var x: float;
+read x;
+return x;
+"""
+
+INT_DIVISION_BY_ZERO = """\
+var a: int;
+read a;
+print 1;
+print 7 / a;
+"""
+
+FOREVER = """\
+var a: int;
+a = 1;
+while a do
+  a = a + 2;
+done
+"""
+
+
+class VMTest(unittest.TestCase):
+
+    def check(self, src, inputs=("",)):
+        """Check that the VM and the Python engine agree on src at every level."""
+        for stdin in inputs:
+            expected = run_vm(src, stdin, 0)
+            for opt_level in range(4):
+                self.assertEqual(run_vm(src, stdin, opt_level), expected,
+                                 "VM at -O%d on %r" % (opt_level, stdin))
+                self.assertEqual(run_py(src, stdin, opt_level), expected,
+                                 "py at -O%d on %r" % (opt_level, stdin))
+
+    def test_demos(self):
+        self.assertEqual(run_vm(demo("fib.mini")), (0, "55\n"))
+        self.assertEqual(run_vm(demo("conditional.mini")), (2, ""))
+        self.assertEqual(run_vm(demo("sqrt.mini"), "2\n"), (0, "1.414214\n2.000000\n"))
+        self.check(demo("fib.mini"))
+        self.check(demo("conditional.mini"))
+        self.check(demo("sqrt.mini"), ("2\n", "9\n", "0\n", "-1\n"))
+
+    def test_int_wraparound(self):
+        self.assertEqual(run_vm(INT_WRAP, "1\n"), (255, "-2147483648\n-2\n-1294967296\n"
+                                                       "2147483647\n-3\n"))
+        self.check(INT_WRAP, ("0\n", "1\n", "-1\n"))
+
+    def test_float_division_by_zero(self):
+        self.assertEqual(run_vm(FLOAT_DIVISION, "0\n")[1],
+                         "inf\n-inf\n-nan\n-nan\n-nan\n")
+        self.assertEqual(run_vm(FLOAT_DIVISION, "-0\n")[1],
+                         "-inf\ninf\n-nan\n-nan\n-nan\n")
+        self.check(FLOAT_DIVISION, ("0\n", "-0\n", "2\n"))
+
+    def test_non_finite_floats(self):
+        self.assertEqual(run_vm(NON_FINITE, "100\n"), (0, "inf\n-inf\n-nan\n-nan\n"))
+        self.check(NON_FINITE, ("100\n", "-100\n", "2\n"))
+
+    def test_float_return(self):
+        self.check(FLOAT_RETURN, ("3.7\n", "-1.5\n", "300.9\n", "1e10\n", "nan\n", "inf\n"))
+
+    def test_exit_status(self):
+        self.assertEqual(exit_status(300), 44)
+        self.assertEqual(exit_status(-1), 255)
+        self.assertEqual(exit_status(3.7), 3)
+        self.assertEqual(exit_status(-1.5), 255)
+        self.assertEqual(exit_status(float("nan")), 0)
+        self.assertEqual(exit_status(float("inf")), 0)
+        self.assertEqual(exit_status(2147483520.0), 128)
+
+    def test_int_division_by_zero(self):
+        self.assertEqual(run_vm(INT_DIVISION_BY_ZERO, "2\n"), (0, "1\n3\n"))
+        with self.assertRaises(ZeroDivisionError):
+            run_vm(INT_DIVISION_BY_ZERO, "0\n")
+        with self.assertRaises(ZeroDivisionError):
+            run_py(INT_DIVISION_BY_ZERO, "0\n")
+
+    def test_iteration_limit(self):
+        with self.assertRaises(IterationLimitError):
+            run_vm(FOREVER, max_iterations=1000)
+        self.assertEqual(run_vm(demo("fib.mini"), max_iterations=10), (0, "55\n"))
+        with self.assertRaises(IterationLimitError):
+            run_vm(demo("fib.mini"), max_iterations=9)
+
+
+@unittest.skipIf(CC is None, "no C compiler")
+class NativeTest(unittest.TestCase):
+    """The VM and the C code compiled by the C compiler give the same results."""
+
+    def check(self, src, inputs=("",), opt_levels=(0, 2, 3)):
+        for stdin in inputs:
+            expected = run_vm(src, stdin)
+            for opt_level in opt_levels:
+                self.assertEqual(run_native(src, stdin, opt_level), expected,
+                                 "C at -O%d on %r" % (opt_level, stdin))
+
+    def test_demos(self):
+        self.check(demo("fib.mini"))
+        self.check(demo("conditional.mini"))
+        self.check(demo("sqrt.mini"), ("2\n", "9\n"))
+
+    def test_int_wraparound(self):
+        self.check(INT_WRAP, ("0\n", "1\n", "-1\n"))
+
+    def test_float_division_by_zero(self):
+        self.check(FLOAT_DIVISION, ("0\n", "-0\n", "2\n"))
+
+    def test_non_finite_floats(self):
+        self.check(NON_FINITE, ("100\n", "-100\n"))
+
+    def test_float_return(self):
+        self.check(FLOAT_RETURN, ("3.7\n", "-1.5\n", "300.9\n", "1e10\n", "nan\n", "inf\n"),
+                   opt_levels=(2,))
+
+    def test_int_division_by_zero(self):
+        # The VM raises ZeroDivisionError where the program gets SIGFPE.
+        self.check(INT_DIVISION_BY_ZERO, ("2\n",))
+        status, stdout = run_native(INT_DIVISION_BY_ZERO, "0\n")
+        self.assertNotEqual(status, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
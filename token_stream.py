@@ -0,0 +1,44 @@
+from collections import deque
+
+from lexical_analyzer import TOKTYPE
+
+
+class TokenStream(object):
+    """
+    A cursor over a sequence of tokens.
+
+    The tokens may come from a list, as returned by lex(), or from a
+    lazy iterator, as returned by tokenize().  Tokens are pulled from
+    the source on demand into a small lookahead buffer, so peek() and
+    next() are O(1) no matter how many tokens have been consumed, and
+    only the lookahead window is ever held by the stream itself.
+    """
+
+    __slots__ = ("_it", "_buf")
+
+    def __init__(self, toks):
+        self._it = iter(toks)
+        self._buf = deque()
+
+    def peek(self, k=0):
+        """Return the k-th token ahead without consuming it, or None at the end."""
+        buf = self._buf
+        while len(buf) <= k:
+            t = next(self._it, None)
+            if t is None:
+                return None
+            buf.append(t)
+        return buf[k]
+
+    def peek_type(self, k=0):
+        """Return the type of the k-th token ahead, or None at the end."""
+        t = self.peek(k)
+        if t is None:
+            return None
+        return t[TOKTYPE]
+
+    def next(self):
+        """Consume and return the next token, or None at the end."""
+        if self._buf:
+            return self._buf.popleft()
+        return next(self._it, None)
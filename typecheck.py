@@ -1,12 +1,13 @@
 from AST_NODES import *
-from error import error
+from error import Diagnostics, error
 
 
 def typecheck(ast, symtab):
     """
-    Input : the AST of a mini program and its associated symbol table
-    Output: an AST of the mini program, but with extra type
-    information added inside expression nodes
+    Input : the AST of a mini program, resolved by build_symtab(), and
+            its associated symbol table
+    Output: the same AST, with the type of every expression node
+    filled in (the tree is annotated in place, not copied)
 
     The typing rules of our small language are pretty simple:
 
@@ -17,48 +18,85 @@ def typecheck(ast, symtab):
       language does not support conversions)
     - The two operands of an arithmetic operations must be of the same type
     - An expression can be assigned to a variable only if their types are equal
+
+    Checking goes on after an error: every statement is checked up to
+    its first error, and all the errors are reported together in one
+    CompileError.
     """
+    types = symtab.types
+    diagnostics = Diagnostics()
 
     def check_stmt(stmt):
-        if stmt["nodetype"] == AST_PRINT:
-            typed_expr = check_expr(stmt["expr"])
-            return astnode(AST_PRINT, expr=typed_expr)
-        elif stmt["nodetype"] == AST_RETURN:
-            typed_expr = check_expr(stmt["expr"])
-            return astnode(AST_RETURN, expr=typed_expr)
-        elif stmt["nodetype"] == AST_READ:
-            return astnode(AST_READ, id=stmt["id"])
-        elif stmt["nodetype"] == AST_ASSIGN:
-            typed_rhs = check_expr(stmt["rhs"])
-            if typed_rhs["type"] == symtab[stmt["lhs"]]:
-                return astnode(AST_ASSIGN, lhs=stmt["lhs"], rhs=typed_rhs)
-            else:
-                error("expected %s, got %s" % (symtab[stmt["lhs"]], typed_rhs["type"]))
-        elif stmt["nodetype"] == AST_WHILE:
-            typed_expr = check_expr(stmt["expr"])
-            if typed_expr["type"] != "int":
-                error("loop condition must be an int")
-            typed_body = [check_stmt(body_stmt) for body_stmt in stmt["body"]]
-            return astnode(AST_WHILE, expr=typed_expr, body=typed_body)
+        if stmt.nodetype == AST_PRINT:
+            check_expr(stmt.expr)
+        elif stmt.nodetype == AST_RETURN:
+            check_expr(stmt.expr)
+        elif stmt.nodetype == AST_READ:
+            pass
+        elif stmt.nodetype == AST_ASSIGN:
+            rhs_type = check_expr(stmt.rhs)
+            if rhs_type != types[stmt.slot]:
+                error("expected %s, got %s" % (types[stmt.slot], rhs_type))
+        elif stmt.nodetype == AST_WHILE:
+            with diagnostics:
+                if check_expr(stmt.expr) != "int":
+                    error("loop condition must be an int")
+            for body_stmt in stmt.body:
+                with diagnostics:
+                    check_stmt(body_stmt)
+
+    def check_leaf(expr):
+        nodetype = expr.nodetype
+        if nodetype == AST_INT:
+            expr.type = "int"
+        elif nodetype == AST_FLOAT:
+            expr.type = "float"
+        elif nodetype == AST_ID:
+            expr.type = types[expr.slot]
 
     def check_expr(expr):
-        if expr["nodetype"] == AST_INT:
-            return astnode(AST_INT, value=expr["value"], type="int")
-        elif expr["nodetype"] == AST_FLOAT:
-            return astnode(AST_FLOAT, value=expr["value"], type="float")
-        elif expr["nodetype"] == AST_ID:
-            if expr["name"] not in symtab:
-                error("undeclared variable: %s" % expr["name"])
-            return astnode(AST_ID, name=expr["name"], type=symtab[expr["name"]])
-        elif expr["nodetype"] == AST_BINOP:
-            typed_e1 = check_expr(expr["lhs"])
-            typed_e2 = check_expr(expr["rhs"])
-            if typed_e1["type"] == typed_e2["type"]:
-                return astnode(AST_BINOP, op=expr["op"], lhs=typed_e1, rhs=typed_e2, type=typed_e1["type"])
+        """
+        Fill in the type of expr and its subexpressions, and return it.
+
+        The tree is walked in post-order with an explicit stack, so
+        expressions of any depth can be checked.  Only BinOps go through
+        the stack; the other operands are checked on the way, in the
+        same order as a recursive walk would (which decides the error
+        that is reported first).
+        """
+        if expr.nodetype != AST_BINOP:
+            check_leaf(expr)
+            return expr.type
+        # None on the stack marks that the operands of the BinOp below
+        # it were checked.
+        stack = [expr]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            e = pop()
+            if e is None:
+                e = pop()
+                rhs = e.rhs
+                if rhs.nodetype != AST_BINOP:
+                    check_leaf(rhs)
+                if e.lhs.type == rhs.type:
+                    e.type = rhs.type
+                else:
+                    error("operands must have the same type")
             else:
-                error("operands must have the same type")
+                push(e)
+                push(None)
+                if e.rhs.nodetype == AST_BINOP:
+                    push(e.rhs)
+                lhs = e.lhs
+                if lhs.nodetype == AST_BINOP:
+                    push(lhs)
+                else:
+                    check_leaf(lhs)
+        return expr.type
 
-    updated_stmts = []
-    for stmt in ast["stmts"]:
-        updated_stmts.append(check_stmt(stmt))
-    return {"decls": ast["decls"], "stmts": updated_stmts}
+    for stmt in ast.stmts:
+        with diagnostics:
+            check_stmt(stmt)
+    diagnostics.check()
+    return ast
@@ -0,0 +1,165 @@
+from AST_NODES import *
+from error import error
+from optimize import wrap_int
+from tac_gen import to_float32
+from vm import format_float
+
+
+class LaneResults(object):
+    """
+    The results of running a program on many lanes at once.
+
+    - returns : the value returned by every lane (0 if it did not
+                return), as an int32 array
+    - errors  : a boolean array, true for the lanes stopped by an int
+                division by zero
+    - prints  : the print statements executed, in order, as (type, mask,
+                values) triples: the lanes that printed, and the values
+                printed (a scalar or one value per lane)
+    """
+
+    __slots__ = ("returns", "errors", "prints")
+
+    def __init__(self, returns, errors, prints):
+        self.returns = returns
+        self.errors = errors
+        self.prints = prints
+
+    def output(self, lane):
+        """Return the lines printed by one lane, formatted like printf."""
+        lines = []
+        for ty, mask, values in self.prints:
+            if mask[lane]:
+                value = values if values.ndim == 0 else values[lane]
+                lines.append("%d" % value if ty == "int" else format_float(float(value)))
+        return lines
+
+
+def run_lanes(ast, symtab, inputs):
+    """
+    Input : the typed AST and symbol table of a mini program, and the
+            inputs of every lane: a 2-D array (or a list of sequences,
+            which may have different lengths) whose row k holds the
+            numbers read by lane k, in order
+    Output: a LaneResults
+
+    Runs the program once per lane, all lanes at once, with NumPy.
+    Every variable is an array with one element per lane, of int32 or
+    float32 like the variables of the C program, so the arithmetic
+    wraps and rounds exactly like it.  Statements are executed under a
+    mask of the lanes that reach them: a while loop runs until its
+    condition is false in every lane that entered it, and a lane that
+    returns or divides an int by zero drops out of every mask.  A read
+    past the end of the inputs of a lane leaves the variable unchanged,
+    like scanf at the end of its input.
+
+    NumPy is only needed by this function.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        error("running lanes needs NumPy")
+
+    if isinstance(inputs, np.ndarray) and inputs.ndim == 2:
+        table = inputs
+        counts = np.full(len(inputs), inputs.shape[1])
+    else:
+        counts = np.array([len(row) for row in inputs], dtype=np.int64)
+        table = np.zeros((len(inputs), max(counts.max(initial=0), 1)))
+        for k, row in enumerate(inputs):
+            table[k, :len(row)] = row
+    nlanes = len(table)
+    dtypes = {"int": np.int32, "float": np.float32}
+
+    # The variables, by slot.
+    env = [np.zeros(nlanes, dtype=dtypes[ty]) for ty in symtab.types]
+    alive = np.ones(nlanes, dtype=bool)
+    errors = np.zeros(nlanes, dtype=bool)
+    returns = np.zeros(nlanes, dtype=np.int32)
+    position = np.zeros(nlanes, dtype=np.int64)
+    prints = []
+
+    def leaf(expr):
+        if expr.nodetype == AST_ID:
+            return env[expr.slot]
+        elif expr.type == "int":
+            return np.int32(wrap_int(expr.value))
+        return np.float32(to_float32(expr.value))
+
+    def binop(e, a, b, mask):
+        op = e.op
+        if op == "+":
+            return a + b
+        elif op == "-":
+            return a - b
+        elif op == "*":
+            return a * b
+        elif op == "<":
+            # The type of a comparison is that of its operands, like
+            # the temporary that holds it in the C code.
+            return (a < b).astype(dtypes[e.type])
+        elif op == ">":
+            return (a > b).astype(dtypes[e.type])
+        elif e.type == "float":
+            return a / b
+        # C truncates towards zero; a - fmod(a, b) is a multiple of b.
+        zero = (b == 0) & mask
+        if zero.any():
+            errors[zero] = True
+            alive[zero] = False
+        return (a - np.fmod(a, b)) // np.where(b == 0, 1, b)
+
+    def eval_expr(expr, mask):
+        """Evaluate expr on every lane (walking the tree with a stack)."""
+        if expr.nodetype != AST_BINOP:
+            return leaf(expr)
+        values = []
+        stack = [expr]
+        while stack:
+            e = stack.pop()
+            if e is None:
+                e = stack.pop()
+                b = values.pop() if e.rhs.nodetype == AST_BINOP else leaf(e.rhs)
+                a = values.pop() if e.lhs.nodetype == AST_BINOP else leaf(e.lhs)
+                values.append(binop(e, a, b, mask))
+            else:
+                stack.append(e)
+                stack.append(None)
+                if e.rhs.nodetype == AST_BINOP:
+                    stack.append(e.rhs)
+                if e.lhs.nodetype == AST_BINOP:
+                    stack.append(e.lhs)
+        return np.asarray(values[0])
+
+    def exec_stmts(stmts, mask):
+        for stmt in stmts:
+            mask = mask & alive
+            if not mask.any():
+                return
+            nodetype = stmt.nodetype
+            if nodetype == AST_ASSIGN:
+                value = eval_expr(stmt.rhs, mask)
+                np.copyto(env[stmt.slot], value, where=mask & alive)
+            elif nodetype == AST_PRINT:
+                value = eval_expr(stmt.expr, mask)
+                prints.append((stmt.expr.type, mask & alive, value.copy()))
+            elif nodetype == AST_RETURN:
+                value = eval_expr(stmt.expr, mask)
+                mask = mask & alive
+                np.copyto(returns, value, where=mask, casting="unsafe")
+                alive[mask] = False
+            elif nodetype == AST_READ:
+                var = env[stmt.slot]
+                readers = np.nonzero(mask & (position < counts))[0]
+                var[readers] = table[readers, position[readers]].astype(var.dtype)
+                position[readers] += 1
+            elif nodetype == AST_WHILE:
+                running = mask & (eval_expr(stmt.expr, mask) != 0)
+                while running.any():
+                    exec_stmts(stmt.body, running)
+                    running = running & alive
+                    running &= eval_expr(stmt.expr, running) != 0
+
+    with np.errstate(all="ignore"):
+        exec_stmts(ast.stmts, alive.copy())
+    return LaneResults(returns, errors, prints)
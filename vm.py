@@ -0,0 +1,380 @@
+import math
+import re
+import sys
+from array import array
+
+from AST_NODES import *
+from optimize import wrap_int
+
+
+# Every instruction is four machine words wide: an opcode and three
+# operands (register numbers, or an instruction index for jumps).
+# Opcodes are typed: I* opcodes work on the int register file, F*
+# opcodes on the float register file.
+(OP_HALT, OP_RET_I, OP_RET_F,
+ OP_MOV_I, OP_MOV_F,
+ OP_ADD_I, OP_SUB_I, OP_MUL_I, OP_DIV_I, OP_LT_I, OP_GT_I,
+ OP_ADD_F, OP_SUB_F, OP_MUL_F, OP_DIV_F, OP_LT_F, OP_GT_F,
+ OP_JZ, OP_JMP,
+ OP_PRINT_I, OP_PRINT_F, OP_READ_I, OP_READ_F) = range(23)
+
+INSN_WIDTH = 4
+
+BINOPS = {
+    ("int", "+"): OP_ADD_I, ("int", "-"): OP_SUB_I,
+    ("int", "*"): OP_MUL_I, ("int", "/"): OP_DIV_I,
+    ("int", "<"): OP_LT_I, ("int", ">"): OP_GT_I,
+    ("float", "+"): OP_ADD_F, ("float", "-"): OP_SUB_F,
+    ("float", "*"): OP_MUL_F, ("float", "/"): OP_DIV_F,
+    ("float", "<"): OP_LT_F, ("float", ">"): OP_GT_F,
+}
+
+
+class Bytecode(object):
+    """
+    A mini program lowered to register bytecode.
+
+    - code    : array of instructions, INSN_WIDTH words each
+    - iconsts : initial contents of the int register file
+    - fconsts : initial contents of the float register file
+    - slots   : maps every variable name to its (type, register)
+
+    Variables occupy the first registers of the file of their type,
+    then come the registers holding the constants of the program (which
+    are loaded once, when the register files are created), then the
+    temporaries.
+    """
+
+    __slots__ = ("code", "iconsts", "fconsts", "slots")
+
+    def __init__(self, code, iconsts, fconsts, slots):
+        self.code = code
+        self.iconsts = iconsts
+        self.fconsts = fconsts
+        self.slots = slots
+
+
+def compile_bytecode(ast, symtab):
+    """
+    Input : the typed AST and symbol table of a mini program
+    Output: a Bytecode object
+
+    Expressions are evaluated into temporary registers that are
+    released as soon as the statement that needed them is done, so the
+    register files stay as small as the deepest expression requires.
+    """
+    code = array("i")
+    slots = {}
+    nregs = {"int": 0, "float": 0}
+    # The register of the variable of every slot of the symbol table.
+    var_regs = []
+    for name, ty in zip(symtab.names, symtab.types):
+        slots[name] = (ty, nregs[ty])
+        var_regs.append(nregs[ty])
+        nregs[ty] += 1
+
+    consts = {"int": {}, "float": {}}
+    for ty in ("int", "float"):
+        collect_consts(ast.stmts, ty, consts[ty], nregs)
+
+    # Temporaries are allocated on top of variables and constants.
+    base = dict(nregs)
+    next_temp = dict(nregs)
+
+    def emit(op, a=0, b=0, c=0):
+        code.extend((op, a, b, c))
+
+    def new_temp(ty):
+        reg = next_temp[ty]
+        next_temp[ty] += 1
+        if next_temp[ty] > nregs[ty]:
+            nregs[ty] = next_temp[ty]
+        return reg
+
+    def gen_stmt(stmt):
+        if stmt.nodetype == AST_ASSIGN:
+            gen_expr(stmt.rhs, var_regs[stmt.slot])
+        elif stmt.nodetype == AST_PRINT:
+            reg = gen_expr(stmt.expr)
+            emit(OP_PRINT_I if stmt.expr.type == "int" else OP_PRINT_F, reg)
+        elif stmt.nodetype == AST_RETURN:
+            reg = gen_expr(stmt.expr)
+            emit(OP_RET_I if stmt.expr.type == "int" else OP_RET_F, reg)
+        elif stmt.nodetype == AST_READ:
+            emit(OP_READ_I if symtab.types[stmt.slot] == "int" else OP_READ_F,
+                 var_regs[stmt.slot])
+        elif stmt.nodetype == AST_WHILE:
+            head = len(code) // INSN_WIDTH
+            reg = gen_expr(stmt.expr)
+            jump = len(code)
+            emit(OP_JZ, reg)
+            for body_stmt in stmt.body:
+                gen_stmt(body_stmt)
+            emit(OP_JMP, head)
+            code[jump + 3] = len(code) // INSN_WIDTH
+        next_temp.update(base)
+
+    def leaf_reg(expr):
+        if expr.nodetype == AST_ID:
+            return var_regs[expr.slot]
+        return consts[expr.type][expr.value]
+
+    def gen_expr(expr, dest=None):
+        """
+        Emit the code for expr and return the register holding its
+        value.  The tree is walked in post-order with an explicit stack,
+        so expressions of any depth can be compiled.
+        """
+        if expr.nodetype != AST_BINOP:
+            reg = leaf_reg(expr)
+            if dest is not None and dest != reg:
+                emit(OP_MOV_I if expr.type == "int" else OP_MOV_F, dest, reg)
+                return dest
+            return reg
+        regs = []
+        # None on the stack marks that the operands of the BinOp below
+        # it were computed.
+        stack = [expr]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            e = pop()
+            if e is None:
+                e = pop()
+                lhs, rhs = e.lhs, e.rhs
+                rhs_reg = regs.pop() if rhs.nodetype == AST_BINOP else leaf_reg(rhs)
+                lhs_reg = regs.pop() if lhs.nodetype == AST_BINOP else leaf_reg(lhs)
+                if e is expr and dest is not None:
+                    reg = dest
+                else:
+                    reg = new_temp(e.type)
+                emit(BINOPS[e.type, e.op], reg, lhs_reg, rhs_reg)
+                regs.append(reg)
+            else:
+                push(e)
+                push(None)
+                if e.rhs.nodetype == AST_BINOP:
+                    push(e.rhs)
+                if e.lhs.nodetype == AST_BINOP:
+                    push(e.lhs)
+        return regs[0]
+
+    for stmt in ast.stmts:
+        gen_stmt(stmt)
+    emit(OP_HALT)
+
+    iconsts = [0] * nregs["int"]
+    for value, reg in consts["int"].items():
+        iconsts[reg] = wrap_int(value)
+    fconsts = array("f", [0.0] * nregs["float"])
+    for value, reg in consts["float"].items():
+        fconsts[reg] = value
+    return Bytecode(code, iconsts, fconsts, slots)
+
+
+def collect_consts(stmts, ty, table, nregs):
+    """Give a register to every distinct literal of type ty in stmts."""
+    for stmt in stmts:
+        if stmt.nodetype == AST_ASSIGN:
+            exprs = [stmt.rhs]
+        elif stmt.nodetype in (AST_PRINT, AST_RETURN):
+            exprs = [stmt.expr]
+        elif stmt.nodetype == AST_WHILE:
+            exprs = [stmt.expr]
+            collect_consts(stmt.body, ty, table, nregs)
+        else:
+            exprs = []
+        while exprs:
+            expr = exprs.pop()
+            if expr.nodetype == AST_BINOP:
+                exprs.append(expr.lhs)
+                exprs.append(expr.rhs)
+            elif expr.nodetype in (AST_INT, AST_FLOAT) and expr.type == ty:
+                if expr.value not in table:
+                    table[expr.value] = nregs[ty]
+                    nregs[ty] += 1
+
+
+_INT_RE = re.compile(r"\s*([+-]?\d+)")
+_FLOAT_RE = re.compile(
+    r"\s*([+-]?(?:\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|inf(?:inity)?|nan))",
+    re.IGNORECASE)
+
+
+class ScanfReader(object):
+    """
+    Reads numbers from a file the way scanf("%d") and scanf("%f") do:
+    leading whitespace is skipped, the longest prefix that looks like a
+    number is consumed, and the rest of the input is left for the next
+    read.  When no number can be read, None is returned and the input
+    is not consumed, so the variable keeps its value like in C.
+    """
+
+    __slots__ = ("infile", "buf")
+
+    def __init__(self, infile):
+        self.infile = infile
+        self.buf = ""
+
+    def read(self, regex, convert):
+        while not self.buf.strip():
+            line = self.infile.readline()
+            if not line:
+                return None
+            self.buf = line
+        m = regex.match(self.buf)
+        if m is None:
+            return None
+        self.buf = self.buf[m.end():]
+        return convert(m.group(1))
+
+    def read_int(self):
+        return self.read(_INT_RE, int)
+
+    def read_float(self):
+        return self.read(_FLOAT_RE, float)
+
+
+def format_float(x):
+    """Return x formatted like printf("%f") of glibc."""
+    if x != x:
+        # glibc's printf shows the sign of a NaN.
+        return "-nan" if math.copysign(1.0, x) < 0 else "nan"
+    return "%f" % x
+
+
+def divide_by_zero(a, b):
+    """
+    Return the C float a / b, for a divisor b that is zero: an infinity
+    whose sign is that of a times that of the zero, or, if a is zero or
+    a NaN, the NaN that x86 gives, whose sign bit is set (printf shows
+    it as -nan).
+    """
+    if a == 0.0:
+        return -math.nan
+    if a != a:
+        return a
+    if (a < 0) != (math.copysign(1.0, b) < 0):
+        return float("-inf")
+    return float("inf")
+
+
+def exit_status(value):
+    """
+    Return the exit status of a program whose return statement gave
+    value, like the int main() of the C code: a float is truncated to
+    an int like x86 does (to INT_MIN for a NaN, or for a value out of
+    the range of int), and the system keeps the low 8 bits.
+    """
+    if isinstance(value, float):
+        if value != value or not -2147483649.0 < value < 2147483648.0:
+            value = -0x80000000
+        else:
+            value = int(value)
+    return value & 0xFF
+
+
+class IterationLimitError(Exception):
+    """Raised by run() when a program loops more times than it is allowed."""
+
+
+def run(bytecode, infile=None, outfile=None, max_iterations=None):
+    """
+    Input : a Bytecode object, the files standing for the stdin and
+            stdout of the program (sys.stdin and sys.stdout by default),
+            and optionally the number of loop iterations the program
+            may run, all its loops together
+    Output: the value of the program's return statement, or 0
+
+    Int registers live in a list and hold C-like ints: the literals and
+    the results of the arithmetic wrap around to 32 bits like the int
+    variables of the generated C code (and like the constants folded by
+    optimize.py).  A float division by zero gives the infinity or NaN
+    of C (see divide_by_zero, which pygen.py shares).
+    Float registers live in an array of C floats, so every store rounds
+    to single precision just like the float variables of the C code.
+    An int division by zero raises ZeroDivisionError, and going past
+    max_iterations raises IterationLimitError.  Every iteration of a
+    loop ends with its OP_JMP back to the test, so only those count:
+    code without loops always runs to the end.
+    """
+    code = bytecode.code.tolist()
+    ri = list(bytecode.iconsts)
+    rf = array("f", bytecode.fconsts)
+    reader = ScanfReader(infile or sys.stdin)
+    write = (outfile or sys.stdout).write
+    # Counts down to 0 at the iteration after the last one allowed, and
+    # never gets to 0 without a limit.
+    iterations_left = -1 if max_iterations is None else max_iterations + 1
+    pc = 0
+    while True:
+        op = code[pc]
+        a = code[pc + 1]
+        b = code[pc + 2]
+        c = code[pc + 3]
+        pc += 4
+        if op == OP_MOV_I:
+            ri[a] = ri[b]
+        elif op == OP_ADD_I:
+            ri[a] = ((ri[b] + ri[c] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        elif op == OP_SUB_I:
+            ri[a] = ((ri[b] - ri[c] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        elif op == OP_JZ:
+            if ri[a] == 0:
+                pc = c * 4
+        elif op == OP_JMP:
+            pc = a * 4
+            iterations_left -= 1
+            if not iterations_left:
+                raise IterationLimitError(
+                    "the program ran more than %d loop iterations" % max_iterations)
+        elif op == OP_MUL_I:
+            ri[a] = ((ri[b] * ri[c] + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        elif op == OP_DIV_I:
+            x, y = ri[b], ri[c]
+            if y == 0:
+                raise ZeroDivisionError("division by zero")
+            # C truncates towards zero, Python floors.
+            q = abs(x) // abs(y)
+            q = q if (x < 0) == (y < 0) else -q
+            ri[a] = ((q + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+        elif op == OP_LT_I:
+            ri[a] = 1 if ri[b] < ri[c] else 0
+        elif op == OP_GT_I:
+            ri[a] = 1 if ri[b] > ri[c] else 0
+        elif op == OP_MOV_F:
+            rf[a] = rf[b]
+        elif op == OP_ADD_F:
+            rf[a] = rf[b] + rf[c]
+        elif op == OP_SUB_F:
+            rf[a] = rf[b] - rf[c]
+        elif op == OP_MUL_F:
+            rf[a] = rf[b] * rf[c]
+        elif op == OP_DIV_F:
+            y = rf[c]
+            if y == 0.0:
+                rf[a] = divide_by_zero(rf[b], y)
+            else:
+                rf[a] = rf[b] / y
+        elif op == OP_LT_F:
+            rf[a] = 1.0 if rf[b] < rf[c] else 0.0
+        elif op == OP_GT_F:
+            rf[a] = 1.0 if rf[b] > rf[c] else 0.0
+        elif op == OP_PRINT_I:
+            write("%d\n" % ri[a])
+        elif op == OP_PRINT_F:
+            write(format_float(rf[a]) + "\n")
+        elif op == OP_READ_I:
+            value = reader.read_int()
+            if value is not None:
+                ri[a] = value
+        elif op == OP_READ_F:
+            value = reader.read_float()
+            if value is not None:
+                rf[a] = value
+        elif op == OP_RET_I:
+            return ri[a]
+        elif op == OP_RET_F:
+            return rf[a]
+        elif op == OP_HALT:
+            return 0
@@ -0,0 +1,94 @@
+import random
+
+
+def generate(decls=100, stmts=1000, loop_depth=2, expr_length=4, expr_depth=1, seed=0):
+    """
+    Input : the shape of a program, and the seed of the random choices
+    Output: the source of a valid mini program of that shape
+
+    - decls: the number of variables, half of them int and half float
+      (the counters of the loops are declared on top of them)
+    - stmts: the number of assignments and prints
+    - loop_depth: the deepest nesting of while loops; every loop runs
+      at most twice, so the programs can also be run
+    - expr_length: the number of operands of the expression of an
+      assignment, joined by + - * and divisions by constants
+    - expr_depth: the nesting depth of the parenthesized expression
+      that is the first operand of every assignment
+
+    The same arguments always generate the same program.  Nothing is
+    built recursively, so any depth can be asked for.
+    """
+    r = random.Random(seed)
+    ivars = ["i%d" % k for k in range(max(1, decls // 2))]
+    fvars = ["f%d" % k for k in range(max(1, decls - len(ivars)))]
+    counters = []
+    lines = []
+
+    def operand(ty):
+        if r.random() < 0.7:
+            return r.choice(ivars if ty == "int" else fvars)
+        if ty == "int":
+            return str(r.randint(0, 99))
+        return "%d.%d" % (r.randint(0, 99), r.randint(0, 9))
+
+    def divisor(ty):
+        if ty == "int":
+            return str(r.randint(1, 9))
+        return "%d.5" % r.randint(0, 9)
+
+    def expr(ty):
+        e = operand(ty)
+        for _ in range(expr_depth - 1):
+            op = r.choice("+-*")
+            if r.random() < 0.5:
+                e = "(%s %s %s)" % (e, op, operand(ty))
+            else:
+                e = "(%s %s %s)" % (operand(ty), op, e)
+        parts = [e]
+        for _ in range(expr_length - 1):
+            op = r.choice("+-*/")
+            parts.append(op)
+            parts.append(divisor(ty) if op == "/" else operand(ty))
+        return " ".join(parts)
+
+    def stmt(indent):
+        ty = r.choice(("int", "float"))
+        if r.random() < 0.8:
+            var = r.choice(ivars if ty == "int" else fvars)
+            lines.append("%s%s = %s;" % (indent, var, expr(ty)))
+        else:
+            lines.append("%sprint %s;" % (indent, expr(ty)))
+
+    for v in ivars:
+        lines.append("%s = %d;" % (v, r.randint(0, 9)))
+    for v in fvars:
+        lines.append("%s = %d.25;" % (v, r.randint(0, 9)))
+
+    # Statements are laid out in nests of loops of random depth, the
+    # first one being as deep as asked for.
+    left = stmts
+    depth = loop_depth
+    while left > 0:
+        body = min(left, r.randint(1, 8))
+        left -= body
+        opened = []
+        for level in range(depth):
+            c = "c%d" % len(counters)
+            counters.append(c)
+            opened.append(c)
+            indent = "  " * level
+            lines.append("%s%s = %d;" % (indent, c, r.randint(1, 2)))
+            lines.append("%swhile %s do" % (indent, c))
+        for _ in range(body):
+            stmt("  " * depth)
+        for level in reversed(range(depth)):
+            indent = "  " * level
+            c = opened[level]
+            lines.append("%s  %s = %s - 1;" % (indent, c, c))
+            lines.append("%sdone" % indent)
+        depth = r.randint(0, loop_depth)
+
+    header = ["var %s: int;" % v for v in ivars + counters]
+    header.extend("var %s: float;" % v for v in fvars)
+    return "\n".join(header + lines) + "\n"